@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict, deque
+
+from transaction_store import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Repeats of the same (user, rule, merchant) within this window are coalesced
+SUPPRESSION_WINDOW_SECONDS = 3600
+
+# Per-user token bucket: burst capacity and sustained alerts per hour
+RATE_LIMIT_CAPACITY = 5
+RATE_LIMIT_PER_HOUR = 10
+
+# How many recently seen alert ids to remember for exact-duplicate suppression
+DEDUP_CACHE_SIZE = 10000
+
+# Alerts kept per open window and per user held back by the rate limiter;
+# older ones are dropped and only counted in the digest
+MAX_SUPPRESSED_PER_WINDOW = 100
+MAX_HELD_BACK_PER_USER = 100
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2}
+
+
+def make_alert_id(user_id, rule_id, *parts):
+    """Deterministic alert id, so recomputing the same alert yields the same id"""
+    key = "|".join([str(user_id), str(rule_id)] + [str(part) for part in parts])
+    return "alert_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class TokenBucket:
+    """Classic token bucket; take() returns False once the burst budget is spent"""
+
+    __slots__ = ("capacity", "refill_per_second", "tokens", "updated_at")
+
+    def __init__(self, capacity, refill_per_second, now):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated_at = now
+
+    def take(self, now):
+        elapsed = max(now - self.updated_at, 0)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def _alert_count(alert):
+    # A digest stands for every alert merged into it
+    return alert.get("count", 1)
+
+
+class _Backlog:
+    """Bounded list of alerts awaiting a digest, counting the ones it had to drop"""
+
+    __slots__ = ("alerts", "dropped")
+
+    def __init__(self, limit, alerts=(), dropped=0):
+        self.alerts = deque(alerts, maxlen=limit)
+        self.dropped = dropped
+
+    def add(self, alert):
+        if len(self.alerts) == self.alerts.maxlen:
+            self.dropped += _alert_count(self.alerts[0])
+        self.alerts.append(alert)
+
+    def __len__(self):
+        return len(self.alerts)
+
+
+class _Window:
+    __slots__ = ("started_at", "suppressed")
+
+    def __init__(self, started_at, suppressed=None):
+        self.started_at = started_at
+        self.suppressed = _Backlog(MAX_SUPPRESSED_PER_WINDOW) if suppressed is None else suppressed
+
+
+class AlertPipeline:
+    """Dedups, coalesces and rate-limits alerts before they are fanned out.
+
+    `submit()` returns the alerts that should be delivered right away; alerts
+    held back by the suppression window or the rate limiter are merged into
+    digest alerts that `flush()` releases once their window closes.
+    """
+
+    def __init__(self, window_seconds=SUPPRESSION_WINDOW_SECONDS,
+                 rate_capacity=RATE_LIMIT_CAPACITY, rate_per_hour=RATE_LIMIT_PER_HOUR,
+                 clock=time.time):
+        self.window_seconds = window_seconds
+        self.rate_capacity = rate_capacity
+        self.rate_per_second = rate_per_hour / 3600.0
+        self._clock = clock
+        self._seen_ids = OrderedDict()
+        self._windows = {}
+        self._buckets = {}
+        self._held_back = {}
+        self.stats = {"submitted": 0, "emitted": 0, "duplicates": 0, "coalesced": 0,
+                      "rate_limited": 0, "digests": 0}
+        # Bumped whenever the state to_state() captures may have changed
+        self.version = 0
+
+    @property
+    def open_windows(self):
+        return len(self._windows)
+
+    @property
+    def held_back(self):
+        return sum(len(alerts) for alerts in self._held_back.values())
+
+    def submit(self, alert, now=None):
+        """Process one raw alert and return the list of alerts to fan out now"""
+        now = self._clock() if now is None else now
+        self.stats["submitted"] += 1
+        self.version += 1
+
+        user_id = alert.get("user_id")
+        rule_id = alert.get("rule_id") or alert.get("alert_type", "anomaly")
+        merchant = alert.get("merchant_name", "")
+        alert = dict(alert, rule_id=rule_id)
+        alert.setdefault("alert_id", make_alert_id(user_id, rule_id, alert.get("transaction_id")))
+
+        if self._remember(alert["alert_id"]):
+            self.stats["duplicates"] += 1
+            return []
+
+        outgoing = []
+        key = (user_id, rule_id, merchant)
+        window = self._windows.get(key)
+        if window is not None and now - window.started_at >= self.window_seconds:
+            outgoing.extend(self._close_window(key, window, now))
+            window = None
+
+        if window is not None:
+            window.suppressed.add(alert)
+            self.stats["coalesced"] += 1
+            return outgoing
+
+        self._windows[key] = _Window(now)
+        outgoing.extend(self._rate_limited(user_id, [alert], now))
+        return outgoing
+
+    def flush(self, now=None):
+        """Release digests for closed windows and alerts held back by the rate limiter"""
+        now = self._clock() if now is None else now
+        outgoing = []
+        windows = len(self._windows)
+        for key, window in list(self._windows.items()):
+            if now - window.started_at >= self.window_seconds:
+                outgoing.extend(self._close_window(key, window, now))
+
+        for user_id in list(self._held_back):
+            held = self._held_back[user_id]
+            if self._bucket(user_id, now).take(now):
+                del self._held_back[user_id]
+                outgoing.append(self._digest(user_id, "rate_limited", None, held, now))
+                self.stats["emitted"] += 1
+        if outgoing or len(self._windows) != windows:
+            self.version += 1
+        return outgoing
+
+    def to_state(self):
+        """Plain-data snapshot of the dedup cache, open windows, buckets and held-back alerts"""
+        return {
+            "seen_ids": list(self._seen_ids),
+            "windows": [
+                {"key": list(key), "started_at": window.started_at,
+                 "suppressed": list(window.suppressed.alerts), "dropped": window.suppressed.dropped}
+                for key, window in self._windows.items()
+            ],
+            # Pairs rather than objects: user ids need not be strings
+            "buckets": [[user_id, bucket.tokens, bucket.updated_at] for user_id, bucket in self._buckets.items()],
+            "held_back": [[user_id, list(held.alerts), held.dropped] for user_id, held in self._held_back.items()],
+            "stats": self.stats
+        }
+
+    def restore_state(self, state):
+        self._seen_ids = OrderedDict.fromkeys(state["seen_ids"], True)
+        self._windows = {}
+        for entry in state["windows"]:
+            self._windows[tuple(entry["key"])] = _Window(
+                entry["started_at"], _Backlog(MAX_SUPPRESSED_PER_WINDOW, entry["suppressed"], entry["dropped"]))
+        self._buckets = {}
+        for user_id, tokens, updated_at in state["buckets"]:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate_capacity, self.rate_per_second, updated_at)
+            bucket.tokens = tokens
+        self._held_back = {user_id: _Backlog(MAX_HELD_BACK_PER_USER, alerts, dropped)
+                           for user_id, alerts, dropped in state["held_back"]}
+        self.stats = dict(state["stats"])
+        self.version += 1
+
+    def _remember(self, alert_id):
+        # Returns True if the id was already seen
+        if alert_id in self._seen_ids:
+            self._seen_ids.move_to_end(alert_id)
+            return True
+        self._seen_ids[alert_id] = True
+        if len(self._seen_ids) > DEDUP_CACHE_SIZE:
+            self._seen_ids.popitem(last=False)
+        return False
+
+    def _close_window(self, key, window, now):
+        del self._windows[key]
+        if not window.suppressed:
+            return []
+        user_id, rule_id, merchant = key
+        digest = self._digest(user_id, rule_id, merchant, window.suppressed, now)
+        return self._rate_limited(user_id, [digest], now)
+
+    def _rate_limited(self, user_id, alerts, now):
+        bucket = self._bucket(user_id, now)
+        outgoing = []
+        for alert in alerts:
+            if bucket.take(now):
+                outgoing.append(alert)
+            else:
+                self.stats["rate_limited"] += 1
+                held = self._held_back.get(user_id)
+                if held is None:
+                    held = self._held_back[user_id] = _Backlog(MAX_HELD_BACK_PER_USER)
+                held.add(alert)
+        self.stats["emitted"] += len(outgoing)
+        return outgoing
+
+    def _bucket(self, user_id, now):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate_capacity, self.rate_per_second, now)
+        return bucket
+
+    def _digest(self, user_id, rule_id, merchant, backlog, now):
+        self.stats["digests"] += 1
+        alerts = backlog.alerts
+        transaction_ids = []
+        for alert in alerts:
+            transaction_ids.extend(alert.get("transaction_ids") or [alert.get("transaction_id")])
+        # Dropped alerts are counted but their transaction ids are gone
+        count = sum(_alert_count(alert) for alert in alerts) + backlog.dropped
+        if merchant:
+            message = f"{count} more {rule_id.replace('_', ' ')} alerts for {merchant} were grouped together"
+        else:
+            message = f"{count} alerts were held back to avoid flooding your notifications"
+        # The id depends only on what was merged, so it is stable across recomputation
+        return {
+            "alert_id": make_alert_id(user_id, "digest", rule_id, merchant, *transaction_ids),
+            "user_id": user_id,
+            "rule_id": rule_id,
+            "alert_type": "digest",
+            "merchant_name": merchant,
+            "transaction_ids": transaction_ids,
+            "count": count,
+            "message": message,
+            "severity": max((a.get("severity", "low") for a in alerts), key=lambda s: SEVERITY_RANK.get(s, 0)),
+            "timestamp": format_timestamp(now),
+            "is_read": False
+        }
+
@@ -1,10 +1,16 @@
-import pathway as pw
+from lazy_imports import lazy_import
 import numpy as np
 import logging
 from datetime import datetime, timedelta
+from transaction_store import UserTransactionStore
+from alerting import make_alert_id
+from metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# Pathway is only needed once a pipeline is built, so defer the heavy import
+pw = lazy_import("pathway")
+
 class AnomalyDetector:
     """Implements real-time anomaly detection for financial transactions"""
     
@@ -14,6 +20,7 @@ class AnomalyDetector:
         self.time_pattern_threshold = 0.05  # 5% probability
         self.new_location_threshold = 0.1  # 10% confidence for new location
     
+    @timed("detector.detect_amount_anomalies")
     def detect_amount_anomalies(self, transaction, merchant_stats):
         """Detect anomalies based on transaction amount compared to historical data"""
         if not merchant_stats or 'avg_amount' not in merchant_stats:
@@ -39,6 +46,7 @@ class AnomalyDetector:
         
         return False, None
     
+    @timed("detector.detect_time_pattern_anomalies")
     def detect_time_pattern_anomalies(self, transaction, time_patterns):
         """Detect anomalies based on transaction time patterns"""
         if not time_patterns:
@@ -61,19 +69,26 @@ class AnomalyDetector:
         
         return False, None
     
+    @timed("detector.detect_new_merchant_anomalies")
     def detect_new_merchant_anomalies(self, transaction, user_history):
         """Flag transactions with new merchants"""
         merchant_name = transaction.get('merchant_name', '')
         
-        # Check if this merchant appears in user history
-        for hist_transaction in user_history:
-            if hist_transaction.get('merchant_name') == merchant_name:
+        if isinstance(user_history, UserTransactionStore):
+            # O(1) lookup against the store's merchant code set
+            if user_history.has_merchant(merchant_name):
                 return False, None
+        else:
+            # Check if this merchant appears in user history
+            for hist_transaction in user_history:
+                if hist_transaction.get('merchant_name') == merchant_name:
+                    return False, None
         
         # This is a new merchant for the user
         message = f"First-time transaction with {merchant_name}"
         return True, message
     
+    @timed("detector.detect_geocontext_anomalies")
     def detect_geocontext_anomalies(self, transaction, user_location_history):
         """Detect transactions that occur in unusual geographic locations"""
         # In production, this would integrate with geolocation data
@@ -189,7 +204,11 @@ def detect_anomalies(transactions):
 def generate_alerts(anomalies, user_id):
     """Generate alerts for detected anomalies"""
     alerts = anomalies.select(
-        alert_id=pw.hash(anomalies.transaction_id + pw.now().to_string()),
+        # Derived from the transaction only, so recomputation keeps the same id
+        alert_id=pw.apply(
+            anomalies.transaction_id,
+            lambda transaction_id: make_alert_id(user_id, "anomaly", transaction_id)
+        ),
         user_id=user_id,
         transaction_id=anomalies.transaction_id,
         alert_type="anomaly",
@@ -226,9 +245,9 @@ def detect_pattern_changes(transactions, window_size=30):
         transaction_count=pw.reducers.count()
     )
     
-    # In a production environment, we would implement more sophisticated
-    # time series analysis here to detect trends and pattern changes
-    # For this simplified version, we'll just return the daily category totals
+    # Rolling windows and change points are maintained incrementally per
+    # (user, category) by trends.TrendStore, which backs /insights; the
+    # Pathway table only exposes the daily category totals
     return category_daily
 
 def create_alert_rules(rule_config=None):
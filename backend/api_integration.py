@@ -0,0 +1,373 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import httpx
+
+from metrics import increment, timer
+from transaction_store import TIMESTAMP_FORMAT, format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class ConnectorError(Exception):
+    """Raised when a feed request fails after all retries"""
+
+
+class _RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+@dataclass
+class ConnectorConfig:
+    """Connection, concurrency and retry settings for one feed provider"""
+    base_url: str
+    max_concurrency: int = 8
+    max_connections: int = 16
+    timeout: float = 10.0
+    max_retries: int = 4
+    backoff_base: float = 0.2
+    backoff_cap: float = 10.0
+    page_size: int = 200
+    api_key: str = None
+
+
+@dataclass
+class Account:
+    """A linked account polled through one connector"""
+    account_id: str
+    user_id: str
+    connector: str
+
+
+def normalize_timestamp(value):
+    """Map a provider timestamp (ISO 8601, optionally with an offset, or epoch seconds) to the internal UTC format"""
+    if isinstance(value, (int, float)):
+        return format_timestamp(int(value))
+    text = str(value).strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.strftime(TIMESTAMP_FORMAT)
+
+
+@dataclass
+class SyncResult:
+    account_id: str
+    connector: str
+    fetched: int = 0
+    pages: int = 0
+    cursor: str = None
+    error: str = None
+    transactions: list = field(default_factory=list, repr=False)
+
+
+class CursorStore:
+    """Incremental sync cursors (since-token / last-seen id) persisted per account.
+
+    A cursor only moves once the pages before it were handed to the sink.
+    Cursors are kept in memory and written to a JSON file atomically on
+    flush(), so a crash can at worst re-fetch one round of pages.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._cursors = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._cursors = json.load(f)
+
+    @staticmethod
+    def _key(connector, account_id):
+        return f"{connector}:{account_id}"
+
+    def get(self, connector, account_id):
+        return self._cursors.get(self._key(connector, account_id))
+
+    def set(self, connector, account_id, cursor):
+        key = self._key(connector, account_id)
+        if self._cursors.get(key) != cursor:
+            self._cursors[key] = cursor
+            self._dirty = True
+
+    def flush(self):
+        if not self.path or not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._cursors, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+class BaseConnector:
+    """Async connector over a pooled keep-alive HTTP client.
+
+    Subclasses describe their endpoint with `page_request()` and
+    `parse_page()`, and map provider records onto transaction dicts in
+    `normalize()`. Concurrent requests are capped by `max_concurrency`.
+    """
+
+    name = "base"
+    source_platform = "unknown"
+
+    def __init__(self, config, transport=None):
+        self.config = config
+        headers = {"Authorization": f"Bearer {config.api_key}"} if config.api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=config.base_url,
+            headers=headers,
+            timeout=config.timeout,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_connections
+            ),
+            transport=transport
+        )
+        self._semaphore = asyncio.Semaphore(config.max_concurrency)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def page_request(self, account, cursor):
+        """Return (path, params) for the page after `cursor`"""
+        raise NotImplementedError
+
+    def parse_page(self, payload):
+        """Return (records, next_cursor, has_more) from a response body"""
+        raise NotImplementedError
+
+    def normalize(self, record, account):
+        """Map one provider record onto the internal transaction dict"""
+        return {
+            "transaction_id": f"{self.name}_{record['id']}",
+            "user_id": account.user_id,
+            "amount": abs(float(record["amount"])),
+            "merchant_name": record.get("merchant", ""),
+            "description": record.get("description", ""),
+            "timestamp": normalize_timestamp(record["timestamp"]),
+            "source_platform": self.source_platform,
+            "transaction_type": "credit" if float(record["amount"]) > 0 else "debit",
+            "is_anomaly": False,
+            "is_duplicate": False
+        }
+
+    def backoff_delay(self, attempt, retry_after=None):
+        # Full jitter keeps many accounts from retrying in lockstep
+        delay = random.uniform(0, min(self.config.backoff_cap, self.config.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _get(self, path, params):
+        for attempt in range(self.config.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    with timer(f"connector.{self.name}.request"):
+                        response = await self.client.get(path, params=params)
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    raise _RetryableStatus(response)
+                response.raise_for_status()
+                return response.json()
+            except (httpx.TransportError, _RetryableStatus) as e:
+                if isinstance(e, _RetryableStatus):
+                    retry_after = _parse_retry_after(e.response.headers.get("retry-after"))
+                if attempt == self.config.max_retries:
+                    increment(f"connector.{self.name}.failed")
+                    raise ConnectorError(f"{self.name} {path} failed after {attempt + 1} attempts: {e}") from e
+                increment(f"connector.{self.name}.retried")
+                await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+            except httpx.HTTPStatusError as e:
+                increment(f"connector.{self.name}.failed")
+                raise ConnectorError(f"{self.name} {path} returned {e.response.status_code}") from e
+
+    async def sync_account(self, account, cursor_store):
+        """Fetch every page newer than the account's stored cursor.
+
+        The cursor after the last page fetched is returned in the result, not
+        stored: the caller commits it once the transactions were ingested.
+        """
+        result = SyncResult(account.account_id, self.name)
+        cursor = cursor_store.get(self.name, account.account_id)
+        try:
+            while True:
+                path, params = self.page_request(account, cursor)
+                records, next_cursor, has_more = self.parse_page(await self._get(path, params))
+                result.pages += 1
+                for record in records:
+                    try:
+                        result.transactions.append(self.normalize(record, account))
+                    except (KeyError, TypeError, ValueError) as e:
+                        # Re-fetching will not fix a malformed record; skip it loudly
+                        logger.error("Skipping malformed %s record for account %s: %r (%s)",
+                                     self.name, account.account_id, record, e)
+                        increment(f"connector.{self.name}.rejected")
+                if next_cursor is not None:
+                    cursor = next_cursor
+                if not has_more or not records:
+                    break
+        except ConnectorError as e:
+            logger.error("Sync failed for %s account %s: %s", self.name, account.account_id, e)
+            result.error = str(e)
+        result.fetched = len(result.transactions)
+        result.cursor = cursor
+        return result
+
+
+class OpenBankingConnector(BaseConnector):
+    """Open-banking style feed paged by an opaque since-token"""
+
+    name = "open_banking"
+    source_platform = "bank"
+
+    def page_request(self, account, cursor):
+        params = {"limit": self.config.page_size}
+        if cursor:
+            params["since"] = cursor
+        return f"/accounts/{account.account_id}/transactions", params
+
+    def parse_page(self, payload):
+        return payload["transactions"], payload.get("next_since"), payload.get("has_more", False)
+
+
+class CardFeedConnector(BaseConnector):
+    """Card issuer feed paged by the last-seen transaction id"""
+
+    name = "card_feed"
+    source_platform = "credit_card"
+
+    def page_request(self, account, cursor):
+        params = {"limit": self.config.page_size}
+        if cursor:
+            params["after_id"] = cursor
+        return f"/cards/{account.account_id}/transactions", params
+
+    def parse_page(self, payload):
+        records = payload["data"]
+        last_id = records[-1]["id"] if records else None
+        return records, last_id, payload.get("has_more", False)
+
+
+class UPIConnector(BaseConnector):
+    """GPay/UPI payment feed paged by a since-token"""
+
+    name = "upi"
+    source_platform = "gpay"
+
+    def page_request(self, account, cursor):
+        params = {"page_size": self.config.page_size}
+        if cursor:
+            params["since_token"] = cursor
+        return f"/upi/{account.account_id}/payments", params
+
+    def parse_page(self, payload):
+        return payload["payments"], payload.get("next_token"), payload.get("more", False)
+
+
+CONNECTOR_TYPES = {
+    OpenBankingConnector.name: OpenBankingConnector,
+    CardFeedConnector.name: CardFeedConnector,
+    UPIConnector.name: UPIConnector,
+}
+
+
+class SyncScheduler:
+    """Polls many accounts in parallel and hands new transactions to a sink.
+
+    The sink is called with (account, transactions) and may be a coroutine
+    function.
+    """
+
+    def __init__(self, connectors, cursor_store, sink=None, max_parallel_accounts=64):
+        self.connectors = connectors
+        self.cursor_store = cursor_store
+        self.sink = sink
+        self._parallel = asyncio.Semaphore(max_parallel_accounts)
+
+    async def _sync_one(self, account):
+        connector = self.connectors[account.connector]
+        result = SyncResult(account.account_id, account.connector)
+        try:
+            async with self._parallel:
+                result = await connector.sync_account(account, self.cursor_store)
+            if self.sink is not None and result.transactions:
+                outcome = self.sink(account, result.transactions)
+                if inspect.isawaitable(outcome):
+                    await outcome
+        except Exception as e:
+            # One bad feed or batch must not end the polling loop; the cursor
+            # stays put, so the same pages are fetched again next round
+            logger.exception("Sync round failed for %s account %s", account.connector, account.account_id)
+            increment(f"connector.{account.connector}.sync_failed")
+            result.error = str(e)
+            return result
+        if result.cursor is not None:
+            self.cursor_store.set(connector.name, account.account_id, result.cursor)
+        return result
+
+    async def sync_all(self, accounts):
+        """Run one incremental sync round over all accounts"""
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._sync_one(account) for account in accounts))
+        self.cursor_store.flush()
+        failed = sum(1 for result in results if result.error)
+        logger.info("Synced %d accounts (%d failed) in %.2fs",
+                    len(results), failed, time.perf_counter() - started)
+        return results
+
+    async def poll_forever(self, accounts, interval=60.0, account_filter=None):
+        """Sync every round; `account_filter` is re-applied before each one"""
+        while True:
+            selected = accounts if account_filter is None else [a for a in accounts if account_filter(a)]
+            await self.sync_all(selected)
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        for connector in self.connectors.values():
+            await connector.aclose()
+
+
+def build_connectors(config, transport=None):
+    """Create connectors from {name: ConnectorConfig or dict of its fields}"""
+    connectors = {}
+    for name, settings in config.items():
+        if isinstance(settings, dict):
+            settings = ConnectorConfig(**settings)
+        connectors[name] = CONNECTOR_TYPES[name](settings, transport=transport)
+    return connectors
+
+
+def load_sync_config(path):
+    """Load connectors and accounts from a JSON file.
+
+    Expected layout: {"connectors": {name: {ConnectorConfig fields}},
+    "accounts": [{account_id, user_id, connector}], "cursor_file": path,
+    "poll_interval": seconds}
+    """
+    with open(path) as f:
+        config = json.load(f)
+    connectors = build_connectors(config["connectors"])
+    accounts = [Account(**account) for account in config.get("accounts", [])]
+    return connectors, accounts, config.get("cursor_file"), config.get("poll_interval", 60.0)
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,25 @@
+import os
+
+# Mock bearer tokens (in production, validate a JWT and use its `sub` claim)
+DEMO_TOKEN = "test-token"
+DEMO_USER = "user@example.com"
+
+# With FINAI_ALLOW_TEST_USERS=1, "test-token:<user id>" authenticates as any
+# user, so load tests can spread traffic over many users (and shards)
+TEST_USER_PREFIX = "test-token:"
+ALLOW_TEST_USERS = os.environ.get("FINAI_ALLOW_TEST_USERS", "0") == "1"
+
+
+def user_for_token(token):
+    """Return the user id a bearer token authenticates, or None"""
+    if token == DEMO_TOKEN:
+        return DEMO_USER
+    if ALLOW_TEST_USERS and token and token.startswith(TEST_USER_PREFIX) and len(token) > len(TEST_USER_PREFIX):
+        return token[len(TEST_USER_PREFIX):]
+    return None
+
+
+def bearer_token(authorization):
+    """Extract the token from an 'Authorization: Bearer <token>' header value"""
+    scheme, _, token = (authorization or "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else None
@@ -0,0 +1,477 @@
+"""Historical backfill: load years of statement history into a user's state at batch speed.
+
+A statement file (CSV, OFX/QFX or NDJSON) is streamed through a chain of
+generators, one chunk of rows at a time:
+
+    read lines -> parse rows -> columnar batch -> drop known ids -> categorize
+
+and each batch is appended to the user's columnar store and folded into the
+rollups with one vectorized call. Trends, the search index and recurring
+payment detection are built once at the end from the store's columns.
+Backfilled rows bypass the real-time path entirely, so replaying history
+raises no alerts, and they are not written to the WAL: the caller should
+checkpoint afterwards. An interrupted backfill can simply be re-run, since
+rows already stored are skipped.
+"""
+import calendar
+import csv
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+
+from metrics import increment, timer
+from transaction_processor import find_recurring_payments
+from transaction_store import FLAG_ANOMALY, FLAG_CREDIT, FLAG_DUPLICATE, MINOR_UNITS
+
+logger = logging.getLogger(__name__)
+
+# Rows per batch handed from the reader to the loader
+BACKFILL_CHUNK_ROWS = 5000
+
+# How often a running backfill logs its progress
+PROGRESS_LOG_SECONDS = 5
+
+# Date layouts tried in order; the first that parses a file's first date is
+# tried first for the rest of the file
+DATE_FORMATS = (
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%m/%d/%Y', '%m/%d/%y',
+    '%d.%m.%Y', '%Y%m%d%H%M%S', '%Y%m%d'
+)
+
+# Parsed dates are memoized (statement dates repeat a lot) up to this many
+MAX_CACHED_DATES = 100_000
+
+# Epoch range of years 1-9999, which timestamps must fall in to be formatted;
+# NumPy reads compact dates like 20231101 as far-future years
+MIN_EPOCH = calendar.timegm((1, 1, 1, 0, 0, 0))
+MAX_EPOCH = calendar.timegm((9999, 12, 31, 23, 59, 59))
+
+# CSV header spellings per field, compared lower-cased
+CSV_COLUMNS = {
+    "transaction_id": ("transaction_id", "transaction id", "id", "fitid", "reference"),
+    "timestamp": ("timestamp", "date", "transaction date", "posted date", "posting date", "booking date"),
+    "amount": ("amount", "transaction amount"),
+    "debit": ("debit", "withdrawal", "withdrawals", "money out"),
+    "credit": ("credit", "deposit", "deposits", "money in"),
+    "merchant_name": ("merchant_name", "merchant", "payee", "name"),
+    "description": ("description", "memo", "details", "narrative"),
+    "transaction_type": ("transaction_type", "type"),
+    "category": ("category",),
+    "source_platform": ("source_platform", "source", "account"),
+}
+
+CREDIT_TYPES = {"credit", "cr", "deposit", "dep", "directdep", "int", "div"}
+
+# Statement formats whose amounts are signed (negative is money out); NDJSON
+# rows are transaction dicts as live ingestion takes them, unsigned and
+# typed, with a missing type meaning a debit
+SIGNED_FORMATS = {"csv", "ofx", "qfx"}
+
+# OFX tags (SGML 1.x, where leaf elements have no closing tag, or XML 2.x)
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+_OFX_OFFSET = re.compile(r"\[([+-]?\d+(?:\.\d+)?)")
+
+
+class BackfillError(Exception):
+    pass
+
+
+class BackfillProgress:
+    """Counters for one backfill; each is written by a single thread, so reads need no lock"""
+
+    def __init__(self, total_bytes=None):
+        self.status = "running"
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.rows_read = 0
+        self.rows_loaded = 0
+        self.duplicates = 0
+        # Rows live ingestion stored between the dedup stage and the load
+        self.late_duplicates = 0
+        self.error = None
+        self.started = time.monotonic()
+        self.finished = None
+
+    def finish(self):
+        self.status = "done"
+        self.finished = time.monotonic()
+
+    def fail(self, error):
+        self.status = "failed"
+        self.error = str(error)
+        self.finished = time.monotonic()
+
+    def snapshot(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            "status": self.status,
+            "progress": round(self.bytes_read / self.total_bytes, 3) if self.total_bytes else None,
+            "bytes_read": self.bytes_read,
+            "rows_read": self.rows_read,
+            "rows_loaded": self.rows_loaded,
+            "duplicates": self.duplicates + self.late_duplicates,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows_read / elapsed, 1) if elapsed > 0 else None,
+            "error": self.error
+        }
+
+
+class DateParser:
+    """Memoized statement date parsing to epoch seconds (UTC)"""
+
+    def __init__(self):
+        self._cache = {}
+        self._formats = DATE_FORMATS
+
+    def __call__(self, value):
+        epoch = self._cache.get(value)
+        if epoch is not None:
+            return epoch
+        text = value.strip()
+        for layout in self._formats:
+            try:
+                parsed = datetime.strptime(text, layout)
+            except ValueError:
+                continue
+            if layout != self._formats[0]:
+                self._formats = (layout,) + tuple(f for f in DATE_FORMATS if f != layout)
+            epoch = calendar.timegm(parsed.timetuple())
+            if len(self._cache) >= MAX_CACHED_DATES:
+                self._cache.clear()
+            self._cache[value] = epoch
+            return epoch
+        raise BackfillError(f"Unrecognized date {value!r}")
+
+    def many(self, values):
+        """Parse a chunk of dates; ISO layouts and epoch ints go through numpy in one call"""
+        try:
+            parsed = np.array(values, dtype="datetime64[s]")
+            if not np.isnat(parsed).any():
+                epochs = parsed.astype(np.int64)
+                if len(epochs) and epochs.min() >= MIN_EPOCH and epochs.max() <= MAX_EPOCH:
+                    return epochs
+        except (ValueError, TypeError):
+            pass
+        return np.fromiter((value if isinstance(value, int) else self(str(value or "")) for value in values),
+                           dtype=np.int64, count=len(values))
+
+
+def parse_amount(value):
+    """Parse '1,234.50', '$-12.00' or '(12.00)' to signed minor units"""
+    if isinstance(value, (int, float)):
+        return int(round(value * MINOR_UNITS))
+    text = value.strip().replace(",", "").replace("$", "")
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1]
+    minor = int(round(float(text) * MINOR_UNITS))
+    return -minor if negative else minor
+
+
+def parse_amounts(values):
+    """Parse a chunk of amounts; plain decimals go through numpy in one call"""
+    try:
+        return np.rint(np.array(values, dtype=np.float64) * MINOR_UNITS).astype(np.int64)
+    except (ValueError, TypeError):
+        return np.fromiter((parse_amount(value) for value in values), dtype=np.int64, count=len(values))
+
+
+def _lines(f, progress):
+    # Binary line iteration keeps an exact byte count for progress reporting
+    first = True
+    for line in f:
+        progress.bytes_read += len(line)
+        if first:
+            first = False
+            yield line.decode("utf-8-sig", errors="replace")
+        else:
+            yield line.decode("utf-8", errors="replace")
+
+
+def read_csv(lines):
+    """Yield raw row dicts from a bank CSV export with a header row"""
+    reader = csv.reader(lines)
+    header = [name.strip().lower() for name in next(reader, [])]
+    columns = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+    if "timestamp" not in columns or not ({"amount", "debit", "credit"} & columns.keys()):
+        raise BackfillError(f"CSV header needs a date and an amount column, got {header}")
+
+    for values in reader:
+        if not values:
+            continue
+        row = {field: values[index] for field, index in columns.items() if index < len(values)}
+        if "amount" not in row:
+            # Separate debit/credit columns: whichever is filled in
+            debit, credit = row.pop("debit", "").strip(), row.pop("credit", "").strip()
+            if not debit and not credit:
+                raise BackfillError(f"CSV line {reader.line_num} has neither a debit nor a credit amount: {values}")
+            row["amount"] = credit if credit else "-" + debit.lstrip("-")
+        yield row
+
+
+def read_ndjson(lines):
+    """Yield transaction dicts, one JSON object per line"""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_ofx(lines):
+    """Yield raw row dicts for each <STMTTRN> of an OFX/QFX statement"""
+    transaction = None
+    for line in lines:
+        for match in _OFX_TAG.finditer(line):
+            closing, tag, value = match.groups()
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and transaction is not None:
+                    yield _ofx_row(transaction)
+                transaction = None if closing else {}
+            elif transaction is not None and not closing:
+                transaction[tag] = value.strip()
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_DATES)
+def _ofx_day(digits):
+    try:
+        return calendar.timegm(datetime.strptime(digits, "%Y%m%d").timetuple())
+    except ValueError:
+        raise BackfillError(f"Unrecognized OFX date {digits!r}") from None
+
+
+def _ofx_row(transaction):
+    posted = transaction.get("DTPOSTED", "")
+    digits = re.match(r"\d+", posted)
+    if digits is None:
+        raise BackfillError(f"Unrecognized OFX date {posted!r}")
+    digits = digits.group(0)[:14].ljust(14, "0")
+    epoch = _ofx_day(digits[:8]) + int(digits[8:10]) * 3600 + int(digits[10:12]) * 60 + int(digits[12:14])
+    offset = _OFX_OFFSET.search(posted)
+    if offset:
+        epoch -= int(float(offset.group(1)) * 3600)
+    name = transaction.get("NAME") or transaction.get("PAYEE", "")
+    return {
+        "transaction_id": transaction.get("FITID"),
+        "timestamp": epoch,
+        "amount": transaction.get("TRNAMT", "0"),
+        "merchant_name": name,
+        "description": transaction.get("MEMO") or name
+    }
+
+
+READERS = {
+    "csv": read_csv,
+    "ndjson": read_ndjson,
+    "jsonl": read_ndjson,
+    "ofx": read_ofx,
+    "qfx": read_ofx,
+}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension not in READERS:
+        raise BackfillError(f"Cannot tell the statement format of {path}; pass one of {sorted(READERS)}")
+    return extension
+
+
+def _chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class StatementBatch:
+    """One chunk of statement rows as columns, ready for UserTransactionStore.append_columns"""
+
+    __slots__ = ("transaction_ids", "timestamps", "amounts", "flags", "merchants", "descriptions",
+                 "platforms", "categories")
+
+    def __init__(self, transaction_ids, timestamps, amounts, flags, merchants, descriptions,
+                 platforms, categories):
+        self.transaction_ids = transaction_ids
+        self.timestamps = timestamps
+        self.amounts = amounts
+        self.flags = flags
+        self.merchants = merchants
+        self.descriptions = descriptions
+        self.platforms = platforms
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.transaction_ids)
+
+    def select(self, rows):
+        """The batch restricted to a list of row positions"""
+        pick = lambda values: [values[row] for row in rows]
+        return StatementBatch(pick(self.transaction_ids), self.timestamps[rows], self.amounts[rows],
+                              self.flags[rows], pick(self.merchants), pick(self.descriptions),
+                              pick(self.platforms), pick(self.categories))
+
+
+class Backfill:
+    """Loads one statement file into a user's store, rollups, trends and search index.
+
+    `batches()` is the read/parse/dedup/categorize pipeline and may run in a
+    worker thread; `load()` and `finish()` mutate shared state and must run
+    where ingestion runs (the event loop in main.py). `run()` does all of
+    it inline.
+    """
+
+    def __init__(self, user_id, path, transaction_store, rollups, trends, search_indexes, processor,
+                 format=None, source_platform="statement", chunk_rows=BACKFILL_CHUNK_ROWS):
+        self.user_id = user_id
+        self.path = path
+        self.format = format or detect_format(path)
+        if self.format not in READERS:
+            raise BackfillError(f"Unsupported statement format {self.format!r}")
+        self.store = transaction_store.user(user_id)
+        self.rollup = rollups.user(user_id)
+        self.trends = trends.user(user_id)
+        self.search_index = search_indexes.user(user_id)
+        self.processor = processor
+        self.source_platform = source_platform
+        self.chunk_rows = chunk_rows
+        self.progress = BackfillProgress(os.path.getsize(path))
+        self.ranges = []
+        self.subscriptions = None
+        self._dates = DateParser()
+        self._occurrences = {}
+        self._last_log = time.monotonic()
+
+    def batches(self):
+        """Yield categorized StatementBatches of rows not stored yet"""
+        with open(self.path, "rb") as f:
+            rows = READERS[self.format](_lines(f, self.progress))
+            batches = (self._to_batch(chunk) for chunk in _chunked(rows, self.chunk_rows))
+            yield from self._categorized(self._unseen(batches))
+
+    def _to_batch(self, rows):
+        count = len(rows)
+        timestamps = self._dates.many([row.get("timestamp") for row in rows])
+        signed = parse_amounts([row.get("amount", 0) for row in rows])
+        if self.format in SIGNED_FORMATS:
+            amounts = np.abs(signed)
+            # Negative amounts are money out; otherwise an explicit type decides
+            types = [(row.get("transaction_type") or "").strip().lower() for row in rows]
+            credit = (signed > 0) & np.fromiter((t in CREDIT_TYPES if t else True for t in types),
+                                                dtype=bool, count=count)
+        else:
+            # As UserTransactionStore.append: amounts as given, credit only when typed so
+            amounts = signed
+            credit = np.fromiter((row.get("transaction_type") == "credit" for row in rows), dtype=bool,
+                                 count=count)
+        flags = np.where(credit, FLAG_CREDIT, 0).astype(np.uint8)
+        flags |= np.fromiter(((FLAG_ANOMALY if row.get("is_anomaly") else 0)
+                              | (FLAG_DUPLICATE if row.get("is_duplicate") else 0) for row in rows),
+                             dtype=np.uint8, count=count)
+        descriptions = [(row.get("description") or "").strip() for row in rows]
+        merchants = [(row.get("merchant_name") or "").strip() or description
+                     for row, description in zip(rows, descriptions)]
+        platforms = [row.get("source_platform") or self.source_platform for row in rows]
+        categories = [row.get("category") or None for row in rows]
+        transaction_ids = [
+            row.get("transaction_id") or self._derived_id(epoch, amount, is_credit, description)
+            for row, epoch, amount, is_credit, description
+            in zip(rows, timestamps.tolist(), amounts.tolist(), credit.tolist(), descriptions)
+        ]
+        self.progress.rows_read += count
+        return StatementBatch(transaction_ids, timestamps, amounts, flags, merchants, descriptions,
+                              platforms, categories)
+
+    def _derived_id(self, epoch, amount, is_credit, description):
+        # Stable across re-runs and overlapping statements: identical rows on
+        # the same day are told apart by how often they occurred before
+        key = (epoch, amount, is_credit, description)
+        occurrence = self._occurrences.get(key, 0)
+        self._occurrences[key] = occurrence + 1
+        digest = hashlib.blake2b(f"{epoch}|{amount}|{int(is_credit)}|{description}|{occurrence}".encode("utf-8"),
+                                 digest_size=8)
+        return "bf_" + digest.hexdigest()
+
+    def _unseen(self, batches):
+        store = self.store
+        for batch in batches:
+            seen = set()
+            rows = []
+            for row, transaction_id in enumerate(batch.transaction_ids):
+                if transaction_id not in store and transaction_id not in seen:
+                    rows.append(row)
+                    seen.add(transaction_id)
+            self.progress.duplicates += len(batch) - len(rows)
+            if rows:
+                yield batch if len(rows) == len(batch) else batch.select(rows)
+
+    def _categorized(self, batches):
+        for batch in batches:
+            missing = [row for row, category in enumerate(batch.categories) if category is None]
+            if missing:
+                found = self.processor.categorize_many([batch.merchants[row] for row in missing],
+                                                       [batch.descriptions[row] for row in missing])
+                for row, category in zip(missing, found):
+                    batch.categories[row] = category
+            yield batch
+
+    def load(self, batch):
+        """Append a batch to the store and fold it into the rollups; returns the rows added"""
+        with timer("backfill.load"):
+            start, end = self.store.append_columns(
+                batch.transaction_ids, batch.timestamps, batch.amounts, batch.merchants,
+                batch.categories, batch.platforms, batch.descriptions, batch.flags
+            )
+            self.rollup.apply_rows(self.store, start, end)
+        added = end - start
+        if added:
+            self.ranges.append((start, end))
+        self.progress.late_duplicates += len(batch) - added
+        self.progress.rows_loaded += added
+        increment("backfill.rows", added)
+
+        now = time.monotonic()
+        if now - self._last_log >= PROGRESS_LOG_SECONDS:
+            self._last_log = now
+            logger.info("Backfill for %s: %s", self.user_id, self.progress.snapshot())
+        return added
+
+    def finish(self):
+        """Build trends, the search index and recurring payments from the loaded history"""
+        with timer("backfill.finish"):
+            self.trends.rebuild(self.store)
+            self.search_index.sync()
+            self.subscriptions = find_recurring_payments(self.store)
+        self.progress.finish()
+        snapshot = self.progress.snapshot()
+        logger.info("Backfilled %d rows for %s from %s in %.2fs (%s rows/s)", self.progress.rows_loaded,
+                    self.user_id, self.path, snapshot["elapsed_seconds"], snapshot["rows_per_second"])
+        return snapshot
+
+    def loaded_rows(self):
+        """Store row numbers added by this backfill"""
+        for start, end in self.ranges:
+            yield from range(start, end)
+
+    def run(self):
+        try:
+            for batch in self.batches():
+                self.load(batch)
+            return self.finish()
+        except Exception as e:
+            self.progress.fail(e)
+            raise
@@ -0,0 +1,5 @@
+"""Benchmarks for the FinAI Copilot backend.
+
+Run from the backend directory, e.g. `python -m benchmarks.startup`.
+Each benchmark prints a JSON document so results can be compared across commits.
+"""
@@ -0,0 +1,45 @@
+"""Run the whole benchmark suite and emit one JSON report.
+
+    python -m benchmarks --scale 100k --output bench_output.json
+
+Compare reports from two commits to spot regressions.
+"""
+import argparse
+import sys
+
+from benchmarks import alert_burst, backfill, connectors, enrichment, explanations, http_load, micro, restore, startup
+from benchmarks.common import emit, environment, parse_scale
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run all FinAI Copilot benchmarks")
+    parser.add_argument("--scale", default="10k", help="history rows: 1k, 10k, 100k, 1m, 10m or a number")
+    parser.add_argument("--http-scale", default="1k", help="rows seeded for the HTTP load test")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = {
+        "suite": "finai-copilot",
+        "environment": environment(),
+        "benchmarks": {
+            "startup": startup.run(runs=3),
+            "micro": micro.run(parse_scale(args.scale), seed=args.seed),
+            "alert_burst": alert_burst.run(),
+            "http_load": http_load.run(parse_scale(args.http_scale), args.requests,
+                                       args.concurrency, args.seed),
+            "connectors": connectors.run(),
+            "enrichment": enrichment.run(parse_scale(args.scale), seed=args.seed),
+            "restore": restore.run((parse_scale(args.scale),), seed=args.seed),
+            "backfill": backfill.run(parse_scale(args.scale), seed=args.seed),
+            "explanations": explanations.run(parse_scale(args.scale), seed=args.seed)
+        }
+    }
+    emit(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Synthetic burst-load benchmark for the alert pipeline.
+
+Replays a bad day for a set of users: bursts of anomaly alerts against a
+few merchants, with every alert recomputed (re-submitted) once. Reports how
+many alerts were fanned out versus submitted and checks that per-user
+fan-out stays within the token-bucket bound.
+"""
+import argparse
+import random
+import sys
+import time
+
+from alerting import AlertPipeline, RATE_LIMIT_CAPACITY, RATE_LIMIT_PER_HOUR
+from benchmarks.common import emit, environment
+
+
+def generate_burst(users, alerts_per_user, merchants, duration_seconds, seed=7):
+    rng = random.Random(seed)
+    alerts = []
+    for u in range(users):
+        for i in range(alerts_per_user):
+            alerts.append({
+                "user_id": f"user_{u}",
+                "transaction_id": f"tx_{u}_{i}",
+                "alert_type": "anomaly",
+                "merchant_name": f"merchant_{rng.randrange(merchants)}",
+                "severity": rng.choice(["low", "medium", "high"]),
+                "message": "Unusual transaction",
+                "offset": rng.uniform(0, duration_seconds)
+            })
+    alerts.sort(key=lambda alert: alert["offset"])
+    return alerts
+
+
+def run(users=100, alerts_per_user=500, merchants=5, duration_seconds=86400, flush_every=60):
+    pipeline = AlertPipeline()
+    alerts = generate_burst(users, alerts_per_user, merchants, duration_seconds)
+    fanned_out = {}
+    next_flush = flush_every
+
+    started = time.perf_counter()
+    for alert in alerts:
+        while alert["offset"] >= next_flush:
+            for out in pipeline.flush(now=next_flush):
+                fanned_out[out["user_id"]] = fanned_out.get(out["user_id"], 0) + 1
+            next_flush += flush_every
+        # Every alert is recomputed once; the second copy must be deduplicated
+        for _ in range(2):
+            for out in pipeline.submit(alert, now=alert["offset"]):
+                fanned_out[out["user_id"]] = fanned_out.get(out["user_id"], 0) + 1
+    for out in pipeline.flush(now=duration_seconds + pipeline.window_seconds):
+        fanned_out[out["user_id"]] = fanned_out.get(out["user_id"], 0) + 1
+    elapsed = time.perf_counter() - started
+
+    # Token bucket bound: burst capacity plus refill over the run, plus one final flush
+    bound = RATE_LIMIT_CAPACITY + RATE_LIMIT_PER_HOUR * (duration_seconds + pipeline.window_seconds) / 3600 + 1
+    worst = max(fanned_out.values()) if fanned_out else 0
+    return {
+        "benchmark": "alert_burst",
+        "environment": environment(),
+        "users": users,
+        "submitted": pipeline.stats["submitted"],
+        "fanned_out": sum(fanned_out.values()),
+        "max_per_user": worst,
+        "per_user_bound": int(bound),
+        "within_bound": worst <= bound,
+        "stats": pipeline.stats,
+        "submits_per_second": round(pipeline.stats["submitted"] / elapsed, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--alerts-per-user", type=int, default=500)
+    parser.add_argument("--merchants", type=int, default=5)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.users, args.alerts_per_user, args.merchants)
+    emit(report, args.output)
+    return 0 if report["within_bound"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Historical backfill throughput: batch pipeline vs the per-event ingest path.
+
+Writes a synthetic statement history as CSV, OFX and NDJSON files, then
+measures rows/s for loading each through `backfill.Backfill` into fresh
+stores, and for pushing the same rows through the per-event path (per-row
+categorization, append, rollup and trend updates, as main.ingest_transactions
+does). Checks that both paths end in the same store, rollups and trends.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from backfill import Backfill
+from benchmarks.common import emit, environment, parse_scale
+from benchmarks.synthetic import generate_transactions
+from rollups import RollupStore
+from search_index import SearchIndexStore
+from transaction_processor import TransactionProcessor
+from transaction_store import TransactionStore, parse_timestamp
+from trends import TrendStore
+
+USER = "bench"
+FORMATS = ("csv", "ofx", "ndjson")
+
+# Fixed clock so month-to-date views compare equal across runs
+CLOCK = parse_timestamp("2024-01-01 00:00:00")
+
+
+def statement_rows(rows, seed):
+    """Synthetic history without categories, so both paths run the categorizer"""
+    for transaction in generate_transactions(rows, seed=seed):
+        transaction.pop("category")
+        yield transaction
+
+
+def write_csv(path, transactions):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Transaction ID", "Date", "Payee", "Description", "Amount"])
+        for t in transactions:
+            amount = t["amount"] if t["transaction_type"] == "credit" else -t["amount"]
+            writer.writerow([t["transaction_id"], t["timestamp"], t["merchant_name"], t["description"],
+                             f"{amount:.2f}"])
+
+
+def write_ofx(path, transactions):
+    with open(path, "w") as f:
+        f.write("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>"
+                "<CURDEF>USD\n<BANKTRANLIST>\n")
+        for t in transactions:
+            credit = t["transaction_type"] == "credit"
+            f.write(f"<STMTTRN>\n<TRNTYPE>{'CREDIT' if credit else 'DEBIT'}\n"
+                    f"<DTPOSTED>{t['timestamp'].replace('-', '').replace(' ', '').replace(':', '')}\n"
+                    f"<TRNAMT>{t['amount'] if credit else -t['amount']:.2f}\n<FITID>{t['transaction_id']}\n"
+                    f"<NAME>{t['merchant_name']}\n<MEMO>{t['description']}\n</STMTTRN>\n")
+        f.write("</BANKTRANLIST>\n</STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n")
+
+
+def write_ndjson(path, transactions):
+    with open(path, "w") as f:
+        for t in transactions:
+            f.write(json.dumps(t) + "\n")
+
+
+WRITERS = {"csv": write_csv, "ofx": write_ofx, "ndjson": write_ndjson}
+
+
+class State:
+    def __init__(self):
+        self.transaction_store = TransactionStore()
+        self.rollups = RollupStore(clock=lambda: CLOCK)
+        self.trends = TrendStore()
+        self.search_indexes = SearchIndexStore(self.transaction_store)
+        self.processor = TransactionProcessor()
+
+    def ingest(self, transactions):
+        """The per-event path: one row at a time, as main.ingest_transactions"""
+        store = self.transaction_store.user(USER)
+        rollup = self.rollups.user(USER)
+        trend = self.trends.user(USER)
+        for transaction in transactions:
+            if store.get(transaction["transaction_id"]) is not None:
+                continue
+            transaction["category"] = self.processor.categorize_transaction(
+                transaction.get("merchant_name", ""), transaction.get("description", "")
+            )
+            size = len(store)
+            row = store.append(transaction)
+            if len(store) > size:
+                record = store[row]
+                rollup.apply(record)
+                trend.apply(record)
+        self.search_indexes.user(USER).sync()
+
+    def backfill(self, path, format):
+        job = Backfill(USER, path, self.transaction_store, self.rollups, self.trends, self.search_indexes,
+                       self.processor, format=format, source_platform="bank")
+        return job, job.run()
+
+    def fingerprint(self):
+        store = self.transaction_store.user(USER)
+        rollup = self.rollups.user(USER)
+        return (
+            sorted((r.transaction_id, r.epoch, r.amount_minor, r.category, r.transaction_type) for r in store),
+            rollup.to_state()["months"], rollup.balance_minor,
+            self.trends.user(USER).snapshot()
+        )
+
+
+def run(rows=100_000, seed=42):
+    logging.getLogger().setLevel(logging.WARNING)
+    transactions = list(statement_rows(rows, seed))
+
+    started = time.perf_counter()
+    per_event = State()
+    per_event.ingest(dict(t) for t in transactions)
+    per_event_seconds = time.perf_counter() - started
+    expected = per_event.fingerprint()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for format in FORMATS:
+            path = os.path.join(directory, f"statement.{format}")
+            WRITERS[format](path, transactions)
+            state = State()
+            started = time.perf_counter()
+            job, snapshot = state.backfill(path, format)
+            seconds = time.perf_counter() - started
+            rerun, rerun_snapshot = state.backfill(path, format)
+            results[format] = {
+                "file_bytes": os.path.getsize(path),
+                "rows_loaded": snapshot["rows_loaded"],
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(rows / seconds),
+                "speedup_vs_per_event": round(per_event_seconds / seconds, 1),
+                "subscriptions": len(job.subscriptions),
+                "rerun_rows_loaded": rerun_snapshot["rows_loaded"],
+                # Platforms differ by design (statements carry one); compare the rest
+                "matches_per_event": state.fingerprint() == expected
+            }
+
+    return {
+        "benchmark": "backfill",
+        "environment": environment(),
+        "rows": rows,
+        "per_event": {
+            "seconds": round(per_event_seconds, 3),
+            "rows_per_second": round(rows / per_event_seconds)
+        },
+        "backfill": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="100k", help="history rows: 1k, 10k, 100k, 1m or a number")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(parse_scale(args.scale), args.seed)
+    emit(report, args.output)
+    return 0 if all(result["matches_per_event"] for result in report["backfill"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Shared helpers for timing code and emitting comparable JSON reports"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Named scale presets accepted by --scale
+SCALES = {
+    "1k": 1_000,
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+
+def parse_scale(value):
+    """Accept a preset name ('100k') or a plain row count"""
+    return SCALES.get(value.lower()) or int(value)
+
+
+def time_call(fn, repeat=5, number=1):
+    """Run `fn` `number` times per sample and return per-call latency stats in microseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter_ns() - started) / number / 1000)
+    return summarize(samples)
+
+
+def summarize(samples_us):
+    ordered = sorted(samples_us)
+    return {
+        "samples": len(ordered),
+        "mean_us": round(statistics.fmean(ordered), 3),
+        "p50_us": round(percentile(ordered, 50), 3),
+        "p95_us": round(percentile(ordered, 95), 3),
+        "p99_us": round(percentile(ordered, 99), 3),
+        "max_us": round(ordered[-1], 3)
+    }
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+
+def emit(report, output=None):
+    """Print a report as JSON, and also write it to `output` if given"""
+    text = json.dumps(report, indent=2, sort_keys=False)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
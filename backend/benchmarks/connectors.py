@@ -0,0 +1,123 @@
+"""Connector sync throughput: accounts synced per minute.
+
+Spreads accounts across the open-banking, card and UPI connectors, serves
+them from the stand-in feeds (with simulated latency and transient 503s),
+runs a full initial sync followed by an incremental round, and reports
+accounts/minute, pages, retries and rows ingested into the store. By
+default the feeds run in-process over an ASGI transport; pass --live to put
+them behind a real uvicorn server so keep-alive pooling is exercised.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+
+from api_integration import CONNECTOR_TYPES, Account, ConnectorConfig, CursorStore, SyncScheduler, build_connectors
+from benchmarks.common import emit, environment
+from benchmarks.standin_feeds import StandinFeeds, serve_in_thread
+from metrics import REGISTRY
+from transaction_store import TransactionStore
+
+
+def make_accounts(count):
+    names = list(CONNECTOR_TYPES)
+    return [Account(f"acct_{i}", f"user_{i % max(count // 3, 1)}", names[i % len(names)]) for i in range(count)]
+
+
+async def sync_round(scheduler, accounts):
+    started = time.perf_counter()
+    results = await scheduler.sync_all(accounts)
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": round(elapsed, 3),
+        "accounts_per_minute": round(len(accounts) / elapsed * 60, 1),
+        "pages": sum(result.pages for result in results),
+        "fetched": sum(result.fetched for result in results),
+        "failed_accounts": sum(1 for result in results if result.error)
+    }
+
+
+async def run_async(accounts, records, new_records, page_size, concurrency, latency_ms,
+                    failure_rate, live):
+    logging.getLogger().setLevel(logging.WARNING)
+    account_list = make_accounts(accounts)
+    feeds = StandinFeeds([account.account_id for account in account_list], records,
+                         latency_ms, failure_rate)
+
+    server = None
+    transport = None
+    base_url = "http://standin"
+    if live:
+        server, base_url = serve_in_thread(feeds.app)
+    else:
+        transport = httpx.ASGITransport(app=feeds.app)
+
+    settings = ConnectorConfig(base_url=base_url, max_concurrency=concurrency,
+                               max_connections=concurrency, page_size=page_size,
+                               backoff_base=0.01, backoff_cap=0.2)
+    connectors = build_connectors({name: settings for name in CONNECTOR_TYPES}, transport=transport)
+
+    store = TransactionStore()
+
+    def sink(account, transactions):
+        store.user(account.user_id).extend(transactions)
+
+    scheduler = SyncScheduler(connectors, CursorStore(), sink=sink, max_parallel_accounts=concurrency * 4)
+    try:
+        initial = await sync_round(scheduler, account_list)
+        for account in account_list:
+            feeds.add_records(account.account_id, new_records)
+        incremental = await sync_round(scheduler, account_list)
+    finally:
+        await scheduler.aclose()
+        if server is not None:
+            server.should_exit = True
+
+    retried = sum(value for name, value in REGISTRY.counters().items() if name.endswith(".retried"))
+    return {
+        "benchmark": "connectors",
+        "environment": environment(),
+        "accounts": accounts,
+        "records_per_account": records,
+        "page_size": page_size,
+        "concurrency_per_connector": concurrency,
+        "latency_ms": latency_ms,
+        "failure_rate": failure_rate,
+        "transport": "uvicorn" if live else "asgi",
+        "initial_sync": initial,
+        "incremental_sync": incremental,
+        "injected_failures": feeds.failures,
+        "retries": retried,
+        "rows_in_store": sum(len(store.user(user_id)) for user_id in store.users())
+    }
+
+
+def run(accounts=300, records=200, new_records=5, page_size=50, concurrency=16,
+        latency_ms=5.0, failure_rate=0.02, live=False):
+    return asyncio.run(run_async(accounts, records, new_records, page_size, concurrency,
+                                 latency_ms, failure_rate, live))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=300)
+    parser.add_argument("--records", type=int, default=200, help="history per account for the initial sync")
+    parser.add_argument("--new-records", type=int, default=5, help="records added before the incremental round")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight requests per connector")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--live", action="store_true", help="serve the feeds over real HTTP via uvicorn")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    emit(run(args.accounts, args.records, args.new_records, args.page_size, args.concurrency,
+             args.latency_ms, args.failure_rate, args.live), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
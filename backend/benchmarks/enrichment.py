@@ -0,0 +1,113 @@
+"""Merchant enrichment: per-transaction lookups vs the batched, cached enricher.
+
+Runs against the stand-in enrichment service behind a real uvicorn server.
+The baseline makes one HTTP lookup per transaction (as the old per-row
+enrich_with_external_data would against a real API); the enricher handles
+micro-batches from several worker threads at once. Reports rows/second and
+how many requests and merchant lookups reached the service.
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import emit, environment, parse_scale
+from benchmarks.standin_enrichment import StandinEnrichmentService
+from benchmarks.standin_feeds import serve_in_thread
+from benchmarks.synthetic import generate_transactions
+from enrichment import HTTPEnrichmentProvider, MerchantEnricher, canonical_merchant
+from metrics import REGISTRY
+
+
+def make_rows(rows, seed):
+    transactions = list(generate_transactions(rows, seed=seed))
+    # Feeds spell the same merchant differently; store numbers must not split the cache
+    for i, transaction in enumerate(transactions):
+        if i % 3 == 0:
+            transaction["merchant_name"] = f"{transaction['merchant_name'].upper()} #{i % 97}"
+    return transactions
+
+
+def bench_per_transaction(provider, service, transactions):
+    requests_before = service.requests
+    started = time.perf_counter()
+    for transaction in transactions:
+        merchant = canonical_merchant(transaction["merchant_name"])
+        transaction["enrichment"] = provider.lookup_many([merchant]).get(merchant)
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": len(transactions),
+        "rows_per_second": round(len(transactions) / elapsed, 1),
+        "service_requests": service.requests - requests_before
+    }
+
+
+def bench_enricher(enricher, service, transactions, batch_size, workers):
+    requests_before = service.requests
+    looked_up_before = service.merchants_looked_up
+    counters_before = REGISTRY.counters()
+    batches = [transactions[i:i + batch_size] for i in range(0, len(transactions), batch_size)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(enricher.enrich, batches))
+    elapsed = time.perf_counter() - started
+    counters = REGISTRY.counters()
+    return {
+        "rows": len(transactions),
+        "micro_batch": batch_size,
+        "workers": workers,
+        "rows_per_second": round(len(transactions) / elapsed, 1),
+        "service_requests": service.requests - requests_before,
+        "merchants_looked_up": service.merchants_looked_up - looked_up_before,
+        "distinct_records": len({id(t["enrichment"]) for t in transactions if t["enrichment"] is not None}),
+        "counters": {
+            name: counters.get(name, 0) - counters_before.get(name, 0)
+            for name in ("enrichment.cache_hit", "enrichment.negative_hit",
+                         "enrichment.cache_miss", "enrichment.single_flight_wait")
+        }
+    }
+
+
+def run(rows=100_000, baseline_rows=300, batch_size=500, workers=8, latency_ms=2.0, seed=42):
+    logging.getLogger().setLevel(logging.WARNING)
+    service = StandinEnrichmentService(latency_ms)
+    server, base_url = serve_in_thread(service.app)
+    provider = HTTPEnrichmentProvider(base_url, max_connections=workers)
+    try:
+        transactions = make_rows(rows, seed)
+        # Unknown merchants exercise negative caching
+        for transaction in transactions[::50]:
+            transaction["merchant_name"] = "Corner Shop 77"
+        baseline = bench_per_transaction(provider, service, [dict(t) for t in transactions[:baseline_rows]])
+        batched = bench_enricher(MerchantEnricher(provider), service, transactions, batch_size, workers)
+    finally:
+        provider.close()
+        server.should_exit = True
+    return {
+        "benchmark": "enrichment",
+        "environment": environment(),
+        "service_latency_ms": latency_ms,
+        "per_transaction": baseline,
+        "batched_cached": batched
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="100k", help="rows: 1k, 10k, 100k, 1m, 10m or a number")
+    parser.add_argument("--baseline-rows", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    emit(run(parse_scale(args.scale), args.baseline_rows, args.batch_size, args.workers,
+             args.latency_ms, args.seed), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Ingest CPU per row with eager vs lazy transaction explanations.
+
+The eager run is the previous pipeline: every ingested row gets a
+`human_explanation` built from a fresh dict by string concatenation. The lazy
+run ingests only; explanations are rendered from the compiled templates when
+a page is shown. Each mode reports the median of several interleaved runs,
+since the difference is a few microseconds per row. Also reports the cost of
+rendering a page (the first render also catches up per-merchant stats over
+the whole history) cold and memoized, and checks that the lazy texts match the
+eager format.
+"""
+import argparse
+import gc
+import logging
+import statistics
+import sys
+import time
+
+from benchmarks.common import emit, environment, parse_scale, time_call
+from benchmarks.synthetic import generate_transactions
+from explanations import UserExplanations
+from metrics import timed
+from rollups import RollupStore
+from transaction_processor import TransactionProcessor
+from transaction_store import UserTransactionStore
+from trends import TrendStore
+
+USER = "bench"
+PAGE_SIZE = 50
+RUNS = 6
+
+
+def eager_explanation(transaction):
+    """The string concatenation explain_transaction used to do"""
+    merchant_name = transaction.get("merchant_name", "Unknown Merchant")
+    amount = transaction.get("amount", 0)
+    category = transaction.get("category", "uncategorized")
+    source_platform = transaction.get("source_platform", "Unknown Platform")
+    explanation = f"${amount:.2f} spent at {merchant_name} ({category}) via {source_platform}"
+    if transaction.get("is_first_time_vendor", False):
+        explanation += " - First time transaction with this merchant"
+    if transaction.get("is_anomaly", False):
+        avg_amount = transaction.get("avg_merchant_amount", 0)
+        explanation += f" - Unusual amount (your average is ${avg_amount:.2f})"
+    if transaction.get("is_duplicate", False):
+        explanation += " - Potential duplicate transaction"
+    return explanation
+
+
+def ingest(transactions, processor, explain):
+    """The per-event ingest path; returns (store, CPU seconds)"""
+    explain_transaction = timed("processor.explain_transaction")(eager_explanation)
+    store = UserTransactionStore(USER)
+    rollup = RollupStore().user(USER)
+    trend = TrendStore().user(USER)
+    # Collector pauses would swamp the per-row difference, as in timeit
+    gc.collect()
+    gc.disable()
+    started = time.process_time()
+    for transaction in transactions:
+        transaction["category"] = processor.categorize_transaction(
+            transaction.get("merchant_name", ""), transaction.get("description", "")
+        )
+        if explain:
+            # As the pipeline's per-row pw.apply did, through the timed processor method
+            transaction["human_explanation"] = explain_transaction({
+                "merchant_name": transaction["merchant_name"],
+                "amount": transaction["amount"],
+                "category": transaction["category"],
+                "source_platform": transaction["source_platform"],
+                "is_first_time_vendor": not store.has_merchant(transaction["merchant_name"]),
+                "is_anomaly": transaction["is_anomaly"],
+                "avg_merchant_amount": transaction.get("avg_merchant_amount", 0),
+                "is_duplicate": transaction["is_duplicate"]
+            })
+        size = len(store)
+        row = store.append(transaction)
+        if len(store) > size:
+            record = store[row]
+            rollup.apply(record)
+            trend.apply(record)
+    seconds = time.process_time() - started
+    gc.enable()
+    return store, seconds
+
+
+def matches_eager(store, explanations):
+    """Compare lazy texts for every row with the eager format given the same inputs"""
+    stats = store.merchant_stats()
+    seen = set()
+    lazy = explanations.explain(range(len(store)))
+    for record, text in zip(store, lazy):
+        expected = eager_explanation({
+            "merchant_name": record.merchant_name,
+            "amount": record.amount,
+            "category": record.category,
+            "source_platform": record.source_platform,
+            "is_first_time_vendor": record.merchant_name not in seen,
+            "is_anomaly": record.is_anomaly,
+            "avg_merchant_amount": stats[record.merchant_name]["avg_amount"],
+            "is_duplicate": record.is_duplicate
+        })
+        seen.add(record.merchant_name)
+        if text != expected:
+            return False
+    return True
+
+
+def run(rows=100_000, seed=42):
+    logging.getLogger().setLevel(logging.WARNING)
+    transactions = list(generate_transactions(rows, seed=seed))
+    processor = TransactionProcessor()
+
+    # Interleaved runs in alternating order, so warm-up and drift favour
+    # neither mode; each reports its median
+    timings = {True: [], False: []}
+    for run_index in range(RUNS):
+        for explain in ((True, False) if run_index % 2 == 0 else (False, True)):
+            store, seconds = ingest([dict(t) for t in transactions], processor, explain)
+            timings[explain].append(seconds)
+    eager_seconds = statistics.median(timings[True])
+    lazy_seconds = statistics.median(timings[False])
+
+    explanations = UserExplanations(store)
+    first_page = range(min(PAGE_SIZE, len(store)))
+    last_page = range(max(len(store) - PAGE_SIZE, 0), len(store))
+    started = time.perf_counter()
+    explanations.explain(first_page)
+    first_render_us = (time.perf_counter() - started) * 1e6
+    started = time.perf_counter()
+    explanations.explain(last_page)
+    cold_us = (time.perf_counter() - started) * 1e6
+    warm = time_call(lambda: explanations.explain(last_page), repeat=5, number=20)
+
+    eager_us = eager_seconds / rows * 1e6
+    lazy_us = lazy_seconds / rows * 1e6
+    return {
+        "benchmark": "explanations",
+        "environment": environment(),
+        "rows": rows,
+        "ingest_cpu_us_per_row": {
+            "eager": round(eager_us, 3),
+            "lazy": round(lazy_us, 3),
+            "reduction_percent": round((1 - lazy_us / eager_us) * 100, 1)
+        },
+        "page": {
+            "rows": len(last_page),
+            "first_render_us": round(first_render_us, 1),
+            "cold_us": round(cold_us, 1),
+            "memoized_us": warm["mean_us"]
+        },
+        "matches_eager": matches_eager(store, UserExplanations(store))
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="100k", help="history rows: 1k, 10k, 100k, 1m or a number")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(parse_scale(args.scale), args.seed)
+    emit(report, args.output)
+    return 0 if report["matches_eager"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""In-process HTTP load test of the read and chat endpoints.
+
+Seeds the default user's store with synthetic transactions, then drives
+/transactions, /alerts, /insights and /chat through an ASGI transport (no
+network or uvicorn involved) with a configurable number of concurrent
+clients, reporting per-endpoint latency percentiles and throughput.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import emit, environment, parse_scale, summarize
+from benchmarks.synthetic import generate_transactions
+
+USER = "user@example.com"
+HEADERS = {"Authorization": "Bearer test-token"}
+
+ENDPOINTS = [
+    ("GET", "/transactions", None),
+    ("GET", "/alerts", None),
+    ("GET", "/insights", None),
+    ("POST", "/chat", {"message": "what is my budget status"}),
+]
+
+
+def seed(app_module, rows, seed_value):
+    """Load synthetic history for the default user into the app's stores"""
+    store = app_module.transaction_store.user(USER)
+    rollup = app_module.rollups.user(USER)
+    trend = app_module.trends.user(USER)
+    for transaction in generate_transactions(rows, seed=seed_value):
+        row = store.append(transaction)
+        rollup.apply(store[row])
+        trend.apply(store[row])
+    return len(store)
+
+
+async def drive(client, method, path, params, requests, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter_ns()
+            response = await client.request(method, path, params=params, headers=HEADERS)
+            response.raise_for_status()
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stats = summarize(latencies)
+    stats["requests_per_second"] = round(requests / elapsed, 1)
+    return stats
+
+
+async def run_async(rows, requests, concurrency, seed_value):
+    import main as app_module
+
+    # Per-request INFO logging would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    seeded = seed(app_module, rows, seed_value)
+    transport = httpx.ASGITransport(app=app_module.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for method, path, params in ENDPOINTS:
+            # Warm-up request so one-time costs are not attributed to the first sample
+            await client.request(method, path, params=params, headers=HEADERS)
+            results[f"{method} {path}"] = await drive(client, method, path, params, requests, concurrency)
+    return {
+        "benchmark": "http_load",
+        "environment": environment(),
+        "rows": seeded,
+        "requests_per_endpoint": requests,
+        "concurrency": concurrency,
+        "results": results
+    }
+
+
+def run(rows=10_000, requests=200, concurrency=8, seed_value=42):
+    return asyncio.run(run_async(rows, requests, concurrency, seed_value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="1k", help="seeded rows: 1k, 10k, 100k, 1m, 10m or a number")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    emit(run(parse_scale(args.scale), args.requests, args.concurrency, args.seed), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
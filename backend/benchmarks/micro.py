@@ -0,0 +1,218 @@
+"""Microbenchmarks for the per-transaction hot paths.
+
+Covers categorization, the anomaly detectors (against both a list-of-dicts
+history and the columnar store), MockKNNIndex.search, prompt building,
+the hybrid search index and the streaming trend engine, and reports the
+columnar store's memory per row against the same history as dicts.
+History-dependent benchmarks scale with --scale; list-of-dicts baselines
+use at most MAX_LIST_ROWS of it, so large scales fit in memory.
+"""
+import argparse
+import sys
+from collections import Counter
+from datetime import datetime
+
+from anomaly_detector import AnomalyDetector
+from benchmarks.common import emit, environment, parse_scale, time_call
+from benchmarks.synthetic import generate_transactions
+from rag_chatbot import FinancialRAGChatbot, generate_contextual_response
+from search_index import UserSearchIndex
+from transaction_processor import TransactionProcessor
+from transaction_store import UserTransactionStore
+from trends import UserTrends
+
+# MockKNNIndex.search is a pure-Python scan over 1536-d vectors, so cap the index size
+MAX_INDEX_ROWS = 2_000
+
+# Rows used to derive the time-of-day probabilities the time detector consumes
+TIME_PATTERN_ROWS = 50_000
+
+# The history is streamed into the store; list-of-dicts baselines (list
+# scans, dict memory) use at most this many leading rows
+MAX_LIST_ROWS = 100_000
+
+
+def build_time_patterns(history):
+    """Per-merchant probability of each (weekday, hour) slot, keyed like AnomalyDetector expects"""
+    slots = Counter()
+    merchants = Counter()
+    for tx in history[:TIME_PATTERN_ROWS]:
+        ts = datetime.strptime(tx["timestamp"], '%Y-%m-%d %H:%M:%S')
+        slots[f"{tx['merchant_name']}_{ts.weekday()}_{ts.hour}"] += 1
+        merchants[tx["merchant_name"]] += 1
+    return {key: count / merchants[key.rsplit("_", 2)[0]] for key, count in slots.items()}
+
+
+def bench_categorize(processor, sample, repeat):
+    def run():
+        for tx in sample:
+            processor.categorize_transaction(tx["merchant_name"], tx["description"])
+    stats = time_call(run, repeat=repeat)
+    return _per_row(stats, len(sample))
+
+
+def bench_detectors(detector, history_list, history_store, sample, repeat):
+    merchant_stats = history_store.merchant_stats()
+    time_patterns = build_time_patterns(history_list)
+    results = {}
+
+    def amount():
+        for tx in sample:
+            detector.detect_amount_anomalies(tx, merchant_stats.get(tx["merchant_name"]))
+    results["detect_amount_anomalies"] = _per_row(time_call(amount, repeat=repeat), len(sample))
+
+    def time_pattern():
+        for tx in sample:
+            detector.detect_time_pattern_anomalies(tx, time_patterns)
+    results["detect_time_pattern_anomalies"] = _per_row(time_call(time_pattern, repeat=repeat), len(sample))
+
+    # New-merchant checks scan the whole history when it is a list
+    unseen = dict(sample[0], merchant_name="Never Seen Before")
+
+    def new_merchant_list():
+        detector.detect_new_merchant_anomalies(unseen, history_list)
+    results["detect_new_merchant_anomalies[list]"] = time_call(new_merchant_list, repeat=repeat)
+
+    def new_merchant_store():
+        detector.detect_new_merchant_anomalies(unseen, history_store)
+    results["detect_new_merchant_anomalies[store]"] = time_call(new_merchant_store, repeat=repeat, number=100)
+
+    def merchant_stats_store():
+        history_store.merchant_stats()
+    results["merchant_stats[store]"] = time_call(merchant_stats_store, repeat=repeat)
+    return results
+
+
+def bench_knn_search(history_list, repeat):
+    from main import MockKNNIndex, MockOpenAIEmbedder
+
+    rows = history_list[:MAX_INDEX_ROWS]
+    embedder = MockOpenAIEmbedder()
+    embeddings = embedder(
+        [f"{tx['merchant_name']} {tx['description']} {tx['category']}" for tx in rows],
+        [tx["transaction_id"] for tx in rows]
+    )
+    index = MockKNNIndex(embeddings)
+    query = next(iter(embeddings.values()))
+    stats = time_call(lambda: index.search(query, k=5), repeat=repeat)
+    stats["index_rows"] = len(rows)
+    return stats
+
+
+def bench_prompts(sample, history_store, repeat):
+    chatbot = FinancialRAGChatbot()
+    docs = [str(tx) for tx in sample[:5]]
+    context_data = {"transactions": history_store}
+    return {
+        "generate_prompt": time_call(lambda: chatbot.generate_prompt("What did I spend on food?", docs),
+                                     repeat=repeat, number=1000),
+        "generate_contextual_response": time_call(
+            lambda: generate_contextual_response("who is amazon", context_data), repeat=repeat
+        )
+    }
+
+
+def bench_search(history_store, repeat):
+    index = UserSearchIndex(history_store)
+    results = {"search_index.build": time_call(lambda: UserSearchIndex(history_store).sync(), repeat=1)}
+    index.sync()
+    for query in ("what was that AMZN charge", "starbucks $6.50", "netflix last month", "over $500 last week"):
+        results[f"search_index.search[{query}]"] = time_call(lambda: index.search(query, k=5), repeat=repeat)
+    results["generate_contextual_response[hybrid]"] = time_call(
+        lambda: generate_contextual_response("who is amazon", {"search_index": index}), repeat=repeat
+    )
+    return results
+
+
+def bench_trends(history_store, repeat):
+    # Row views are created while replaying, so no list of records is held
+    def replay():
+        trends = UserTrends("bench")
+        for record in history_store:
+            trends.apply(record)
+        return trends
+
+    trends = replay()
+    return {
+        "trends.apply": _per_row(time_call(replay, repeat=repeat), len(history_store)),
+        "trends.insights": time_call(trends.insights, repeat=repeat)
+    }
+
+
+def deep_sizeof(objects):
+    """Bytes held by a list of dicts, counting each distinct object once"""
+    seen = set()
+    total = sys.getsizeof(objects)
+    for obj in objects:
+        for item in (obj, *obj.values()):
+            if id(item) not in seen:
+                seen.add(id(item))
+                total += sys.getsizeof(item)
+    return total
+
+
+def bench_memory(history_list, history_store):
+    """Store footprint (columns, ids, id index and every pooled string) against the same rows as dicts"""
+    # The benchmark store is the only user of its pools, so they count in full
+    pool_bytes = history_store.pools.nbytes()
+    store_per_row = (history_store.nbytes() + pool_bytes) / len(history_store)
+    dicts_per_row = deep_sizeof(history_list) / len(history_list)
+    return {
+        "memory": {
+            "store_bytes_per_row": round(store_per_row, 1),
+            "shared_pool_bytes": pool_bytes,
+            "dicts_bytes_per_row": round(dicts_per_row, 1),
+            "dicts_rows_measured": len(history_list),
+            "ratio": round(dicts_per_row / store_per_row, 2)
+        }
+    }
+
+
+def _per_row(stats, rows):
+    stats = {key: (round(value / rows, 3) if key.endswith("_us") else value) for key, value in stats.items()}
+    stats["rows_per_sample"] = rows
+    return stats
+
+
+def run(rows=10_000, sample_size=1_000, repeat=5, seed=42):
+    history_store = UserTransactionStore("bench")
+    history_list = []
+    for transaction in generate_transactions(rows, seed=seed):
+        if len(history_list) < MAX_LIST_ROWS:
+            history_list.append(transaction)
+        history_store.append(transaction)
+    sample = history_list[:sample_size]
+
+    return {
+        "benchmark": "micro",
+        "environment": environment(),
+        "rows": rows,
+        "list_rows": len(history_list),
+        "sample_size": len(sample),
+        "results": {
+            "categorize_transaction": bench_categorize(TransactionProcessor(), sample, repeat),
+            **bench_detectors(AnomalyDetector(), history_list, history_store, sample, repeat),
+            "MockKNNIndex.search": bench_knn_search(history_list, repeat),
+            **bench_prompts(sample, history_store, repeat),
+            **bench_search(history_store, repeat),
+            **bench_trends(history_store, repeat),
+            **bench_memory(history_list, history_store)
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", default="10k", help="history rows: 1k, 10k, 100k, 1m, 10m or a number")
+    parser.add_argument("--sample", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    emit(run(parse_scale(args.scale), args.sample, args.repeat, args.seed), args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Restart-to-ready: full history replay vs checkpoint restore plus WAL tail.
+
+For each history size, builds the per-user store, rollups and trends,
+takes a checkpoint, ingests a fixed-size tail that only reaches the WAL,
+and then measures how long fresh registries take to come back to the same
+state: by replaying every row (what a restart cost without checkpoints)
+and by restoring the snapshots and replaying just the tail.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+
+from benchmarks.common import emit, environment, parse_scale
+from benchmarks.synthetic import generate_transactions
+from checkpoint import CheckpointManager
+from rollups import RollupStore
+from transaction_store import TransactionStore
+from trends import TrendStore
+
+BATCH_SIZE = 100
+USER = "bench"
+
+
+class State:
+    def __init__(self):
+        self.transaction_store = TransactionStore()
+        self.rollups = RollupStore()
+        self.trends = TrendStore()
+
+    def apply(self, user_id, transactions):
+        store = self.transaction_store.user(user_id)
+        rollup = self.rollups.user(user_id)
+        trend = self.trends.user(user_id)
+        for transaction in transactions:
+            size = len(store)
+            row = store.append(transaction)
+            if len(store) > size:
+                rollup.apply(store[row])
+                trend.apply(store[row])
+
+    def manager(self, directory):
+        return CheckpointManager(directory, self.transaction_store, self.rollups, self.trends)
+
+    def fingerprint(self):
+        store = self.transaction_store.user(USER)
+        return (len(store), store.version, self.rollups.user(USER).balance_minor,
+                self.trends.user(USER).version)
+
+
+def batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def run_scale(rows, tail, seed):
+    transactions = list(generate_transactions(rows + tail, seed=seed))
+    history, recent = transactions[:rows], transactions[rows:]
+
+    with tempfile.TemporaryDirectory() as directory:
+        live = State()
+        manager = live.manager(directory)
+        manager.restore(live.apply)
+        for batch in batches(history):
+            manager.log(USER, batch)
+            live.apply(USER, batch)
+        started = time.perf_counter()
+        checkpoint = manager.capture()
+        capture_seconds = time.perf_counter() - started
+        manager.commit(checkpoint)
+        checkpoint_seconds = time.perf_counter() - started
+        snapshot_bytes = sum(len(data) for _, data in checkpoint.users.values())
+        for batch in batches(recent):
+            manager.log(USER, batch)
+            live.apply(USER, batch)
+        manager.close()
+
+        replayed = State()
+        started = time.perf_counter()
+        for batch in batches(transactions):
+            replayed.apply(USER, batch)
+        replay_seconds = time.perf_counter() - started
+
+        restored = State()
+        started = time.perf_counter()
+        stats = restored.manager(directory).restore(restored.apply)
+        restore_seconds = time.perf_counter() - started
+
+    return {
+        "history_rows": rows,
+        "wal_tail_rows": tail,
+        "snapshot_bytes": snapshot_bytes,
+        "checkpoint_capture_ms": round(capture_seconds * 1000, 2),
+        "checkpoint_total_ms": round(checkpoint_seconds * 1000, 2),
+        "full_replay_ms": round(replay_seconds * 1000, 2),
+        "restore_ms": round(restore_seconds * 1000, 2),
+        "restore_snapshot_ms": round(stats["snapshot_seconds"] * 1000, 2),
+        "restore_wal_rows": stats["wal_rows"],
+        "speedup": round(replay_seconds / restore_seconds, 1),
+        "state_matches": restored.fingerprint() == live.fingerprint() == replayed.fingerprint()
+    }
+
+
+def run(scales=(10_000, 100_000), tail=2_000, seed=42):
+    logging.getLogger().setLevel(logging.WARNING)
+    return {
+        "benchmark": "restore",
+        "environment": environment(),
+        "results": [run_scale(rows, tail, seed) for rows in scales]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10k,100k",
+                        help="comma-separated history sizes: 1k, 10k, 100k, 1m, 10m or numbers")
+    parser.add_argument("--tail", type=int, default=2_000, help="rows ingested after the checkpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run([parse_scale(scale) for scale in args.scales.split(",")], args.tail, args.seed)
+    emit(report, args.output)
+    return 0 if all(result["state_matches"] for result in report["results"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Multi-worker throughput and live rebalancing of a user-sharded cluster.
+
+For each worker count, starts `python sharding.py` (router plus shard
+workers) as a subprocess, seeds synthetic history for many users directly
+on their owning shards, and drives a mixed /insights, /budget and /chat load
+through the router with per-user test tokens, reporting throughput and
+latency. The rebalance run then adds a shard while the load keeps going and
+checks that only the users the new ring assigns to it moved, that their
+rows survived the move and that no request failed.
+
+Throughput only scales with workers when there are cores to run them on;
+the report includes the CPU count.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from auth import DEMO_USER
+from benchmarks.common import emit, environment, summarize
+from benchmarks.synthetic import generate_transactions
+from sharding import SECRET_HEADER, HashRing
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRET = "benchmark-secret"
+SEED_BATCH_SIZE = 500
+
+REQUESTS = [
+    ("GET", "/insights", None),
+    ("GET", "/budget", None),
+    ("POST", "/chat", {"message": "what is my budget status"}),
+]
+
+
+def user_headers(user_id):
+    return {"Authorization": f"Bearer test-token:{user_id}"}
+
+
+def start_cluster(workers, port, base_port):
+    env = dict(os.environ, FINAI_ALLOW_TEST_USERS="1", FINAI_SHARD_SECRET=SECRET)
+    env.pop("FINAI_CHECKPOINT_DIR", None)
+    return subprocess.Popen(
+        [sys.executable, "sharding.py", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(port), "--base-port", str(base_port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+async def wait_ready(client, process, timeout=180):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Cluster exited with {process.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Cluster did not become ready")
+
+
+async def seed(client, users, rows_per_user, seed_value):
+    """Ingest each user's history on the shard that owns it"""
+    shards = (await client.get("/shards")).json()["shards"]
+    ring = HashRing(list(shards))
+    transactions = list(generate_transactions(len(users) * rows_per_user, seed=seed_value))
+    async with httpx.AsyncClient(timeout=120.0) as direct:
+        for index, user_id in enumerate(users):
+            history = [
+                dict(transaction, transaction_id=f"{user_id}-{transaction['transaction_id']}")
+                for transaction in transactions[index * rows_per_user:(index + 1) * rows_per_user]
+            ]
+            for start in range(0, len(history), SEED_BATCH_SIZE):
+                response = await direct.post(
+                    shards[ring.owner(user_id)] + "/internal/ingest",
+                    json={"user_id": user_id, "transactions": history[start:start + SEED_BATCH_SIZE]},
+                    headers={SECRET_HEADER: SECRET}
+                )
+                response.raise_for_status()
+    return ring
+
+
+async def drive(client, users, requests, concurrency, seed_value, stop=None):
+    """Send `requests` random (user, endpoint) requests, or keep going until `stop` is set"""
+    rng = random.Random(seed_value)
+    latencies = []
+    errors = []
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        while (sent < requests) if stop is None else not stop.is_set():
+            sent += 1
+            user_id = rng.choice(users)
+            method, path, params = rng.choice(REQUESTS)
+            started = time.perf_counter_ns()
+            try:
+                response = await client.request(method, path, params=params, headers=user_headers(user_id))
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+            except httpx.HTTPError as e:
+                errors.append(type(e).__name__)
+            latencies.append((time.perf_counter_ns() - started) / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stats = summarize(latencies)
+    stats["requests_per_second"] = round(len(latencies) / elapsed, 1)
+    stats["errors"] = len(errors)
+    return stats
+
+
+async def row_counts(client, users):
+    counts = {}
+    for user_id in users:
+        response = await client.get("/transactions", headers=user_headers(user_id))
+        counts[user_id] = len(response.json()["transactions"])
+    return counts
+
+
+async def rebalance(client, users, ring, concurrency, seed_value):
+    before = await row_counts(client, users)
+    stop = asyncio.Event()
+    load = asyncio.create_task(drive(client, users, 0, concurrency, seed_value, stop))
+    started = time.perf_counter()
+    response = await client.post("/shards", headers={SECRET_HEADER: SECRET}, timeout=300.0)
+    add_seconds = time.perf_counter() - started
+    stop.set()
+    during = await load
+    response.raise_for_status()
+    result = response.json()
+
+    new_ring = ring.with_shard(result["shard"])
+    # Every shard worker seeds the demo user if it owns it, so it may move too
+    expected = sum(ring.owner(user_id) != new_ring.owner(user_id) for user_id in users + [DEMO_USER])
+    after = await row_counts(client, users)
+    return {
+        "shards_before": len(ring.shards),
+        "moved_users": result["moved_users"],
+        "expected_moved_users": expected,
+        "moved_fraction": round(result["moved_users"] / len(users), 3),
+        "handoff_seconds": result["handoff_seconds"],
+        "add_shard_seconds": round(add_seconds, 3),
+        "rows_preserved": before == after,
+        "load_during_rebalance": during
+    }
+
+
+async def run_cluster(workers, users, rows_per_user, requests, concurrency, seed_value, port,
+                      rebalance_users=False):
+    process = start_cluster(workers, port, port + 100)
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120.0,
+                                     limits=limits) as client:
+            await wait_ready(client, process)
+            ring = await seed(client, users, rows_per_user, seed_value)
+            # Warm the per-user indexes and response caches before timing
+            await drive(client, users, len(users) * len(REQUESTS), concurrency, seed_value)
+            result = {
+                "workers": workers,
+                "load": await drive(client, users, requests, concurrency, seed_value + 1)
+            }
+            if rebalance_users:
+                result["rebalance"] = await rebalance(client, users, ring, concurrency, seed_value + 2)
+            return result
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+
+
+def run(workers=(1, 2, 4), users=200, rows_per_user=200, requests=2_000, concurrency=32, seed=42,
+        port=8700):
+    logging.getLogger().setLevel(logging.WARNING)
+    user_ids = [f"bench-user-{i}" for i in range(users)]
+    results = [
+        asyncio.run(run_cluster(count, user_ids, rows_per_user, requests, concurrency, seed, port))
+        for count in workers
+    ]
+    baseline = results[0]["load"]["requests_per_second"]
+    for result in results:
+        result["speedup"] = round(result["load"]["requests_per_second"] / baseline, 2)
+    rebalance_result = asyncio.run(run_cluster(
+        2, user_ids, rows_per_user, requests, concurrency, seed, port, rebalance_users=True
+    ))["rebalance"]
+    return {
+        "benchmark": "sharding",
+        "environment": environment(),
+        "cpus": os.cpu_count(),
+        "users": users,
+        "rows_per_user": rows_per_user,
+        "concurrency": concurrency,
+        "results": results,
+        "rebalance": rebalance_result
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rows-per-user", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8700, help="router port; workers use port+100 and up")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run([int(count) for count in args.workers.split(",")], args.users, args.rows_per_user,
+                 args.requests, args.concurrency, args.seed, args.port)
+    emit(report, args.output)
+    rebalanced = report["rebalance"]
+    ok = (rebalanced["rows_preserved"] and rebalanced["moved_users"] == rebalanced["expected_moved_users"]
+          and rebalanced["load_during_rebalance"]["errors"] == 0
+          and all(result["load"]["errors"] == 0 for result in report["results"]))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Local stand-in for the merchant enrichment service.
+
+Answers POST /merchants/lookup for the synthetic generator's merchants (by
+canonical name) and omits everything else, with optional per-request
+latency. Counts requests and merchants looked up so callers can check how
+many external lookups a pipeline really makes.
+
+    python -m benchmarks.standin_enrichment --port 9200
+"""
+import argparse
+import sys
+import threading
+import time
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from benchmarks.synthetic import MERCHANTS, SUBSCRIPTIONS
+from enrichment import canonical_merchant
+
+INDUSTRIES = {
+    "food": "Restaurants",
+    "grocery": "Grocery",
+    "shopping": "Retail",
+    "transportation": "Transportation",
+    "utilities": "Utilities",
+    "healthcare": "Healthcare",
+    "entertainment": "Entertainment",
+    "subscription": "Digital Services",
+}
+
+
+class LookupRequest(BaseModel):
+    merchants: list[str]
+
+
+class StandinEnrichmentService:
+    def __init__(self, latency_ms=0.0, merchants=None):
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self.merchants_looked_up = 0
+        self._lock = threading.Lock()
+        if merchants is None:
+            merchants = [(name, category) for name, category, _, _ in MERCHANTS + SUBSCRIPTIONS]
+        self.profiles = {
+            canonical_merchant(name): {
+                "reputation_score": 3.5 + (len(name) % 15) / 10,
+                "is_verified": True,
+                "industry": INDUSTRIES.get(category, "Other"),
+                "has_fraud_reports": False,
+                "sentiment_score": 0.6,
+                "sentiment_label": "positive",
+                "news_context": None
+            }
+            for name, category in merchants
+        }
+        self.app = self._build_app()
+
+    def _build_app(self):
+        app = FastAPI(title="Stand-in merchant enrichment")
+
+        # Sync handler: FastAPI runs it in a worker thread, so the simulated
+        # latency does not serialize concurrent requests
+        @app.post("/merchants/lookup")
+        def lookup(request: LookupRequest):
+            with self._lock:
+                self.requests += 1
+                self.merchants_looked_up += len(request.merchants)
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            return {"results": {m: self.profiles[m] for m in request.merchants if m in self.profiles}}
+
+        return app
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=9200)
+    args = parser.parse_args(argv)
+
+    uvicorn.run(StandinEnrichmentService(args.latency_ms).app, host="127.0.0.1", port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Local stand-in servers for the open-banking, card and UPI feeds.
+
+Serves deterministic per-account transaction histories through the same
+paging schemes the connectors in api_integration.py speak, with optional
+latency and transient-failure injection. Use it in-process through
+`httpx.ASGITransport(app=feeds.app)`, or run it as a real server:
+
+    python -m benchmarks.standin_feeds --accounts 100 --port 9100
+"""
+import argparse
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
+
+from benchmarks.synthetic import MERCHANTS, DEFAULT_START
+from transaction_store import format_timestamp
+
+
+class StandinFeeds:
+    """In-memory feed provider backing the three stand-in APIs"""
+
+    def __init__(self, accounts=(), records_per_account=100, latency_ms=0.0,
+                 failure_rate=0.0, seed=42):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._records = {}
+        self._positions = {}
+        for account_id in accounts:
+            self.add_records(account_id, records_per_account)
+        self.app = self._build_app()
+
+    def add_records(self, account_id, count):
+        """Append `count` new records to an account's history"""
+        records = self._records.setdefault(account_id, [])
+        positions = self._positions.setdefault(account_id, {})
+        for _ in range(count):
+            merchant, _, typical, description = self._rng.choice(MERCHANTS)
+            index = len(records)
+            record = {
+                "id": f"{account_id}-{index:07d}",
+                "amount": -round(typical * self._rng.uniform(0.5, 1.5), 2),
+                "merchant": merchant,
+                "description": description,
+                "timestamp": format_timestamp(DEFAULT_START + index * 3600)
+            }
+            positions[record["id"]] = index
+            records.append(record)
+
+    def _page(self, account_id, start, limit):
+        if account_id not in self._records:
+            raise HTTPException(status_code=404, detail="Unknown account")
+        records = self._records[account_id]
+        page = records[start:start + limit]
+        return page, start + len(page), start + len(page) < len(records)
+
+    async def _simulate(self):
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            self.failures += 1
+            return JSONResponse({"detail": "Temporarily unavailable"}, status_code=503,
+                                headers={"Retry-After": "0"})
+        return None
+
+    def _build_app(self):
+        app = FastAPI(title="Stand-in financial feeds")
+
+        @app.get("/accounts/{account_id}/transactions")
+        async def open_banking(account_id: str, limit: int = 100, since: str = Query(None)):
+            failure = await self._simulate()
+            if failure is not None:
+                return failure
+            page, end, has_more = self._page(account_id, int(since or 0), limit)
+            return {"transactions": page, "next_since": str(end), "has_more": has_more}
+
+        @app.get("/cards/{account_id}/transactions")
+        async def card_feed(account_id: str, limit: int = 100, after_id: str = Query(None)):
+            failure = await self._simulate()
+            if failure is not None:
+                return failure
+            start = self._positions.get(account_id, {}).get(after_id, -1) + 1
+            page, _, has_more = self._page(account_id, start, limit)
+            return {"data": page, "has_more": has_more}
+
+        @app.get("/upi/{account_id}/payments")
+        async def upi(account_id: str, page_size: int = 100, since_token: str = Query(None)):
+            failure = await self._simulate()
+            if failure is not None:
+                return failure
+            page, end, has_more = self._page(account_id, int(since_token or 0), page_size)
+            return {"payments": page, "next_token": str(end), "more": has_more}
+
+        return app
+
+
+def serve_in_thread(app, port=0):
+    """Run `app` under uvicorn in a daemon thread and return (server, base_url)"""
+    import socket
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", port))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--records", type=int, default=100, help="records per account")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args(argv)
+
+    feeds = StandinFeeds([f"acct_{i}" for i in range(args.accounts)], args.records,
+                         args.latency_ms, args.failure_rate)
+    uvicorn.run(feeds.app, host="127.0.0.1", port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Startup-time benchmark based on `python -X importtime`.
+
+Measures how long `import main` takes in a fresh interpreter, lists the
+heaviest imports, and checks that pathway/openai are not pulled in at import
+time. Exits non-zero when the median import time exceeds `--budget-ms` or a
+deferred module was imported eagerly, so it can gate regressions in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import emit, environment
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported once they are actually used
+DEFERRED_MODULES = ("pathway", "openai")
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure_import(module="main"):
+    """Import `module` in a fresh interpreter and return its importtime report"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def run(runs=5, top=10, module="main"):
+    samples = []
+    timings = {}
+    for _ in range(runs):
+        timings = measure_import(module)
+        samples.append(timings[module][1] / 1000)
+
+    heaviest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    eager = sorted(
+        name for name in timings
+        if name.split(".")[0] in DEFERRED_MODULES
+    )
+    return {
+        "benchmark": "startup",
+        "environment": environment(),
+        "module": module,
+        "runs": runs,
+        "import_ms": {
+            "median": round(statistics.median(samples), 2),
+            "min": round(min(samples), 2),
+            "max": round(max(samples), 2)
+        },
+        "heaviest_self_ms": {name: round(self_us / 1000, 2) for name, (self_us, _) in heaviest},
+        "eagerly_imported_deferred_modules": eager
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="fail if the median import time exceeds this budget")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.top, args.module)
+    emit(report, args.output)
+
+    failed = bool(report["eagerly_imported_deferred_modules"])
+    if args.budget_ms is not None and report["import_ms"]["median"] > args.budget_ms:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Seeded synthetic generator of realistic multi-platform transactions.
+
+Produces a roughly time-ordered stream of bank, card and GPay transactions for a
+set of users, including monthly subscriptions, salary credits, cross-platform
+duplicates and amount anomalies. The stream is a generator so it can feed
+10M-row benchmarks without materializing them.
+"""
+import random
+from datetime import datetime, timezone
+
+from transaction_store import format_timestamp
+
+# (merchant_name, category, typical_amount, description)
+MERCHANTS = [
+    ("Starbucks", "food", 6.5, "Coffee"),
+    ("Chipotle", "food", 14.0, "Lunch"),
+    ("DoorDash", "food", 32.0, "Food delivery"),
+    ("Amazon", "shopping", 45.0, "Online order"),
+    ("Walmart", "shopping", 70.0, "Store purchase"),
+    ("Target", "shopping", 55.0, "Store purchase"),
+    ("Whole Foods", "grocery", 85.0, "Groceries"),
+    ("Kroger", "shopping", 60.0, "Groceries"),
+    ("Uber", "transportation", 18.0, "Ride"),
+    ("Shell", "transportation", 40.0, "Gas station"),
+    ("Comcast", "utilities", 80.0, "Internet bill"),
+    ("CVS", "shopping", 25.0, "Pharmacy"),
+    ("City Clinic", "healthcare", 120.0, "Doctor copay"),
+    ("Ticketmaster", "entertainment", 90.0, "Concert tickets"),
+]
+
+# (merchant_name, category, amount, description) charged monthly
+SUBSCRIPTIONS = [
+    ("Netflix", "entertainment", 15.99, "Monthly subscription"),
+    ("Spotify", "entertainment", 9.99, "Monthly subscription"),
+    ("Adobe", "subscription", 54.99, "Creative Cloud membership"),
+    ("Planet Fitness", "subscription", 24.99, "Gym membership"),
+]
+
+PLATFORMS = ["bank", "credit_card", "gpay"]
+
+DEFAULT_START = int(datetime(2023, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+class SyntheticTransactionGenerator:
+    """Deterministic stream of synthetic transactions for a set of users"""
+
+    def __init__(self, users=1, seed=42, start=DEFAULT_START, per_user_per_day=4.0,
+                 duplicate_rate=0.01, anomaly_rate=0.005, salary=4200.0):
+        self.users = [f"user_{i}" for i in range(users)]
+        self.seed = seed
+        self.start = start
+        self.per_user_per_day = per_user_per_day
+        self.duplicate_rate = duplicate_rate
+        self.anomaly_rate = anomaly_rate
+        self.salary = salary
+
+    def __iter__(self):
+        return self.generate()
+
+    def generate(self, count=None):
+        """Yield `count` transactions (forever if None), roughly in timestamp order"""
+        rng = random.Random(self.seed)
+        mean_gap = 86400.0 / (self.per_user_per_day * len(self.users))
+        clock = float(self.start)
+        month = None
+        emitted = 0
+        sequence = 0
+
+        while count is None or emitted < count:
+            clock += rng.expovariate(1.0 / mean_gap)
+            current_month = datetime.fromtimestamp(int(clock), timezone.utc).strftime("%Y-%m")
+            batch = []
+
+            if current_month != month:
+                month = current_month
+                for user_id in self.users:
+                    batch.append(self._make(user_id, "ACME Payroll", "finance", self.salary,
+                                            "Salary", "bank", clock, "credit"))
+                    for merchant, category, amount, description in SUBSCRIPTIONS:
+                        batch.append(self._make(user_id, merchant, category, amount,
+                                                description, "credit_card", clock + rng.uniform(0, 3600)))
+
+            user_id = rng.choice(self.users)
+            merchant, category, typical, description = rng.choice(MERCHANTS)
+            amount = round(max(rng.lognormvariate(0, 0.35) * typical, 0.5), 2)
+            transaction = self._make(user_id, merchant, category, amount, description,
+                                     rng.choice(PLATFORMS), clock)
+            if rng.random() < self.anomaly_rate:
+                transaction["amount"] = round(amount * rng.uniform(8, 20), 2)
+                transaction["is_anomaly"] = True
+            batch.append(transaction)
+
+            if rng.random() < self.duplicate_rate:
+                # Same purchase reported again by another platform a few minutes later
+                duplicate = dict(transaction)
+                duplicate["source_platform"] = rng.choice([p for p in PLATFORMS if p != transaction["source_platform"]])
+                duplicate["timestamp"] = format_timestamp(int(clock + rng.uniform(30, 600)))
+                duplicate["is_duplicate"] = True
+                batch.append(duplicate)
+
+            for transaction in batch:
+                if count is not None and emitted >= count:
+                    return
+                sequence += 1
+                transaction["transaction_id"] = f"syn_{self.seed}_{sequence}"
+                emitted += 1
+                yield transaction
+
+    @staticmethod
+    def _make(user_id, merchant, category, amount, description, platform, epoch,
+              transaction_type="debit"):
+        return {
+            "transaction_id": None,
+            "user_id": user_id,
+            "amount": amount,
+            "merchant_name": merchant,
+            "description": description,
+            "category": category,
+            "timestamp": format_timestamp(int(epoch)),
+            "source_platform": platform,
+            "transaction_type": transaction_type,
+            "is_anomaly": False,
+            "is_duplicate": False
+        }
+
+
+def generate_transactions(count, users=1, seed=42, **kwargs):
+    """Convenience wrapper returning a generator of `count` synthetic transactions"""
+    return SyntheticTransactionGenerator(users=users, seed=seed, **kwargs).generate(count)
@@ -0,0 +1,469 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from enrichment import MerchantEnrichment
+from http_cache import dumps
+from metrics import increment, timer
+from transaction_store import TransactionRecord, UserTransactionStore
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - optional speedup
+    loads = json.loads
+
+# Per-user snapshot: magic, metadata length and a CRC32 of everything after
+# the header, then JSON metadata followed by the raw id and column bytes
+SNAPSHOT_MAGIC = b"FINAISN1"
+SNAPSHOT_HEADER = struct.Struct("<8sII")
+
+# WAL record: payload length and CRC32, then a JSON payload
+WAL_RECORD_HEADER = struct.Struct("<II")
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+# A checkpoint is due once this many logged rows are pending, or after the
+# interval with any pending row. This bounds the tail replayed on boot
+# (roughly 50us per row) independently of how much history the snapshots hold.
+CHECKPOINT_WAL_ROWS = 20_000
+CHECKPOINT_INTERVAL_SECONDS = 300
+
+# Separates transaction ids in the snapshot's id blob
+ID_SEPARATOR = "\x00"
+
+
+class CheckpointError(Exception):
+    pass
+
+
+def _write_atomic(path, data, fsync=False):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _user_key(user_id):
+    # User ids are e-mail addresses and the like; keep file names portable
+    return hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_enrichment(record):
+    return None if record is None else dataclasses.asdict(record)
+
+
+def decode_enrichment(state):
+    return None if state is None else MerchantEnrichment(**state)
+
+
+def decode_enrichments(metadata):
+    """Merchant name -> enrichment record from snapshot metadata"""
+    return {name: decode_enrichment(state) for name, state in metadata.get("enrichments", {}).items()}
+
+
+def encode_user_snapshot(store, rollup, trends):
+    """Serialize one user's store columns, rollups and trends to bytes"""
+    blobs = [ID_SEPARATOR.join(store.transaction_ids).encode("utf-8")]
+    blobs.extend(getattr(store, name).tobytes() for name in store.COLUMNS)
+    metadata = dumps({
+        "user_id": store.user_id,
+        "version": store.version,
+        "rows": len(store),
+        "byteorder": sys.byteorder,
+        "typecodes": [getattr(store, name).typecode for name in store.COLUMNS],
+        "sizes": [len(blob) for blob in blobs],
+        "rollup": rollup.to_state(),
+        "trends": trends.to_state(),
+        "descriptions": store.description_pool.values(),
+        "enrichments": {name: encode_enrichment(record) for name, record in store.enrichments_by_name().items()}
+    })
+    body = metadata + b"".join(blobs)
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(metadata), zlib.crc32(body)) + body
+
+
+def decode_user_snapshot(data):
+    """Parse a snapshot into (metadata, transaction_ids, {column: bytes})"""
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise CheckpointError("Truncated snapshot")
+    magic, metadata_length, crc = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise CheckpointError("Not a snapshot file")
+    body = memoryview(data)[SNAPSHOT_HEADER.size:]
+    if zlib.crc32(body) != crc:
+        raise CheckpointError("Snapshot checksum mismatch")
+
+    metadata = loads(bytes(body[:metadata_length]))
+    blobs = []
+    offset = metadata_length
+    for size in metadata["sizes"]:
+        blobs.append(body[offset:offset + size])
+        offset += size
+
+    transaction_ids = bytes(blobs[0]).decode("utf-8").split(ID_SEPARATOR) if metadata["rows"] else []
+    columns = {}
+    for name, typecode, blob in zip(UserTransactionStore.COLUMNS, metadata["typecodes"], blobs[1:]):
+        if metadata["byteorder"] != sys.byteorder:
+            swapped = array(typecode)
+            swapped.frombytes(blob)
+            swapped.byteswap()
+            blob = swapped.tobytes()
+        columns[name] = blob
+    return metadata, transaction_ids, columns
+
+
+class WriteAheadLog:
+    """Append-only log of the transaction batches ingested since the last checkpoint.
+
+    The log is split into numbered segments (wal-00000042.log). Each
+    checkpoint starts a new segment, and older segments are deleted once
+    the manifest naming the new one is on disk. A torn record at the end
+    of a segment (a crash mid-write) ends replay of that segment.
+    """
+
+    def __init__(self, directory, fsync=False):
+        self.directory = directory
+        self.fsync = fsync
+        self.segment = None
+        self._file = None
+
+    def path(self, segment):
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def segments(self):
+        return sorted(
+            int(name[4:-4]) for name in os.listdir(self.directory)
+            if name.startswith("wal-") and name.endswith(".log")
+        )
+
+    def open(self, segment):
+        self.close()
+        self.segment = segment
+        self._file = open(self.path(segment), "ab")
+
+    def append(self, user_id, transactions):
+        entries = []
+        for transaction in transactions:
+            entry = {field: transaction[field] for field in TransactionRecord.FIELDS if field in transaction}
+            if "enrichment" in transaction:
+                entry["enrichment"] = encode_enrichment(transaction["enrichment"])
+            entries.append(entry)
+        payload = dumps({"user_id": user_id, "transactions": entries})
+        self._file.write(WAL_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def read(self, segment):
+        """Yield (user_id, transactions) for each intact record in a segment"""
+        with open(self.path(segment), "rb") as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            start = offset + WAL_RECORD_HEADER.size
+            if start > len(data):
+                break
+            length, crc = WAL_RECORD_HEADER.unpack_from(data, offset)
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            record = loads(payload)
+            for transaction in record["transactions"]:
+                if "enrichment" in transaction:
+                    transaction["enrichment"] = decode_enrichment(transaction["enrichment"])
+            yield record["user_id"], record["transactions"]
+            offset = start + length
+        if offset < len(data):
+            increment("checkpoint.wal_torn")
+            logger.warning("Ignoring %d trailing bytes of torn WAL segment %s",
+                           len(data) - offset, self.path(segment))
+
+    def remove_before(self, segment):
+        for old in self.segments():
+            if old < segment:
+                os.remove(self.path(old))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Checkpoint:
+    """Snapshot bytes captured on the ingest thread, waiting to be written"""
+
+    __slots__ = ("seq", "files", "users", "pools_file", "pools_data", "pool_sizes", "state_file", "state_data",
+                 "state_versions")
+
+    def __init__(self, seq, files, users, pools_file, pools_data, pool_sizes, state_file=None, state_data=None,
+                 state_versions=None):
+        self.seq = seq
+        self.files = files
+        self.users = users
+        self.pools_file = pools_file
+        self.pools_data = pools_data
+        self.pool_sizes = pool_sizes
+        self.state_file = state_file
+        self.state_data = state_data
+        self.state_versions = state_versions
+
+
+class CheckpointManager:
+    """Incremental checkpoints of the per-user stores, rollups and trends.
+
+    Layout of `directory`:
+
+        manifest.json          the last durable checkpoint
+        pools-<seq>.json       shared string pools
+        state-<seq>.json       process-wide state (e.g. the alert pipeline)
+        user-<key>-<seq>.bin   one snapshot per user
+        wal-<seq>.log          batches ingested since checkpoint <seq>
+
+    A checkpoint rewrites only users whose data changed since their last
+    snapshot. On boot, `restore()` loads the snapshots with one `frombytes`
+    per column and replays only the WAL tail, so restart time tracks the
+    checkpoint interval rather than the length of the history.
+
+    `restore()` runs once at boot (on an empty directory too, since it opens
+    the WAL). After that, `log()` must run before a batch is applied, and
+    `capture()` on the same thread that applies batches, so snapshots are
+    consistent. `commit()` only does file I/O and may run in a worker thread.
+
+    `state` maps names to process-wide objects with a `version` and
+    `to_state()`/`restore_state()`. They are saved as of each checkpoint,
+    not logged, so changes since the last checkpoint are lost on a crash.
+    """
+
+    def __init__(self, directory, transaction_store, rollups, trends, fsync=False,
+                 max_wal_rows=CHECKPOINT_WAL_ROWS, interval=CHECKPOINT_INTERVAL_SECONDS, state=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.transaction_store = transaction_store
+        self.rollups = rollups
+        self.trends = trends
+        self.fsync = fsync
+        self.max_wal_rows = max_wal_rows
+        self.interval = interval
+        self.state = state or {}
+        self.wal = WriteAheadLog(directory, fsync)
+        self.manifest = self._read_manifest()
+        # Rows logged since the last capture, including replayed ones
+        self.pending = 0
+        self.requested = False
+        self.last_checkpoint = time.monotonic()
+        self._written = {}
+        self._pools_written = None
+        self._state_written = None
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self):
+        path = self._path(MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            manifest = loads(f.read())
+        if manifest.get("format") != FORMAT_VERSION:
+            raise CheckpointError(f"Unsupported checkpoint format {manifest.get('format')}")
+        return manifest
+
+    def _versions(self, user_id):
+        return (self.transaction_store.user(user_id).version,
+                self.rollups.user(user_id).version,
+                self.trends.user(user_id).version)
+
+    def _state_versions(self):
+        return {name: holder.version for name, holder in self.state.items()}
+
+    def restore(self, apply):
+        """Load the last checkpoint, then replay the WAL tail through `apply(user_id, transactions)`.
+
+        Must run before anything else is written to the stores. Returns
+        timing and size stats for the restart.
+        """
+        started = time.perf_counter()
+        manifest = self.manifest
+        rows = 0
+        first_segment = 0
+        with timer("checkpoint.restore_snapshots"):
+            if manifest is not None:
+                with open(self._path(manifest["pools"]), "rb") as f:
+                    pools = loads(f.read())
+                for name in self.transaction_store.pools.NAMES:
+                    getattr(self.transaction_store.pools, name).extend(pools[name])
+                self._pools_written = (self.transaction_store.pools.sizes(), manifest["pools"])
+
+                for user_id, entry in manifest["users"].items():
+                    with open(self._path(entry["file"]), "rb") as f:
+                        metadata, transaction_ids, columns = decode_user_snapshot(f.read())
+                    store = self.transaction_store.user(user_id)
+                    store.restore(transaction_ids, columns, metadata["version"], metadata["descriptions"],
+                                  decode_enrichments(metadata))
+                    self.rollups.user(user_id).restore_state(metadata["rollup"])
+                    self.trends.user(user_id).restore_state(metadata["trends"])
+                    self._written[user_id] = (self._versions(user_id), entry["file"])
+                    rows += len(store)
+
+                if manifest.get("state"):
+                    with open(self._path(manifest["state"]), "rb") as f:
+                        state = loads(f.read())
+                    for name, holder in self.state.items():
+                        if name in state:
+                            holder.restore_state(state[name])
+                    self._state_written = (self._state_versions(), manifest["state"])
+                first_segment = manifest["wal_segment"]
+        snapshot_seconds = time.perf_counter() - started
+
+        replayed = 0
+        replayed_rows = 0
+        segments = [segment for segment in self.wal.segments() if segment >= first_segment]
+        with timer("checkpoint.replay_wal"):
+            for segment in segments:
+                for user_id, transactions in self.wal.read(segment):
+                    apply(user_id, transactions)
+                    replayed += 1
+                    replayed_rows += len(transactions)
+        # Replayed rows are only covered once the next checkpoint lands
+        self.pending = replayed_rows
+        self.wal.open(segments[-1] + 1 if segments else first_segment)
+
+        stats = {
+            "users": len(manifest["users"]) if manifest else 0,
+            "rows": rows,
+            "wal_records": replayed,
+            "wal_rows": replayed_rows,
+            "snapshot_seconds": round(snapshot_seconds, 4),
+            "seconds": round(time.perf_counter() - started, 4)
+        }
+        logger.info("Restored %d users (%d rows) and replayed %d WAL records in %.3fs",
+                    stats["users"], rows, replayed, stats["seconds"])
+        return stats
+
+    def log(self, user_id, transactions):
+        """Append a batch to the WAL before it is applied"""
+        self.wal.append(user_id, transactions)
+        self.pending += len(transactions)
+        increment("checkpoint.wal_records")
+
+    def request(self):
+        """Ask for a checkpoint at the next opportunity, for changes that bypass the WAL"""
+        self.requested = True
+
+    def due(self):
+        if self.requested or self.pending >= self.max_wal_rows:
+            return True
+        changed = self.pending > 0 or (
+            self.state and (self._state_written is None or self._state_written[0] != self._state_versions())
+        )
+        return bool(changed) and time.monotonic() - self.last_checkpoint >= self.interval
+
+    def capture(self):
+        """Serialize changed users and switch the WAL to a new segment"""
+        with timer("checkpoint.capture"):
+            seq = self.wal.segment + 1
+            files = {}
+            users = {}
+            for user_id in self.transaction_store.users():
+                versions = self._versions(user_id)
+                written = self._written.get(user_id)
+                if written is not None and written[0] == versions:
+                    files[user_id] = written[1]
+                    continue
+                name = f"user-{_user_key(user_id)}-{seq:08d}.bin"
+                data = encode_user_snapshot(self.transaction_store.user(user_id),
+                                            self.rollups.user(user_id), self.trends.user(user_id))
+                files[user_id] = name
+                users[user_id] = (versions, data)
+
+            pools = self.transaction_store.pools
+            pool_sizes = pools.sizes()
+            if self._pools_written is not None and self._pools_written[0] == pool_sizes:
+                pools_file, pools_data = self._pools_written[1], None
+            else:
+                pools_file = f"pools-{seq:08d}.json"
+                pools_data = dumps({name: getattr(pools, name).values() for name in pools.NAMES})
+
+            state_file = state_data = state_versions = None
+            if self.state:
+                state_versions = self._state_versions()
+                if self._state_written is not None and self._state_written[0] == state_versions:
+                    state_file = self._state_written[1]
+                else:
+                    state_file = f"state-{seq:08d}.json"
+                    state_data = dumps({name: holder.to_state() for name, holder in self.state.items()})
+
+            self.wal.open(seq)
+            self.pending = 0
+            self.requested = False
+        return Checkpoint(seq, files, users, pools_file, pools_data, pool_sizes, state_file, state_data,
+                          state_versions)
+
+    def commit(self, checkpoint):
+        """Write captured snapshots and the manifest, then drop superseded files"""
+        with self._lock, timer("checkpoint.commit"):
+            if self.manifest is not None and self.manifest["seq"] >= checkpoint.seq:
+                return
+            written = 0
+            for user_id, (_, data) in checkpoint.users.items():
+                _write_atomic(self._path(checkpoint.files[user_id]), data, self.fsync)
+                written += len(data)
+            if checkpoint.pools_data is not None:
+                _write_atomic(self._path(checkpoint.pools_file), checkpoint.pools_data, self.fsync)
+            if checkpoint.state_data is not None:
+                _write_atomic(self._path(checkpoint.state_file), checkpoint.state_data, self.fsync)
+
+            manifest = {
+                "format": FORMAT_VERSION,
+                "seq": checkpoint.seq,
+                "wal_segment": checkpoint.seq,
+                "pools": checkpoint.pools_file,
+                "users": {user_id: {"file": name} for user_id, name in checkpoint.files.items()},
+                "state": checkpoint.state_file,
+                "created_at": time.time()
+            }
+            _write_atomic(self._path(MANIFEST_NAME), dumps(manifest), self.fsync)
+            self.manifest = manifest
+
+            # Users that left (e.g. moved to another shard) lose their snapshot
+            self._written = {user_id: entry for user_id, entry in self._written.items() if user_id in checkpoint.files}
+            for user_id, (versions, _) in checkpoint.users.items():
+                self._written[user_id] = (versions, checkpoint.files[user_id])
+            self._pools_written = (checkpoint.pool_sizes, checkpoint.pools_file)
+            if checkpoint.state_file is not None:
+                self._state_written = (checkpoint.state_versions, checkpoint.state_file)
+            self._remove_superseded(manifest)
+            self.wal.remove_before(checkpoint.seq)
+            self.last_checkpoint = time.monotonic()
+
+        increment("checkpoint.committed")
+        logger.info("Checkpoint %d: wrote %d of %d users (%d bytes)",
+                    checkpoint.seq, len(checkpoint.users), len(checkpoint.files), written)
+
+    def _remove_superseded(self, manifest):
+        live = {entry["file"] for entry in manifest["users"].values()}
+        live.update((manifest["pools"], manifest["state"]))
+        for name in os.listdir(self.directory):
+            if name.startswith(("user-", "pools-", "state-")) and name not in live:
+                os.remove(self._path(name))
+
+    def checkpoint(self):
+        self.commit(self.capture())
+
+    def close(self):
+        self.wal.close()
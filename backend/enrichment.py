@@ -0,0 +1,259 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+import httpx
+
+from metrics import increment, timer
+
+logger = logging.getLogger(__name__)
+
+# Known merchants are re-fetched after a day; unknown ones after an hour
+ENRICHMENT_TTL_SECONDS = 24 * 3600
+NEGATIVE_TTL_SECONDS = 3600
+MAX_CACHED_MERCHANTS = 50_000
+
+# Merchants per request to the enrichment service
+LOOKUP_BATCH_SIZE = 100
+
+# How long a caller waits on another caller's in-flight lookup
+SINGLE_FLIGHT_TIMEOUT_SECONDS = 30
+
+# Tokens that vary between feeds but do not identify the merchant
+_NOISE_TOKENS = {"inc", "llc", "ltd", "co", "corp", "store", "online", "com", "www", "pos", "the"}
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=MAX_CACHED_MERCHANTS)
+def canonical_merchant(merchant_name):
+    """Normalize a raw merchant string so feed variants share one key.
+
+    "AMAZON.COM*2K4 Seattle" style suffixes, store numbers and legal-entity
+    tokens are dropped: "Whole Foods Market #1234" and "WHOLE FOODS MARKET"
+    both become "whole foods market".
+    """
+    name = (merchant_name or "").lower().split("*", 1)[0]
+    tokens = [token for token in _NON_ALNUM.split(name)
+              if token and not token.isdigit() and token not in _NOISE_TOKENS]
+    return " ".join(tokens)
+
+
+@dataclass(frozen=True, slots=True)
+class MerchantEnrichment:
+    """Immutable enrichment record shared by every transaction at a merchant"""
+    merchant: str
+    reputation_score: float
+    is_verified: bool
+    industry: str
+    has_fraud_reports: bool
+    sentiment_score: float
+    sentiment_label: str
+    news_context: str = None
+
+    @classmethod
+    def from_dict(cls, merchant, data):
+        return cls(
+            merchant=merchant,
+            reputation_score=float(data.get("reputation_score", 0.0)),
+            is_verified=bool(data.get("is_verified", False)),
+            industry=data.get("industry", "Unknown"),
+            has_fraud_reports=bool(data.get("has_fraud_reports", False)),
+            sentiment_score=float(data.get("sentiment_score", 0.0)),
+            sentiment_label=data.get("sentiment_label", "neutral"),
+            news_context=data.get("news_context")
+        )
+
+    def to_dict(self):
+        """Render in the merchant_info/sentiment/news_context layout used by the API"""
+        return {
+            "merchant_info": {
+                "reputation_score": self.reputation_score,
+                "is_verified": self.is_verified,
+                "industry": self.industry,
+                "has_fraud_reports": self.has_fraud_reports
+            },
+            "sentiment": {"score": self.sentiment_score, "label": self.sentiment_label},
+            "news_context": self.news_context
+        }
+
+
+class StaticEnrichmentProvider:
+    """Offline provider returning the same mock profile for every merchant"""
+
+    # In production, this would be replaced by a merchant-data API
+    PROFILE = {
+        "reputation_score": 4.7,
+        "is_verified": True,
+        "industry": "Retail",
+        "has_fraud_reports": False,
+        "sentiment_score": 0.8,
+        "sentiment_label": "positive",
+        "news_context": None
+    }
+
+    def lookup_many(self, merchants):
+        return {merchant: self.PROFILE for merchant in merchants if merchant}
+
+
+class HTTPEnrichmentProvider:
+    """Batched lookups against an enrichment service over a pooled keep-alive client.
+
+    POST {base_url}/merchants/lookup {"merchants": [...]} answers with
+    {"results": {merchant: profile}}; merchants it does not know are omitted.
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=5.0, max_connections=8):
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+
+    def lookup_many(self, merchants):
+        response = self.client.post("/merchants/lookup", json={"merchants": list(merchants)})
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def close(self):
+        self.client.close()
+
+
+class EnrichmentCache:
+    """TTL cache of enrichment records by canonical merchant, with negative entries"""
+
+    def __init__(self, ttl=ENRICHMENT_TTL_SECONDS, negative_ttl=NEGATIVE_TTL_SECONDS,
+                 max_entries=MAX_CACHED_MERCHANTS, clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, merchant):
+        """Return (found, record); a found None record is a cached negative"""
+        with self._lock:
+            entry = self._entries.get(merchant)
+            if entry is None:
+                return False, None
+            expires_at, record = entry
+            if expires_at <= self.clock():
+                del self._entries[merchant]
+                return False, None
+            self._entries.move_to_end(merchant)
+            return True, record
+
+    def put(self, merchant, record):
+        ttl = self.ttl if record is not None else self.negative_ttl
+        with self._lock:
+            self._entries[merchant] = (self.clock() + ttl, record)
+            self._entries.move_to_end(merchant)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Flight:
+    __slots__ = ("done", "record")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.record = None
+
+
+class MerchantEnricher:
+    """Enriches micro-batches per canonical merchant instead of per transaction.
+
+    Each batch is reduced to its distinct merchants, cache misses are looked
+    up in batches of LOOKUP_BATCH_SIZE, and a merchant already being fetched
+    by another thread is awaited rather than fetched twice (single flight).
+    Provider failures are not cached, so the next batch retries them.
+    """
+
+    def __init__(self, provider=None, cache=None, batch_size=LOOKUP_BATCH_SIZE):
+        self.provider = provider or StaticEnrichmentProvider()
+        self.cache = cache if cache is not None else EnrichmentCache()
+        self.batch_size = batch_size
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, merchants):
+        """Return {canonical merchant: MerchantEnrichment or None}"""
+        results = {}
+        missing = []
+        for merchant in set(merchants):
+            if not merchant:
+                results[merchant] = None
+                continue
+            found, record = self.cache.get(merchant)
+            if found:
+                increment("enrichment.cache_hit" if record is not None else "enrichment.negative_hit")
+                results[merchant] = record
+            else:
+                missing.append(merchant)
+        if not missing:
+            return results
+
+        owned = []
+        waiting = []
+        with self._lock:
+            for merchant in missing:
+                flight = self._inflight.get(merchant)
+                if flight is None:
+                    flight = self._inflight[merchant] = _Flight()
+                    owned.append((merchant, flight))
+                else:
+                    waiting.append((merchant, flight))
+
+        if owned:
+            increment("enrichment.cache_miss", len(owned))
+            fetched = {}
+            try:
+                fetched = self._fetch([merchant for merchant, _ in owned])
+            finally:
+                with self._lock:
+                    for merchant, flight in owned:
+                        del self._inflight[merchant]
+                        flight.record = results[merchant] = fetched.get(merchant)
+                        flight.done.set()
+
+        for merchant, flight in waiting:
+            increment("enrichment.single_flight_wait")
+            flight.done.wait(SINGLE_FLIGHT_TIMEOUT_SECONDS)
+            results[merchant] = flight.record
+        return results
+
+    def _fetch(self, merchants):
+        fetched = {}
+        for start in range(0, len(merchants), self.batch_size):
+            batch = merchants[start:start + self.batch_size]
+            try:
+                with timer("enrichment.provider_lookup"):
+                    found = self.provider.lookup_many(batch)
+            except Exception as e:
+                increment("enrichment.provider_error")
+                logger.error("Merchant enrichment lookup failed for %d merchants: %s", len(batch), e)
+                continue
+            for merchant in batch:
+                data = found.get(merchant)
+                record = MerchantEnrichment.from_dict(merchant, data) if data else None
+                self.cache.put(merchant, record)
+                fetched[merchant] = record
+        return fetched
+
+    def enrich(self, transactions):
+        """Attach the shared enrichment record (or None) to each transaction dict in place"""
+        keys = [canonical_merchant(transaction.get("merchant_name", "")) for transaction in transactions]
+        records = self.lookup(keys)
+        for transaction, key in zip(transactions, keys):
+            transaction["enrichment"] = records.get(key)
+        return transactions
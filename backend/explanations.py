@@ -0,0 +1,201 @@
+"""Human-readable transaction explanations, rendered lazily and memoized.
+
+Explanations are not computed at ingest. A page of transactions (or the
+transactions a chat answer cites) is rendered in one batch from templates
+compiled once per locale, and each text is memoized by transaction id and a
+data version that changes only when something the text shows changes: the
+row's flags, plus the merchant's history size when the merchant average is
+quoted.
+"""
+import logging
+
+import numpy as np
+
+from metrics import increment, timed
+from transaction_store import FLAG_ANOMALY, FLAG_DUPLICATE, MINOR_UNITS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCALE = "en"
+
+# Explanation templates per locale; "decimal" is the locale's decimal separator
+EXPLANATION_TEMPLATES = {
+    "en": {
+        "base": "${amount} spent at {merchant} ({category}) via {platform}",
+        "first_time": " - First time transaction with this merchant",
+        "anomaly": " - Unusual amount (your average is ${average})",
+        "duplicate": " - Potential duplicate transaction",
+        "decimal": ".",
+    },
+    "es": {
+        "base": "{amount} $ gastados en {merchant} ({category}) vía {platform}",
+        "first_time": " - Primera transacción con este comercio",
+        "anomaly": " - Importe inusual (tu promedio es {average} $)",
+        "duplicate": " - Posible transacción duplicada",
+        "decimal": ",",
+    },
+    "fr": {
+        "base": "{amount} $ dépensés chez {merchant} ({category}) via {platform}",
+        "first_time": " - Première transaction avec ce commerçant",
+        "anomaly": " - Montant inhabituel (votre moyenne est de {average} $)",
+        "duplicate": " - Transaction potentiellement en double",
+        "decimal": ",",
+    },
+}
+
+# Memoized explanations kept per user before the memo is reset
+MAX_CACHED_EXPLANATIONS = 50_000
+
+
+class CompiledTemplates:
+    """One locale's templates, bound to their format methods once at import"""
+
+    __slots__ = ("base", "first_time", "anomaly", "duplicate", "decimal")
+
+    def __init__(self, templates):
+        self.base = templates["base"].format
+        self.anomaly = templates["anomaly"].format
+        self.first_time = templates["first_time"]
+        self.duplicate = templates["duplicate"]
+        self.decimal = templates["decimal"]
+
+    def money(self, value):
+        text = f"{value:.2f}"
+        return text if self.decimal == "." else text.replace(".", self.decimal)
+
+    def render(self, merchant, amount, category, platform, first_time=False, anomaly=False,
+               duplicate=False, average=0.0):
+        text = self.base(amount=self.money(amount), merchant=merchant, category=category, platform=platform)
+        if first_time:
+            text += self.first_time
+        if anomaly:
+            text += self.anomaly(average=self.money(average))
+        if duplicate:
+            text += self.duplicate
+        return text
+
+
+COMPILED_TEMPLATES = {locale: CompiledTemplates(templates) for locale, templates in EXPLANATION_TEMPLATES.items()}
+
+
+def render_explanation(transaction, locale=DEFAULT_LOCALE):
+    """Explain one transaction dict (the pre-store field names)"""
+    return COMPILED_TEMPLATES[locale].render(
+        transaction.get("merchant_name", "Unknown Merchant"),
+        transaction.get("amount", 0),
+        transaction.get("category", "uncategorized"),
+        transaction.get("source_platform", "Unknown Platform"),
+        first_time=transaction.get("is_first_time_vendor", False),
+        anomaly=transaction.get("is_anomaly", False),
+        duplicate=transaction.get("is_duplicate", False),
+        average=transaction.get("avg_merchant_amount", 0)
+    )
+
+
+class UserExplanations:
+    """Explanations for one user's transactions, rendered on demand"""
+
+    def __init__(self, store):
+        self.store = store
+        self._reset()
+
+    def _reset(self):
+        # Per merchant code, caught up with the store like the search index:
+        # row count, amount total (minor units) and first row
+        self._synced = 0
+        self._synced_version = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._sums = np.zeros(0, dtype=np.int64)
+        self._first_rows = np.zeros(0, dtype=np.int64)
+        # (transaction_id, locale) -> (data version, text)
+        self._cache = {}
+
+    def _sync(self):
+        end = len(self.store)
+        if end < self._synced or self.store.version < self._synced_version:
+            # The store was restored under us; start over
+            self._reset()
+        self._synced_version = self.store.version
+        if end == self._synced:
+            return
+        start = self._synced
+        codes = self.store.column("merchants", start, end)
+        amounts = self.store.column("amounts", start, end)
+        size = int(codes.max()) + 1
+        if size > len(self._counts):
+            grow = size - len(self._counts)
+            self._counts = np.concatenate([self._counts, np.zeros(grow, dtype=np.int64)])
+            self._sums = np.concatenate([self._sums, np.zeros(grow, dtype=np.int64)])
+            self._first_rows = np.concatenate([self._first_rows, np.full(grow, -1, dtype=np.int64)])
+        self._counts[:size] += np.bincount(codes, minlength=size)
+        # Float weights are exact for totals below 2**53 minor units
+        self._sums[:size] += np.bincount(codes, weights=amounts, minlength=size).astype(np.int64)
+        # Assigning in reverse leaves each code's earliest row (last write wins)
+        first = np.full(size, -1, dtype=np.int64)
+        first[codes[::-1]] = np.arange(end - 1, start - 1, -1, dtype=np.int64)
+        new = (self._first_rows[:size] < 0) & (first >= 0)
+        self._first_rows[:size][new] = first[new]
+        self._synced = end
+
+    @timed("explanations.explain")
+    def explain(self, rows, locale=DEFAULT_LOCALE):
+        """Explanations for the given store rows, rendering only those not memoized"""
+        templates = COMPILED_TEMPLATES[locale]
+        self._sync()
+        store = self.store
+        pools = store.pools
+        texts = []
+        rendered = 0
+        for row in rows:
+            flags = store.flags[row]
+            code = store.merchants[row]
+            count = int(self._counts[code])
+            # The merchant average only shows on anomalies; elsewhere new rows
+            # for the merchant leave the text unchanged
+            version = (flags, count) if flags & FLAG_ANOMALY else flags
+            key = (store.transaction_ids[row], locale)
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                texts.append(cached[1])
+                continue
+            text = templates.render(
+                pools.merchants.decode(code),
+                store.amounts[row] / MINOR_UNITS,
+                pools.categories.decode(store.categories[row]),
+                pools.platforms.decode(store.platforms[row]),
+                first_time=self._first_rows[code] == row,
+                anomaly=bool(flags & FLAG_ANOMALY),
+                duplicate=bool(flags & FLAG_DUPLICATE),
+                average=self._sums[code] / count / MINOR_UNITS
+            )
+            if len(self._cache) >= MAX_CACHED_EXPLANATIONS:
+                self._cache.clear()
+            self._cache[key] = (version, text)
+            texts.append(text)
+            rendered += 1
+        increment("explanations.rendered", rendered)
+        increment("explanations.memo_hits", len(texts) - rendered)
+        return texts
+
+    def explain_record(self, record, locale=DEFAULT_LOCALE):
+        return self.explain([record.row], locale)[0]
+
+
+class ExplanationStore:
+    """Per-user explanations over a TransactionStore, created on first use"""
+
+    def __init__(self, transaction_store):
+        self.transaction_store = transaction_store
+        self._users = {}
+
+    def user(self, user_id):
+        store = self.transaction_store.user(user_id)
+        explanations = self._users.get(user_id)
+        # A restore or handoff may have replaced the user's store, possibly
+        # with as many rows, so the memo is tied to the store object
+        if explanations is None or explanations.store is not store:
+            explanations = self._users[user_id] = UserExplanations(store)
+        return explanations
+
+    def discard(self, user_id):
+        self._users.pop(user_id, None)
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse, Response
+
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speedup
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# At most one cached payload per (endpoint, user); LRU-evicted beyond this
+MAX_CACHED_PAYLOADS = 1024
+
+# Changes on every restart so ETags from a previous process never match
+BOOT_ID = os.urandom(4).hex()
+
+
+def dumps(content):
+    """Serialize to compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that renders with orjson (or compact stdlib json as a fallback)"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+class CachedPayload:
+    """Serialized body for one data version, with lazily built compressed variants"""
+
+    __slots__ = ("version", "etag", "body", "_encoded", "_lock")
+
+    def __init__(self, version, etag, body):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    if encoding == "br":
+                        body = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                    else:
+                        body = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._encoded[encoding] = body
+        return body
+
+
+class ResponseCache:
+    """Pre-serialized response bodies keyed by (endpoint, user) and data version"""
+
+    def __init__(self, max_entries=MAX_CACHED_PAYLOADS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_etag(endpoint, user_id, version):
+        digest = hashlib.sha1(f"{endpoint}|{user_id}".encode("utf-8")).hexdigest()[:12]
+        return f'"{endpoint}-{digest}-{BOOT_ID}-{version}"'
+
+    def get(self, endpoint, user_id, version, build):
+        """Return the payload for this version, serializing `build()` only on a miss"""
+        key = (endpoint, user_id)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None and payload.version == version:
+                self._entries.move_to_end(key)
+                increment("response_cache.hit")
+                return payload
+
+        increment("response_cache.miss")
+        payload = CachedPayload(version, self.make_etag(endpoint, user_id, version), dumps(build()))
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return payload
+
+    def discard_user(self, user_id):
+        """Drop every cached body for a user, e.g. once the user moved to another shard"""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == user_id]:
+                del self._entries[key]
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Compressed variants carry a suffix inside the quotes; any variant of
+    # the current version is still fresh. Match whole tags only: the version
+    # ends the tag, so a prefix test would accept stale "...-12" for "...-1"
+    base = etag[:-1]
+    current = {etag, f'{base}-gzip"', f'{base}-br"'}
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in current:
+            return True
+    return False
+
+
+def _negotiate_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in accept_encoding.lower().split(",")}
+    if "br" in accepted and brotli is not None:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def cached_json_response(request, cache, endpoint, user_id, version, build):
+    """Serve a JSON read endpoint from the cache with ETag and compression.
+
+    Returns 304 Not Modified, without building or serializing anything, when
+    the client's If-None-Match matches the current data version.
+    """
+    etag = cache.make_etag(endpoint, user_id, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        increment("response_cache.not_modified")
+        return Response(status_code=304, headers=headers)
+
+    payload = cache.get(endpoint, user_id, version, build)
+    body = payload.body
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is not None:
+        body = payload.encoded(encoding)
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,34 @@
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Module proxy that defers the real import until an attribute is first used"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            logger.debug("Importing %s on first use", self._name)
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """Return a proxy for `name` that imports the module on first attribute access"""
+    return LazyModule(name)
@@ -1,8 +1,6 @@
-import pathway as pw
 import os
 import asyncio
-import numpy as np
-import pathway as pw
+import random
 
 # Simple mock KNNIndex class to replace the missing pathway.stdlib.indexing.KNNIndex
 class MockKNNIndex:
@@ -11,11 +9,16 @@ class MockKNNIndex:
         self.n_dimensions = n_dimensions
         # In a real implementation, you would build a proper KNN index here
         
-    def search(self, query_embedding, k=5):
+    def search(self, query_embedding, k=5, candidate_ids=None):
         # Simple mock search implementation
         # In a real implementation, this would perform actual KNN search
+        # candidate_ids restricts the scan to rows that passed metadata filters
         results = []
-        for text_id, embedding in self.embeddings.items():
+        if candidate_ids is None:
+            items = self.embeddings.items()
+        else:
+            items = ((text_id, self.embeddings[text_id]) for text_id in candidate_ids if text_id in self.embeddings)
+        for text_id, embedding in items:
             # Mock distance calculation (not real)
             distance = sum(abs(q - e) for q, e in zip(query_embedding, embedding))
             results.append((text_id, distance))
@@ -29,35 +32,60 @@ class MockOpenAIEmbedder:
     def __init__(self, api_key=None, model=None):
         self.api_key = api_key
         self.model = model
+        self._rng = random.Random(42)  # For reproducibility across batched calls
         
     def __call__(self, texts, ids):
         # Create mock embeddings with random values
         # In a real implementation, you would call the OpenAI API
-        import random
-        random.seed(42)  # For reproducibility
         
         # Create a dictionary mapping text to random embeddings
         embeddings = {}
         for text, text_id in zip(texts, ids):
             # Generate a random 1536-dimensional vector (same as OpenAI's ada-002)
-            embedding = [random.random() for _ in range(1536)]
+            embedding = [self._rng.random() for _ in range(1536)]
             embeddings[text_id] = embedding
             
         # Return a format compatible with KNNIndex
         return embeddings
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Security, Query, Request, Header
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import uvicorn
 import logging
 import json
+from transaction_store import TransactionStore
+from tax_export import stream_csv, stream_parquet, parquet_available, parse_export_date
+from warmup import WarmupTracker
+from rollups import RollupStore
+from search_index import SearchIndexStore
+from explanations import COMPILED_TEMPLATES, DEFAULT_LOCALE, ExplanationStore
+from trends import TrendStore
+from alerting import AlertPipeline
+from checkpoint import CheckpointManager
+from auth import DEMO_TOKEN, DEMO_USER, user_for_token
+from sharding import ShardMembership, ShardingError, export_user, import_user, pack_frames
+from pydantic import BaseModel
+import secrets
+from api_integration import CursorStore, SyncScheduler, load_sync_config
+from transaction_processor import TransactionProcessor, find_recurring_payments
+from backfill import Backfill, READERS
+import tempfile
+from enrichment import HTTPEnrichmentProvider, MerchantEnricher
+import metrics
+from http_cache import FastJSONResponse, ResponseCache, cached_json_response
+from rag_chatbot import generate_contextual_response
+from typing import List, Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
-app = FastAPI(title="FinAI Copilot API")
+app = FastAPI(title="FinAI Copilot API", default_response_class=FastJSONResponse)
+
+# Pre-serialized bodies for read endpoints, keyed by (endpoint, user, data version)
+response_cache = ResponseCache()
 
 # Add CORS middleware
 app.add_middleware(
@@ -68,6 +96,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Requests carrying an X-Profile: 1 header are run under the sampling
+# profiler when profiling is enabled
+PROFILING_ENABLED = os.environ.get("FINAI_ENABLE_PROFILING", "0") == "1"
+
+app.add_middleware(metrics.RequestMetricsMiddleware, profiling=PROFILING_ENABLED)
+
 # OAuth2 setup
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -126,39 +160,304 @@ mock_transactions = [
     }
 ]
 
-# Create vector index for RAG-enabled search using our mock embedder
-embedder = MockOpenAIEmbedder(
-    api_key=os.environ.get("OPENAI_API_KEY", "mock-api-key"),
-    model="text-embedding-ada-002"
+# In a sharded deployment (see sharding.py) this worker serves only the
+# users FINAI_SHARDS' hash ring assigns to FINAI_SHARD_ID
+SHARD_ID = os.environ.get("FINAI_SHARD_ID")
+SHARD_SECRET = os.environ.get("FINAI_SHARD_SECRET", "")
+membership = (
+    ShardMembership(SHARD_ID, os.environ.get("FINAI_SHARDS", SHARD_ID).split(","))
+    if SHARD_ID else None
+)
+
+def owns(user_id):
+    return membership is None or membership.owns(user_id)
+
+# Columnar per-user transaction store
+transaction_store = TransactionStore()
+
+# Budget/tax rollups are folded in as transactions arrive so reads are O(1)
+rollups = RollupStore()
+# Per-category rolling windows and change points behind /insights
+trends = TrendStore()
+
+# Per-user BM25 + amount/date indexes for chat retrieval; they catch up
+# with newly stored rows on each search
+search_indexes = SearchIndexStore(transaction_store)
+
+# Explanations are rendered only for the rows a page or chat answer shows
+explanations = ExplanationStore(transaction_store)
+
+# Merchant enrichment comes from FINAI_ENRICHMENT_URL when set, else static mock profiles
+ENRICHMENT_URL = os.environ.get("FINAI_ENRICHMENT_URL")
+enricher = MerchantEnricher(
+    HTTPEnrichmentProvider(ENRICHMENT_URL, api_key=os.environ.get("FINAI_ENRICHMENT_API_KEY"))
+    if ENRICHMENT_URL else None
 )
+processor = TransactionProcessor(enricher)
+
+# Alerts pass through the pipeline (dedup, coalescing, rate limiting)
+# before they are published to mock_alerts
+ALERT_FLUSH_INTERVAL_SECONDS = 60
+alert_pipeline = AlertPipeline()
+mock_alerts = []
+alerts_version = 0
+
+def publish_alerts(alerts):
+    """Publish alerts released by the alert pipeline"""
+    global alerts_version
+    if alerts:
+        mock_alerts.extend(alerts)
+        alerts_version += 1
+
+def raise_alert(alert):
+    publish_alerts(alert_pipeline.submit(alert))
+
+async def flush_alerts_periodically():
+    while True:
+        await asyncio.sleep(ALERT_FLUSH_INTERVAL_SECONDS)
+        publish_alerts(alert_pipeline.flush())
+
+class AlertState:
+    """The alert pipeline and the published alerts, checkpointed together"""
+
+    @property
+    def version(self):
+        return alert_pipeline.version, alerts_version
+
+    def to_state(self):
+        return {"pipeline": alert_pipeline.to_state(), "published": mock_alerts}
+
+    def restore_state(self, state):
+        global alerts_version
+        alert_pipeline.restore_state(state["pipeline"])
+        mock_alerts[:] = state["published"]
+        alerts_version += 1
+
+# With FINAI_CHECKPOINT_DIR set, the stores, rollups, trends and alert
+# state are checkpointed there and ingested batches are written ahead to a
+# log, so a restart restores the last checkpoint and replays only the log
+# tail. Explanation memos, search and vector indexes and the enrichment
+# cache are not checkpointed; they are rebuilt lazily or in the background.
+CHECKPOINT_DIR = os.environ.get("FINAI_CHECKPOINT_DIR")
+CHECKPOINT_POLL_SECONDS = 1
+checkpoints = (
+    CheckpointManager(os.path.join(CHECKPOINT_DIR, SHARD_ID) if SHARD_ID else CHECKPOINT_DIR, transaction_store, rollups, trends,
+                      fsync=os.environ.get("FINAI_WAL_FSYNC", "0") == "1", state={"alerts": AlertState()})
+    if CHECKPOINT_DIR else None
+)
+
+def ingest_transactions(user_id, transactions, replaying=False):
+    """Append transactions to the user's store, rollups and trends, skipping ids already stored"""
+    store = transaction_store.user(user_id)
+    rollup = rollups.user(user_id)
+    trend = trends.user(user_id)
+    new_transactions = []
+    for transaction in transactions:
+        if store.get(transaction["transaction_id"]) is not None:
+            continue
+        if "category" not in transaction:
+            transaction["category"] = processor.categorize_transaction(
+                transaction.get("merchant_name", ""), transaction.get("description", "")
+            )
+        new_transactions.append(transaction)
+    if checkpoints is not None and new_transactions and not replaying:
+        checkpoints.log(user_id, new_transactions)
+
+    added = 0
+    for transaction in new_transactions:
+        size = len(store)
+        row = store.append(transaction)
+        if len(store) > size:
+            record = store[row]
+            rollup.apply(record)
+            trend.apply(record)
+            added += 1
+    return added
+
+# Restore checkpointed state before anything else touches the stores; the
+# mock data only seeds a fresh deployment
+restore_stats = None
+if checkpoints is not None:
+    restore_stats = checkpoints.restore(lambda user_id, batch: ingest_transactions(user_id, batch, replaying=True))
+if owns(DEMO_USER) and not len(transaction_store.user(DEMO_USER)):
+    ingest_transactions(DEMO_USER, mock_transactions)
+
+# Recurring payments per user, recomputed only after the user's store changed
+subscription_cache = {}
+
+def user_subscriptions(user_id):
+    store = transaction_store.user(user_id)
+    cached = subscription_cache.get(user_id)
+    if cached is None or cached[0] != store.version:
+        cached = subscription_cache[user_id] = (store.version, find_recurring_payments(store))
+    return cached[1]
+
+def invalidate_user(user_id):
+    """Drop everything derived from a user's store, e.g. after it was replaced"""
+    subscription_cache.pop(user_id, None)
+    search_indexes.discard(user_id)
+    explanations.discard(user_id)
+    response_cache.discard_user(user_id)
+
+def discard_user(user_id):
+    """Forget a user that moved to another shard"""
+    invalidate_user(user_id)
+    transaction_store.discard(user_id)
+    rollups.discard(user_id)
+    trends.discard(user_id)
+
+async def checkpoint_periodically():
+    while True:
+        await asyncio.sleep(CHECKPOINT_POLL_SECONDS)
+        if checkpoints.due():
+            # Capture on the event loop, where batches are applied; write in a thread
+            await asyncio.to_thread(checkpoints.commit, checkpoints.capture())
+
+async def ingest_synced_transactions(account, transactions):
+    # Enrichment may call out to the enrichment service, so keep it off the event loop
+    await asyncio.to_thread(processor.enrich_transactions, transactions)
+    if not owns(account.user_id):
+        # The user moved to another shard during the round; that shard syncs
+        # the account with its own cursor
+        metrics.increment("sync.not_owned")
+        return
+    ingest_transactions(account.user_id, transactions)
+
+# Bank/card/UPI feeds are polled when FINAI_SYNC_CONFIG points at a
+# connectors/accounts JSON file (see api_integration.load_sync_config)
+SYNC_CONFIG = os.environ.get("FINAI_SYNC_CONFIG")
+
+def start_feed_sync():
+    connectors, accounts, cursor_file, interval = load_sync_config(SYNC_CONFIG)
+    if cursor_file and SHARD_ID:
+        # Every shard reads the same config; each syncs only its users' accounts
+        root, extension = os.path.splitext(cursor_file)
+        cursor_file = f"{root}.{SHARD_ID}{extension}"
+    scheduler = SyncScheduler(connectors, CursorStore(cursor_file), sink=ingest_synced_transactions)
+    return asyncio.create_task(
+        scheduler.poll_forever(accounts, interval, account_filter=lambda account: owns(account.user_id))
+    )
+
+# The vector index is built in a background task after the server starts
+# accepting requests. It is rebuilt from the whole history on every boot and
+# chat answers do not depend on it (retrieval is lexical), so /ready reports
+# its progress without waiting for it; readiness is bounded by the restore.
+LAZY_STARTUP = os.environ.get("FINAI_LAZY_STARTUP", "1") == "1"
+EMBEDDING_BATCH_SIZE = 256
+warmup = WarmupTracker(["embeddings", "vector_index"], required=[])
+vector_index = None
+
+def make_embedder():
+    return MockOpenAIEmbedder(
+        api_key=os.environ.get("OPENAI_API_KEY", "mock-api-key"),
+        model="text-embedding-ada-002"
+    )
+
+def embed_rows(embedder, store, rows, on_batch=None):
+    """Embed the given store rows in batches of EMBEDDING_BATCH_SIZE; returns {transaction_id: embedding}"""
+    embedded_text = {}
+    for start in range(0, len(rows), EMBEDDING_BATCH_SIZE):
+        batch = [store[row] for row in rows[start:start + EMBEDDING_BATCH_SIZE]]
+        transaction_texts = [f"{tx.merchant_name} {tx.description} {tx.category}" for tx in batch]
+        transaction_ids = [tx.transaction_id for tx in batch]
+        embedded_text.update(embedder(transaction_texts, transaction_ids))
+        if on_batch is not None:
+            on_batch(len(batch))
+    return embedded_text
+
+def build_vector_index():
+    """Embed every stored transaction and build the RAG vector index"""
+    # Create a combined text for embedding and generate mock embeddings in batches
+    user_transactions = transaction_store.user(DEMO_USER) if owns(DEMO_USER) else []
+    warmup.begin("embeddings", total=len(user_transactions))
+    embedded_text = embed_rows(make_embedder(), user_transactions, range(len(user_transactions)),
+                               lambda count: warmup.advance("embeddings", count))
+    warmup.finish("embeddings")
+    
+    warmup.begin("vector_index")
+    index = MockKNNIndex(embedded_text, n_dimensions=1536)  # OpenAI embedding dimension
+    warmup.finish("vector_index")
+    return index
+
+async def warm_up():
+    global vector_index
+    try:
+        vector_index = await asyncio.to_thread(build_vector_index)
+    except Exception as e:
+        warmup.fail("vector_index", e)
 
-# Create a combined text for embedding and generate mock embeddings
-transaction_texts = [f"{tx['merchant_name']} {tx['description'] if 'description' in tx else ''} {tx['category']}" for tx in mock_transactions]
-transaction_ids = [tx['transaction_id'] for tx in mock_transactions]
+@app.on_event("startup")
+async def schedule_warm_up():
+    if LAZY_STARTUP:
+        # Keep a reference so the task is not garbage collected mid-flight
+        app.state.warmup_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+    app.state.alert_flush_task = asyncio.create_task(flush_alerts_periodically())
+    if SYNC_CONFIG:
+        app.state.feed_sync_task = start_feed_sync()
+    if checkpoints is not None:
+        app.state.checkpoint_task = asyncio.create_task(checkpoint_periodically())
 
-# Create mock embeddings
-embedded_text = embedder(transaction_texts, transaction_ids)
-vector_index = MockKNNIndex(embedded_text, n_dimensions=1536)  # OpenAI embedding dimension
+@app.on_event("shutdown")
+async def final_checkpoint():
+    # A clean shutdown leaves no WAL tail to replay on the next boot
+    if checkpoints is not None:
+        if checkpoints.pending or checkpoints.requested:
+            checkpoints.checkpoint()
+        checkpoints.close()
 
 # Simple mock alerts
-mock_alerts = [
+seed_alerts = [
     {
         "alert_id": "alert_001",
         "user_id": "user_123",
         "transaction_id": "tx_126",
+        "merchant_name": "Whole Foods",
         "alert_type": "anomaly",
         "message": "Unusual transaction at Whole Foods: $1200.00 (your average is $85.20)",
         "timestamp": "2023-11-02 18:35:00",
         "is_read": False
     }
 ]
+for alert in seed_alerts:
+    raise_alert(alert)
+
+metrics.register_gauge("alerts.open_windows", lambda: alert_pipeline.open_windows)
+metrics.register_gauge("alerts.held_back", lambda: alert_pipeline.held_back)
+metrics.register_gauge("warmup.progress", warmup.progress)
+if checkpoints is not None:
+    metrics.register_gauge("checkpoint.pending_rows", lambda: checkpoints.pending)
 
 # FastAPI endpoints
 def verify_token(token: str = Depends(oauth2_scheme)):
     # Simple token verification (in production, use proper JWT validation)
-    if token != "test-token":
+    user_id = user_for_token(token)
+    if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-    return {"sub": "user@example.com"}
+    if not owns(user_id):
+        raise HTTPException(status_code=421, detail=f"User is served by shard {membership.ring.owner(user_id)}")
+    return {"sub": user_id}
+
+@app.get("/ready")
+async def ready():
+    # Readiness probe: 503 until the required warm-up stages have finished
+    snapshot = warmup.snapshot()
+    if restore_stats is not None:
+        snapshot["restore"] = restore_stats
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus text exposition of stage latencies, counters and gauges
+    return PlainTextResponse(metrics.REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/profiles")
+async def get_profiles():
+    # Collapsed stacks from recently profiled requests (flamegraph input)
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return {"profiles": list(metrics.REGISTRY.recent_profiles)}
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -166,50 +465,296 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = users_db.get(form_data.username)
     if not user or form_data.password != "secret":
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    return {"access_token": "test-token", "token_type": "bearer"}
+    return {"access_token": DEMO_TOKEN, "token_type": "bearer"}
+
+# Shard-internal endpoints, called by the router (sharding.ShardRouter) and
+# load tools with the cluster's shared secret; absent outside a sharded deployment
+def verify_shard_secret(x_shard_secret: str = Header("")):
+    if membership is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not SHARD_SECRET or not secrets.compare_digest(x_shard_secret, SHARD_SECRET):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+class RingUpdate(BaseModel):
+    shards: List[str]
+
+class IngestBatch(BaseModel):
+    user_id: str
+    transactions: List[dict]
+
+class ReleasedUsers(BaseModel):
+    users: List[str]
+
+@app.post("/internal/ingest", dependencies=[Depends(verify_shard_secret)])
+async def internal_ingest(batch: IngestBatch):
+    if not owns(batch.user_id):
+        raise HTTPException(status_code=421, detail="User is served by another shard")
+    return {"added": ingest_transactions(batch.user_id, batch.transactions)}
+
+# Users adopted since the last checkpoint; their rows never went through this shard's WAL
+unsaved_adoptions = set()
+
+@app.post("/internal/ring", dependencies=[Depends(verify_shard_secret)])
+async def internal_ring(update: RingUpdate):
+    if checkpoints is not None and unsaved_adoptions and SHARD_ID in update.shards:
+        # The router flips the ring (and donors then forget the users) only
+        # after this returns, so one checkpoint covers the whole handoff
+        await asyncio.to_thread(checkpoints.commit, checkpoints.capture())
+    unsaved_adoptions.clear()
+    membership.update(update.shards)
+    return {"shard": SHARD_ID, "shards": membership.ring.shards}
+
+@app.post("/internal/handoff", dependencies=[Depends(verify_shard_secret)])
+async def internal_handoff(update: RingUpdate):
+    # Adopt the new ring (requests for moving users now get 421) and export
+    # the users it assigns elsewhere; they stay here until released
+    membership.update(update.shards)
+    exports = [
+        export_user(user_id, transaction_store, rollups, trends)
+        for user_id in transaction_store.users()
+        if not owns(user_id) and len(transaction_store.user(user_id))
+    ]
+    logger.info("Handing off %d users", len(exports))
+    return Response(pack_frames(exports), media_type="application/octet-stream")
+
+@app.post("/internal/adopt", dependencies=[Depends(verify_shard_secret)])
+async def internal_adopt(request: Request):
+    try:
+        user_id = import_user(await request.body(), transaction_store, rollups, trends)
+    except ShardingError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    invalidate_user(user_id)
+    unsaved_adoptions.add(user_id)
+    return {"user_id": user_id, "rows": len(transaction_store.user(user_id))}
+
+@app.post("/internal/release", dependencies=[Depends(verify_shard_secret)])
+async def internal_release(released: ReleasedUsers):
+    for user_id in released.users:
+        if not owns(user_id):
+            discard_user(user_id)
+    if checkpoints is not None:
+        # Checkpoint now so a restart cannot restore (and later hand off) stale copies
+        await asyncio.to_thread(checkpoints.commit, checkpoints.capture())
+    return {"released": len(released.users)}
+
+# Largest page GET /transactions renders explanations for
+MAX_PAGE_SIZE = 500
+
+def merchant_profiles(store, rows=None):
+    """Enrichment for the merchants of `rows` (default: all), keyed by merchant name.
+
+    Records are shared per merchant, so a response carries each profile once
+    instead of copying it into every transaction.
+    """
+    codes = store.enrichments.keys() if rows is None else {store.merchants[row] for row in rows}
+    profiles = {}
+    for code in codes:
+        record = store.enrichments.get(code)
+        if record is not None:
+            profiles[store.pools.merchants.decode(code)] = record.to_dict()
+    return profiles
 
 @app.get("/transactions")
-async def get_transactions(current_user: dict = Depends(verify_token)):
+async def get_transactions(
+    request: Request,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    locale: str = DEFAULT_LOCALE,
+    current_user: dict = Depends(verify_token)
+):
     # In production, query Pathway's live data store
-    logger.info(f"Fetching transactions for user: {current_user['sub']}")
-    # Return our mock transaction data
-    return {
-        "transactions": mock_transactions
-    }
+    logger.info("Fetching transactions for user: %s", current_user['sub'])
+    # Materialize rows from the user's columnar store only when the cached body is stale
+    user_transactions = transaction_store.user(current_user['sub'])
+    if limit is None:
+        return cached_json_response(
+            request, response_cache, "transactions", current_user['sub'], user_transactions.version,
+            lambda: {"transactions": [record.to_dict() for record in user_transactions],
+                     "merchants": merchant_profiles(user_transactions)}
+        )
+
+    # A page carries explanations, rendered in one batch for just its rows
+    if not 0 < limit <= MAX_PAGE_SIZE or offset < 0:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{MAX_PAGE_SIZE} and offset >= 0")
+    if locale not in COMPILED_TEMPLATES:
+        raise HTTPException(status_code=400, detail=f"locale must be one of {sorted(COMPILED_TEMPLATES)}")
+
+    def build_page():
+        rows = range(offset, min(offset + limit, len(user_transactions)))
+        texts = explanations.user(current_user['sub']).explain(rows, locale)
+        page = []
+        for row, text in zip(rows, texts):
+            transaction = user_transactions[row].to_dict()
+            transaction["explanation"] = text
+            page.append(transaction)
+        return {"transactions": page, "merchants": merchant_profiles(user_transactions, rows),
+                "offset": offset, "total": len(user_transactions)}
+
+    return cached_json_response(
+        request, response_cache, f"transactions-{offset}-{limit}-{locale}", current_user['sub'],
+        user_transactions.version, build_page
+    )
+
+@app.get("/export")
+@app.get("/transactions/export")
+async def export_transactions(
+    format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[List[str]] = Query(None),
+    include_subtotals: bool = True,
+    current_user: dict = Depends(verify_token)
+):
+    # Stream the export chunk by chunk so memory stays flat for long histories
+    logger.info("Exporting transactions for user: %s", current_user['sub'])
+    try:
+        start = parse_export_date(start_date)
+        end = parse_export_date(end_date, end_of_day=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+
+    user_transactions = transaction_store.user(current_user['sub'])
+    if format == "csv":
+        return StreamingResponse(
+            stream_csv(user_transactions, start, end, category, include_subtotals),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=transactions.csv"}
+        )
+    if format == "parquet":
+        if not parquet_available():
+            raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+        return StreamingResponse(
+            stream_parquet(user_transactions, start, end, category),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": "attachment; filename=transactions.parquet"}
+        )
+    raise HTTPException(status_code=400, detail="Unsupported export format")
 
 @app.get("/alerts")
-async def get_alerts(current_user: dict = Depends(verify_token)):
+async def get_alerts(request: Request, current_user: dict = Depends(verify_token)):
     # In production, query Pathway's live data store
-    logger.info(f"Fetching alerts for user: {current_user['sub']}")
+    logger.info("Fetching alerts for user: %s", current_user['sub'])
     # Return our mock alerts
-    return {
-        "alerts": mock_alerts
-    }
+    return cached_json_response(
+        request, response_cache, "alerts", current_user['sub'], alerts_version,
+        lambda: {"alerts": mock_alerts}
+    )
 
 @app.post("/chat")
 async def chat(message: str, current_user: dict = Depends(verify_token)):
     # In production, use Pathway's RAG to generate responses
-    logger.info(f"Chat query from user {current_user['sub']}: {message}")
+    logger.info("Chat query from user %s: %s", current_user['sub'], message)
     
-    # Mock response for development
+    # Answer intent-based questions from the materialized rollups
+    rollup = rollups.user(current_user['sub'])
+    context_data = {
+        "transactions": transaction_store.user(current_user['sub']),
+        # Lexical + filter retrieval only: the mock embeddings are random, so
+        # fusing them into single-answer lookups would add arbitrary matches
+        "search_index": search_indexes.user(current_user['sub']),
+        # Cited transactions are explained on demand
+        "explain": explanations.user(current_user['sub']).explain_record,
+        "alerts": mock_alerts,
+        "subscriptions": user_subscriptions(current_user['sub']),
+        "budget": rollup.budget_status(),
+        "balance": rollup.balance,
+        "spending_summary": rollup.spending_summary()
+    }
     return {
-        "response": f"I'm your financial assistant. You asked: '{message}'. In a production environment, I would use Pathway's RAG to provide you with real-time insights based on your financial data."
+        "response": generate_contextual_response(message, context_data)
     }
 
-@app.get("/insights")
-async def get_insights(current_user: dict = Depends(verify_token)):
-    # In production, generate insights from Pathway's analysis
-    logger.info(f"Generating insights for user: {current_user['sub']}")
-    
-    # Mock insights for development
+# Statement imports run as background jobs, polled via GET /backfill/{job_id}
+MAX_BACKFILL_JOBS = 100
+backfill_jobs = {}
+backfill_tasks = set()
+
+async def run_backfill(job):
+    # Parsing and categorizing run in a worker thread; batches are applied
+    # on the event loop, where all other ingestion happens
+    batches = job.batches()
+    try:
+        while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+            job.load(batch)
+        job.finish()
+        store = transaction_store.user(job.user_id)
+        subscription_cache[job.user_id] = (store.version, job.subscriptions)
+        if checkpoints is not None:
+            # Backfilled rows skip the WAL: checkpoint them before moving on
+            await asyncio.to_thread(checkpoints.commit, checkpoints.capture())
+        if vector_index is not None and job.user_id == DEMO_USER:
+            # Bulk-load the new rows' embeddings into the vector index
+            rows = list(job.loaded_rows())
+            vector_index.embeddings.update(await asyncio.to_thread(embed_rows, make_embedder(), store, rows))
+    except Exception as e:
+        logger.exception("Backfill %s failed", job.path)
+        job.progress.fail(e)
+        if checkpoints is not None and job.progress.rows_loaded:
+            # Keep what was loaded; re-running the file skips it
+            checkpoints.request()
+    finally:
+        batches.close()
+        os.remove(job.path)
+
+@app.post("/backfill", status_code=202)
+async def start_backfill(
+    request: Request,
+    format: str = "csv",
+    source_platform: str = "statement",
+    current_user: dict = Depends(verify_token)
+):
+    # The request body is the statement file; it is spooled to disk and
+    # streamed through the backfill pipeline in the background
+    if format not in READERS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(READERS)}")
+    with tempfile.NamedTemporaryFile(prefix="finai-backfill-", suffix=f".{format}", delete=False) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+    job = Backfill(current_user['sub'], spool.name, transaction_store, rollups, trends, search_indexes,
+                   processor, format=format, source_platform=source_platform)
+    job_id = secrets.token_hex(8)
+    backfill_jobs[job_id] = job
+    while len(backfill_jobs) > MAX_BACKFILL_JOBS:
+        del backfill_jobs[next(iter(backfill_jobs))]
+    # Keep a reference so the task is not garbage collected mid-flight
+    task = asyncio.create_task(run_backfill(job))
+    backfill_tasks.add(task)
+    task.add_done_callback(backfill_tasks.discard)
+    return {"job_id": job_id, **job.progress.snapshot()}
+
+@app.get("/backfill/{job_id}")
+async def get_backfill(job_id: str, current_user: dict = Depends(verify_token)):
+    job = backfill_jobs.get(job_id)
+    if job is None or job.user_id != current_user['sub']:
+        raise HTTPException(status_code=404, detail="Unknown backfill job")
+    return {"job_id": job_id, **job.progress.snapshot()}
+
+@app.get("/budget")
+async def get_budget(current_user: dict = Depends(verify_token)):
+    # Precomputed month-to-date / year-to-date rollups for dashboard widgets
+    rollup = rollups.user(current_user['sub'])
     return {
-        "insights": [
-            "Your coffee spending has increased by 15% this month",
-            "Consider reviewing your subscription services - you have 5 active subscriptions",
-            "Your average daily spending is $85.20"
-        ]
+        "budget": rollup.budget_status(),
+        "balance": rollup.balance,
+        "month_to_date": rollup.month_to_date(),
+        "year_to_date": rollup.year_to_date()
     }
 
+@app.get("/insights")
+async def get_insights(request: Request, current_user: dict = Depends(verify_token)):
+    logger.info("Generating insights for user: %s", current_user['sub'])
+    user_trends = trends.user(current_user['sub'])
+
+    # Built from the streaming trend windows; versioned by the transactions they summarize
+    return cached_json_response(
+        request, response_cache, "insights", current_user['sub'],
+        transaction_store.user(current_user['sub']).version,
+        lambda: {
+            "insights": user_trends.insights(),
+            "categories": user_trends.snapshot()
+        }
+    )
+
 # Start FastAPI server directly (without Pathway)
 async def start_application():
     # Start FastAPI server
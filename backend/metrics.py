@@ -0,0 +1,307 @@
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 16 sub-buckets per power of two keeps every bucket within ~6% of its value
+SUB_BUCKET_BITS = 4
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class _Shard:
+    # One thread's share of a histogram, written only by that thread
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+
+class Histogram:
+    """HDR-style log-linear histogram of integer values (nanoseconds here).
+
+    Values are bucketed by their top SUB_BUCKET_BITS+1 significant bits, so
+    memory is bounded by the dynamic range rather than by the sample count
+    and quantiles carry a bounded relative error.
+
+    Each recording thread writes its own shard, so `record` takes no lock;
+    readers merge the shards.
+    """
+
+    __slots__ = ("_lock", "_local", "_shards")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self):
+        shard = _Shard()
+        self._local.shard = shard
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    @property
+    def count(self):
+        return sum(shard.count for shard in self._shards)
+
+    @property
+    def total(self):
+        return sum(shard.total for shard in self._shards)
+
+    @property
+    def max(self):
+        return max((shard.max for shard in self._shards), default=0)
+
+    @staticmethod
+    def _bucket(value):
+        shift = max(value.bit_length() - 1 - SUB_BUCKET_BITS, 0)
+        return (shift << (SUB_BUCKET_BITS + 1)) | (value >> shift)
+
+    @staticmethod
+    def _bucket_midpoint(bucket):
+        shift = bucket >> (SUB_BUCKET_BITS + 1)
+        top = bucket & ((SUB_BUCKET_COUNT << 1) - 1)
+        return ((top << shift) + ((top + 1) << shift) - 1) / 2 if shift else top
+
+    def record(self, value):
+        value = max(int(value), 1)
+        bucket = self._bucket(value)
+        shard = getattr(self._local, "shard", None) or self._shard()
+        shard.buckets[bucket] = shard.buckets.get(bucket, 0) + 1
+        shard.count += 1
+        shard.total += value
+        if value > shard.max:
+            shard.max = value
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return {quantile: estimated value} for the requested quantiles"""
+        merged = Counter()
+        for shard in self._shards:
+            merged.update(shard.buckets.copy())
+        buckets = sorted(merged.items())
+        count = sum(merged.values())
+        result = {}
+        if not count:
+            return {q: 0.0 for q in quantiles}
+        targets = sorted(quantiles)
+        seen = 0
+        position = 0
+        for bucket, bucket_count in buckets:
+            seen += bucket_count
+            while position < len(targets) and seen >= targets[position] * count:
+                result[targets[position]] = self._bucket_midpoint(bucket)
+                position += 1
+        for q in targets[position:]:
+            result[q] = float(self.max)
+        return result
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's stack and counts collapsed stacks.
+
+    The output uses the "frame;frame;frame count" format understood by
+    flamegraph tools.
+    """
+
+    def __init__(self, thread_id, interval=0.001, max_depth=40):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def collapsed(self, top=None):
+        return [f"{stack} {count}" for stack, count in self.stacks.most_common(top)]
+
+
+class MetricsRegistry:
+    """Stage latency histograms, counters and gauges rendered as Prometheus text.
+
+    Like histograms, counters are kept per thread so recording never
+    contends on a lock.
+    """
+
+    def __init__(self, namespace="finai"):
+        self.namespace = namespace
+        self._histograms = {}
+        self._local = threading.local()
+        self._counter_shards = []
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self.recent_profiles = deque(maxlen=20)
+
+    def histogram(self, stage):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, duration_ns):
+        self.histogram(stage).record(duration_ns)
+
+    def increment(self, name, amount=1):
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = self._local.counters = Counter()
+            with self._lock:
+                self._counter_shards.append(counters)
+        counters[name] += amount
+
+    def counters(self):
+        merged = Counter()
+        for counters in list(self._counter_shards):
+            merged.update(dict(counters))
+        return dict(merged)
+
+    def register_gauge(self, name, read):
+        """Register a zero-argument callable sampled whenever metrics are rendered"""
+        self._gauges[name] = read
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histogram(stage).record(time.perf_counter_ns() - started)
+
+    def timed(self, stage):
+        """Decorator recording the wall time of each call (sync or async) under `stage`"""
+        def decorator(fn):
+            histogram = self.histogram(stage)
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter_ns()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        histogram.record(time.perf_counter_ns() - started)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter_ns()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    histogram.record(time.perf_counter_ns() - started)
+            return wrapper
+        return decorator
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_latency_seconds Latency of instrumented pipeline stages",
+            f"# TYPE {ns}_stage_latency_seconds summary",
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            if not histogram.count:
+                continue
+            for quantile, value in histogram.quantiles().items():
+                lines.append(f'{ns}_stage_latency_seconds{{stage="{stage}",quantile="{quantile}"}} {value / 1e9:.9f}')
+            lines.append(f'{ns}_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total / 1e9:.9f}')
+            lines.append(f'{ns}_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines.append(f"# HELP {ns}_events_total Counted events such as cache hits and misses")
+        lines.append(f"# TYPE {ns}_events_total counter")
+        for name, value in sorted(self.counters().items()):
+            lines.append(f'{ns}_events_total{{event="{name}"}} {value}')
+
+        lines.append(f"# HELP {ns}_gauge Sampled gauges such as queue depths")
+        lines.append(f"# TYPE {ns}_gauge gauge")
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = float(read())
+            except Exception as e:
+                logger.error("Failed to read gauge %s: %s", name, e)
+                continue
+            lines.append(f'{ns}_gauge{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware timing each HTTP request under `http.<method> <route>`.
+
+    With `profiling` on, requests carrying an X-Profile: 1 header run under
+    the sampling profiler until the response starts; the collapsed stacks
+    go to `registry.recent_profiles` and the sample count to an
+    X-Profile-Samples response header.
+    """
+
+    def __init__(self, app, registry=None, profiling=False):
+        self.app = app
+        self.registry = registry or REGISTRY
+        self.profiling = profiling
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        profiler = None
+        if self.profiling and (b"x-profile", b"1") in scope["headers"]:
+            profiler = SamplingProfiler(threading.get_ident()).start()
+
+        def stage():
+            # Label by route template rather than raw path to keep cardinality bounded
+            route = scope.get("route")
+            return f"http.{scope['method']} {route.path if route else 'unmatched'}"
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                profiler.stop()
+                self.registry.recent_profiles.append({"stage": stage(), "stacks": profiler.collapsed(top=50)})
+                samples = str(sum(profiler.stacks.values())).encode("latin-1")
+                message = dict(message, headers=[*message.get("headers", []), (b"x-profile-samples", samples)])
+            await send(message)
+
+        started = time.perf_counter_ns()
+        try:
+            await self.app(scope, receive, send if profiler is None else send_with_profile)
+        finally:
+            self.registry.observe(stage(), time.perf_counter_ns() - started)
+
+
+# Process-wide default registry and shortcuts to it
+REGISTRY = MetricsRegistry()
+timed = REGISTRY.timed
+timer = REGISTRY.timer
+increment = REGISTRY.increment
+register_gauge = REGISTRY.register_gauge
@@ -1,50 +1,65 @@
-import pathway as pw
-from pathway.stdlib.indexing import KNNIndex
-from pathway.xpacks.llm import embedders, llms
 import os
 import logging
 import json
 import re
+from lazy_imports import lazy_import
+from metrics import timed, timer
 
 logger = logging.getLogger(__name__)
 
+# Pathway and its LLM xpack pull in OpenAI clients and take seconds to import,
+# so they are only loaded when an index or client is actually built
+pw = lazy_import("pathway")
+indexing = lazy_import("pathway.stdlib.indexing")
+embedders = lazy_import("pathway.xpacks.llm.embedders")
+llms = lazy_import("pathway.xpacks.llm.llms")
+
 class FinancialRAGChatbot:
     """Implements a RAG-based chatbot for financial queries"""
     
     def __init__(self, openai_api_key=None):
         self.api_key = openai_api_key or os.environ.get("OPENAI_API_KEY", "mock-api-key")
-        self.embedder = None
+        self._embedder = None
         self.vector_index = None
-        self.llm = None
-        
-        # Initialize components
-        self._initialize_embedder()
-        self._initialize_llm()
+        self._llm = None
+        # Embedder and LLM clients are created on first use
+    
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._initialize_embedder()
+        return self._embedder
+    
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._initialize_llm()
+        return self._llm
     
     def _initialize_embedder(self):
         """Initialize the text embedder"""
         try:
-            self.embedder = embedders.OpenAIEmbedder(
+            self._embedder = embedders.OpenAIEmbedder(
                 api_key=self.api_key,
                 model="text-embedding-ada-002"
             )
         except Exception as e:
-            logger.error(f"Failed to initialize embedder: {e}")
+            logger.error("Failed to initialize embedder: %s", e)
             # Fallback to mock embedder if real one fails
-            self.embedder = self._create_mock_embedder()
+            self._embedder = self._create_mock_embedder()
     
     def _initialize_llm(self):
         """Initialize the LLM for generating responses"""
         try:
-            self.llm = llms.OpenAI(
+            self._llm = llms.OpenAI(
                 api_key=self.api_key,
                 model="gpt-3.5-turbo",
                 temperature=0.7
             )
         except Exception as e:
-            logger.error(f"Failed to initialize LLM: {e}")
+            logger.error("Failed to initialize LLM: %s", e)
             # Use mock LLM responses
-            self.llm = self._create_mock_llm()
+            self._llm = self._create_mock_llm()
     
     def _create_mock_embedder(self):
         """Create a mock embedder for testing"""
@@ -90,7 +105,7 @@ class FinancialRAGChatbot:
         embedded_text = self.embedder(combined_text.text, combined_text.transaction_id)
         
         # Create vector index
-        self.vector_index = KNNIndex(embedded_text, n_dimensions=1536)
+        self.vector_index = indexing.KNNIndex(embedded_text, n_dimensions=1536)
         
         return self.vector_index
     
@@ -105,45 +120,71 @@ class FinancialRAGChatbot:
         
         return prompt
     
-    def answer_query(self, query, vector_index=None):
-        """Answer a user query using RAG"""
-        logger.info(f"Processing user query: {query}")
+    @timed("chatbot.answer_query")
+    def answer_query(self, query, vector_index=None, search_index=None):
+        """Answer a user query using RAG.
+
+        With a `search_index` (search_index.UserSearchIndex) the context comes
+        from hybrid retrieval: amount/date filters, BM25 and the dense index
+        fused by rank.
+        """
+        logger.info("Processing user query: %s", query)
         
         # Use the provided vector index or the instance's index
         index_to_use = vector_index or self.vector_index
         
-        if not index_to_use:
+        if not index_to_use and search_index is None:
             # If no vector index is available, use LLM without context
             prompt = f"You are a financial assistant. Answer the user's question: {query}"
-            response = self.llm([prompt])[0]
+            with timer("chatbot.llm"):
+                response = self.llm([prompt])[0]
             return response
         
         try:
             # Embed the query
-            query_embedding = self.embedder([query], ["query_embedding"])
-            
-            # Search for relevant documents
-            search_results = index_to_use.search(query_embedding.embedding[0], k=5)
+            query_vector = None
+            if index_to_use:
+                with timer("chatbot.embed_query"):
+                    query_embedding = self.embedder([query], ["query_embedding"])
+                query_vector = query_embedding.embedding[0]
             
-            # Extract relevant context
-            context_docs = []
-            for result in search_results:
-                # In production, you would get the actual document content
-                # For this simplified version, we'll create a mock context
-                context_docs.append(f"Mock transaction data matching query: {query}")
+            if search_index is not None:
+                # Filters shrink the candidate set before the dense search
+                with timer("chatbot.hybrid_search"):
+                    hits = search_index.search(query, k=5, vector_index=index_to_use, query_vector=query_vector)
+                context_docs = [format_transaction(record) for record, _ in hits]
+            else:
+                # Search for relevant documents
+                with timer("chatbot.knn_search"):
+                    search_results = index_to_use.search(query_vector, k=5)
+                
+                # Extract relevant context
+                context_docs = []
+                for result in search_results:
+                    # In production, you would get the actual document content
+                    # For this simplified version, we'll create a mock context
+                    context_docs.append(f"Mock transaction data matching query: {query}")
             
             # Generate prompt with context
-            prompt = self.generate_prompt(query, context_docs)
+            with timer("chatbot.build_prompt"):
+                prompt = self.generate_prompt(query, context_docs)
             
             # Get response from LLM
-            response = self.llm([prompt])[0]
+            with timer("chatbot.llm"):
+                response = self.llm([prompt])[0]
             
             return response
         except Exception as e:
-            logger.error(f"Error processing query: {e}")
+            logger.error("Error processing query: %s", e)
             # Fallback response
             return "I apologize, but I'm having trouble processing your request at the moment. Please try again later."
 
+def format_transaction(transaction):
+    """One-line description of a transaction for prompts and answers"""
+    return (f"{transaction.get('timestamp', '')} {transaction.get('merchant_name', '')} "
+            f"${transaction.get('amount', 0):.2f} ({transaction.get('category', '')}, "
+            f"{transaction.get('source_platform', '')})")
+
 # Pathway-based RAG functions
 def build_rag_system(transactions):
     """Build a complete RAG system using Pathway"""
@@ -212,9 +253,29 @@ def generate_contextual_response(query, context_data):
     
     # Generate responses based on intent
     if intent == "transaction_detail":
+        search_index = context_data.get("search_index")
+        if search_index is not None:
+            # Merchant abbreviations, amounts and dates are resolved by the
+            # hybrid index instead of scanning every transaction
+            hits = search_index.search(query, k=1, vector_index=context_data.get("vector_index"),
+                                       query_vector=context_data.get("query_vector"))
+            if hits:
+                transaction = hits[0][0]
+                answer = f"{transaction.get('merchant_name')} is a {transaction.get('category')} merchant. You spent ${transaction.get('amount', 0):.2f} on {transaction.get('timestamp', '')}."
+                explain = context_data.get("explain")
+                if explain is not None:
+                    answer += f" {explain(transaction)}."
+                enrichment = getattr(transaction, "enrichment", None)
+                if enrichment is not None:
+                    verified = "verified" if enrichment.is_verified else "unverified"
+                    answer += f" It is a {verified} {enrichment.industry} merchant rated {enrichment.reputation_score:.1f}/5."
+                    if enrichment.has_fraud_reports:
+                        answer += " There are fraud reports about this merchant."
+                return answer
+        
         # Extract merchant name from query if possible
         merchant_match = re.search(r"who is ([\w\s]+)", query.lower())
-        if merchant_match and context_data.get("transactions"):
+        if search_index is None and merchant_match and context_data.get("transactions"):
             merchant_name = merchant_match.group(1)
             # Find transactions matching the merchant
             matching_transactions = [t for t in context_data["transactions"] 
@@ -246,7 +307,7 @@ def generate_contextual_response(query, context_data):
         if context_data.get("subscriptions"):
             subs = context_data["subscriptions"]
             if subs:
-                sub_list = ", ".join([f"{s.get('merchant_name')} (${s.get('avg_amount', 0):.2f})"] for s in subs[:3])
+                sub_list = ", ".join(f"{s.get('merchant_name')} (${s.get('avg_amount', 0):.2f})" for s in subs[:3])
                 return f"You have {len(subs)} active subscriptions including {sub_list}."
         return "I don't have information about your subscriptions right now."
         
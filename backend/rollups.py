@@ -0,0 +1,323 @@
+import logging
+import time
+
+import numpy as np
+
+from transaction_processor import TAX_CATEGORIES
+from transaction_store import FLAG_CREDIT, MINOR_UNITS, parse_timestamp, to_minor_units
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Default monthly budget per category (in major units)
+DEFAULT_MONTHLY_BUDGETS = {
+    "food": 400.0,
+    "grocery": 500.0,
+    "shopping": 300.0,
+    "entertainment": 100.0,
+    "transportation": 200.0,
+    "subscription": 60.0,
+    "utilities": 250.0,
+}
+
+# Share of a budget after which the status changes from on track to near the limit
+BUDGET_WARNING_RATIO = 0.9
+
+# How many months of per-month detail to keep once a month has rolled over
+RETAINED_MONTHS = 24
+
+
+def month_key(epoch):
+    tm = time.gmtime(epoch)
+    return f"{tm.tm_year:04d}-{tm.tm_mon:02d}"
+
+
+def year_key(epoch):
+    return f"{time.gmtime(epoch).tm_year:04d}"
+
+
+def _month_key(months):
+    # NumPy month number (months since 1970-01) to month_key's 'YYYY-MM'
+    year, month = divmod(months, 12)
+    return f"{1970 + year:04d}-{month + 1:02d}"
+
+
+def _year_key(years):
+    return f"{1970 + years:04d}"
+
+
+class PeriodTotals:
+    """Running debit/credit totals for one month or year, kept in minor units"""
+
+    __slots__ = ("period", "by_category", "by_tax_category", "debits", "credits", "count")
+
+    def __init__(self, period):
+        self.period = period
+        self.by_category = {}
+        self.by_tax_category = {}
+        self.debits = 0
+        self.credits = 0
+        self.count = 0
+
+    def add(self, category, amount_minor, is_credit, count=1):
+        """Add `count` transactions totalling `amount_minor`; negative values retract them"""
+        self.count += count
+        if is_credit:
+            self.credits += amount_minor
+            return
+        self.debits += amount_minor
+        self._add_to(self.by_category, category, amount_minor, count)
+        tax_category = TAX_CATEGORIES.get(category)
+        if tax_category:
+            self._add_to(self.by_tax_category, tax_category, amount_minor, count)
+
+    @staticmethod
+    def _add_to(totals, key, amount_minor, count):
+        value = totals.get(key, 0) + amount_minor
+        # A retraction that empties a category drops it, as a recompute would
+        if count < 0 and not value:
+            totals.pop(key, None)
+        else:
+            totals[key] = value
+
+    def to_state(self):
+        return [self.by_category, self.by_tax_category, self.debits, self.credits, self.count]
+
+    @classmethod
+    def from_state(cls, period, state):
+        totals = cls(period)
+        by_category, by_tax_category, totals.debits, totals.credits, totals.count = state
+        totals.by_category = dict(by_category)
+        totals.by_tax_category = dict(by_tax_category)
+        return totals
+
+    def top_category(self):
+        if not self.by_category:
+            return None
+        return max(self.by_category, key=self.by_category.get)
+
+    def as_dict(self):
+        return {
+            "period": self.period,
+            "total_spent": self.debits / MINOR_UNITS,
+            "total_income": self.credits / MINOR_UNITS,
+            "transaction_count": self.count,
+            "by_category": {c: v / MINOR_UNITS for c, v in self.by_category.items()},
+            "tax_deductible": {c: v / MINOR_UNITS for c, v in self.by_tax_category.items()},
+            "tax_deductible_total": sum(self.by_tax_category.values()) / MINOR_UNITS,
+        }
+
+
+class UserRollup:
+    """Incrementally maintained month-to-date / year-to-date totals for one user.
+
+    Every transaction updates exactly one monthly and one yearly PeriodTotals,
+    so applying a transaction is O(1). Reads return materialized snapshots
+    that are only rebuilt after the underlying totals change, so answering a
+    chat question or rendering a widget never rescans the user's history.
+    """
+
+    def __init__(self, user_id, budgets=None, opening_balance=0.0, clock=time.time):
+        self.user_id = user_id
+        self.budgets = {c: to_minor_units(v) for c, v in (budgets or DEFAULT_MONTHLY_BUDGETS).items()}
+        self.balance_minor = to_minor_units(opening_balance)
+        self._clock = clock
+        self._months = {}
+        self._years = {}
+        self._version = 0
+        self._snapshots = {}
+
+    def apply(self, transaction):
+        """Fold one transaction (dict or TransactionRecord) into the rollups"""
+        self._fold(transaction, 1)
+
+    def retract(self, transaction):
+        """Take a previously applied transaction back out of the rollups"""
+        self._fold(transaction, -1)
+
+    def _fold(self, transaction, sign):
+        if hasattr(transaction, "epoch"):
+            epoch = transaction.epoch
+        else:
+            epoch = parse_timestamp(transaction.get("timestamp"))
+        amount_minor = sign * to_minor_units(transaction.get("amount", 0))
+        is_credit = transaction.get("transaction_type", "debit") == "credit"
+        category = transaction.get("category", "uncategorized")
+
+        # A retraction from a month past the retention window only reaches the year
+        for table, key in ((self._months, month_key(epoch)), (self._years, year_key(epoch))):
+            totals = table.get(key)
+            if totals is None:
+                if sign < 0:
+                    continue
+                totals = table[key] = PeriodTotals(key)
+                if table is self._months:
+                    self._compact()
+            totals.add(category, amount_minor, is_credit, sign)
+            if not totals.count:
+                del table[key]
+
+        self.balance_minor += amount_minor if is_credit else -amount_minor
+        self._version += 1
+
+    def apply_rows(self, store, start, end):
+        """Fold rows [start, end) of a UserTransactionStore in bulk.
+
+        Rows are grouped per (period, category, debit/credit) with NumPy, so
+        the Python work is per group rather than per row; the totals come
+        out the same as applying each row.
+        """
+        if end <= start:
+            return
+        months = (store.column("timestamps", start, end)
+                  .astype("datetime64[s]").astype("datetime64[M]").astype(np.int64))
+        amounts = store.column("amounts", start, end)
+        credits = (store.column("flags", start, end) & FLAG_CREDIT) != 0
+        categories = store.column("categories", start, end).astype(np.int64)
+        decode = store.pools.categories.decode
+        width = int(categories.max()) + 1
+
+        for periods, table, key in ((months, self._months, _month_key), (months // 12, self._years, _year_key)):
+            # One int64 key per (period, category, credit)
+            keys = (periods * width + categories) * 2 + credits
+            groups, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+            sums = np.bincount(inverse.reshape(-1), weights=amounts)
+            for group, count, total in zip(groups.tolist(), counts.tolist(), sums.tolist()):
+                period, rest = divmod(group // 2, width)
+                name = key(period)
+                totals = table.get(name)
+                if totals is None:
+                    totals = table[name] = PeriodTotals(name)
+                totals.add(decode(rest), int(total), bool(group % 2), count)
+
+        credited = int(amounts[credits].sum())
+        self.balance_minor += credited - (int(amounts.sum()) - credited)
+        self._version += end - start
+        self._compact()
+
+    @property
+    def version(self):
+        return self._version
+
+    def to_state(self):
+        """Plain-data snapshot of the running totals for checkpointing"""
+        return {
+            "budgets": self.budgets,
+            "balance_minor": self.balance_minor,
+            "months": {period: totals.to_state() for period, totals in self._months.items()},
+            "years": {period: totals.to_state() for period, totals in self._years.items()},
+            "version": self._version
+        }
+
+    def restore_state(self, state):
+        self.budgets = dict(state["budgets"])
+        self.balance_minor = state["balance_minor"]
+        self._months = {period: PeriodTotals.from_state(period, data) for period, data in state["months"].items()}
+        self._years = {period: PeriodTotals.from_state(period, data) for period, data in state["years"].items()}
+        self._version = state["version"]
+        self._snapshots.clear()
+
+    def set_budget(self, category, amount):
+        self.budgets[category] = to_minor_units(amount)
+        self._version += 1
+
+    def _compact(self):
+        # Drop per-month detail beyond the retention window; yearly totals remain
+        if len(self._months) > RETAINED_MONTHS:
+            for month in sorted(self._months)[:-RETAINED_MONTHS]:
+                del self._months[month]
+
+    def _materialized(self, name, period, build):
+        # Snapshots are keyed on (name, period) and invalidated by the version,
+        # which also covers a period rollover because the key changes
+        key = (name, period)
+        cached = self._snapshots.get(key)
+        if cached is not None and cached[0] == self._version:
+            increment("rollups.snapshot_hit")
+            return cached[1]
+        increment("rollups.snapshot_miss")
+        value = build()
+        self._snapshots[key] = (self._version, value)
+        return value
+
+    def month_to_date(self):
+        month = month_key(self._clock())
+        return self._materialized("month", month, lambda: self._period_dict(self._months, month))
+
+    def year_to_date(self):
+        year = year_key(self._clock())
+        return self._materialized("year", year, lambda: self._period_dict(self._years, year))
+
+    def monthly_snapshot(self, month):
+        """Return the totals for a past or current month ('YYYY-MM')"""
+        return self._materialized("month", month, lambda: self._period_dict(self._months, month))
+
+    @staticmethod
+    def _period_dict(periods, key):
+        return (periods.get(key) or PeriodTotals(key)).as_dict()
+
+    def budget_status(self):
+        """Budget view in the shape generate_contextual_response expects"""
+        month = month_key(self._clock())
+        return self._materialized("budget", month, lambda: self._build_budget(month))
+
+    def _build_budget(self, month):
+        totals = self._months.get(month) or PeriodTotals(month)
+        categories = {}
+        for category, limit in self.budgets.items():
+            spent = totals.by_category.get(category, 0)
+            categories[category] = {
+                "limit": limit / MINOR_UNITS,
+                "spent": spent / MINOR_UNITS,
+                "remaining": (limit - spent) / MINOR_UNITS,
+                "status": self._status(spent, limit)
+            }
+
+        limit = sum(self.budgets.values())
+        spent = sum(totals.by_category.get(category, 0) for category in self.budgets)
+        return {
+            "period": month,
+            "limit": limit / MINOR_UNITS,
+            "spent": spent / MINOR_UNITS,
+            "remaining": (limit - spent) / MINOR_UNITS,
+            "status": self._status(spent, limit),
+            "categories": categories
+        }
+
+    @staticmethod
+    def _status(spent, limit):
+        if spent > limit:
+            return "over budget"
+        if spent >= BUDGET_WARNING_RATIO * limit:
+            return "close to the limit"
+        return "on track"
+
+    def spending_summary(self):
+        month = month_key(self._clock())
+        return self._materialized("summary", month, lambda: self._build_summary(month))
+
+    def _build_summary(self, month):
+        totals = self._months.get(month) or PeriodTotals(month)
+        return {"total": totals.debits / MINOR_UNITS, "top_category": totals.top_category()}
+
+    @property
+    def balance(self):
+        return self.balance_minor / MINOR_UNITS
+
+
+class RollupStore:
+    """Registry of per-user rollups"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._users = {}
+
+    def user(self, user_id):
+        rollup = self._users.get(user_id)
+        if rollup is None:
+            rollup = UserRollup(user_id, clock=self._clock)
+            self._users[user_id] = rollup
+        return rollup
+
+    def discard(self, user_id):
+        self._users.pop(user_id, None)
@@ -0,0 +1,481 @@
+import calendar
+import logging
+import math
+import re
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from metrics import timed, timer
+from transaction_store import MINOR_UNITS
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion: score = sum(weight / (RRF_K + rank)). Lexical hits
+# outrank dense-only ones, so exact merchant matches are not displaced by
+# a nearby embedding
+RRF_K = 60
+LEXICAL_WEIGHT = 1.0
+DENSE_WEIGHT = 0.5
+
+# Ranked candidates taken from each retriever before fusion
+FUSION_DEPTH = 50
+
+# Bare amounts ("$45") match within this fraction; amounts with cents match exactly
+AMOUNT_TOLERANCE = 0.05
+
+# Catching up on at least this many rows (e.g. after a backfill) indexes them
+# per distinct (merchant, description, category) with NumPy instead of per row
+BULK_SYNC_ROWS = 2000
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_VOWELS = set("aeiou")
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "at", "by", "charge", "charged", "charges", "did", "do", "for",
+    "from", "how", "i", "in", "is", "it", "me", "much", "my", "of", "on", "paid", "pay",
+    "payment", "payments", "show", "spend", "spent", "that", "the", "this", "to", "transaction",
+    "transactions", "was", "were", "what", "when", "where", "which", "who", "with", "find",
+    "over", "under", "above", "below", "than", "more", "less", "about", "around", "between",
+    "yesterday", "today", "last", "week", "month", "st", "nd", "rd", "th",
+}
+
+MONTHS = {name.lower(): number for number, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): number for number, name in enumerate(calendar.month_abbr) if name})
+
+# Month words that are also ordinary words ("may", "mar", "jan"): they only
+# filter by date with a day or a year next to them
+AMBIGUOUS_MONTHS = {name.lower() for name in calendar.month_abbr if name}
+
+_AMOUNT = re.compile(
+    r"(?:(over|above|more than|greater than|at least|under|below|less than|at most)\s+)?"
+    r"(?:\$\s?(\d+(?:\.\d{1,2})?)|\b(\d+\.\d{2})\b)"
+)
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_MONTH_DAY = re.compile(r"\b(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")\b\.?"
+                        r"(?:\s+(\d{1,2})(?:st|nd|rd|th)?\b)?(?:,?\s+(\d{4})\b)?")
+_ORDINAL_DAY = re.compile(r"\bthe\s+(\d{1,2})(?:st|nd|rd|th)\b|\bon\s+the\s+(\d{1,2})\b")
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+def skeleton(token):
+    """Consonant skeleton ("amazon" -> "amzn") so abbreviations like AMZN resolve"""
+    return token[0] + "".join(c for c in token[1:] if c not in _VOWELS)
+
+
+def _month_match(text):
+    for match in _MONTH_DAY.finditer(text):
+        if match.group(1) not in AMBIGUOUS_MONTHS or match.group(2) or match.group(3):
+            return match
+    return None
+
+
+def _day_range(year, month, day):
+    start = calendar.timegm((year, month, day, 0, 0, 0))
+    return start, start + 86400
+
+
+class ParsedQuery:
+    """Free-text terms plus amount/time range filters extracted from a question"""
+
+    __slots__ = ("terms", "amount_range", "time_range")
+
+    def __init__(self, terms, amount_range=None, time_range=None):
+        self.terms = terms
+        self.amount_range = amount_range
+        self.time_range = time_range
+
+    @property
+    def has_filters(self):
+        return self.amount_range is not None or self.time_range is not None
+
+
+def parse_query(query, reference=None):
+    """Extract terms, an amount range (minor units) and a [start, end) epoch range.
+
+    Relative dates ("the 3rd", "yesterday", "last month") resolve against
+    `reference` epoch seconds, normally the user's latest transaction.
+    """
+    text = query.lower()
+    ref = datetime.fromtimestamp(reference, timezone.utc) if reference else datetime.now(timezone.utc)
+
+    amount_range = None
+    match = _AMOUNT.search(text)
+    if match:
+        modifier, dollars, decimal = match.groups()
+        value = float(dollars or decimal)
+        minor = int(round(value * MINOR_UNITS))
+        if modifier in ("over", "above", "more than", "greater than", "at least"):
+            amount_range = (minor, None)
+        elif modifier in ("under", "below", "less than", "at most"):
+            amount_range = (None, minor)
+        elif "." in (dollars or decimal):
+            amount_range = (minor, minor)
+        else:
+            amount_range = (int(minor * (1 - AMOUNT_TOLERANCE)), int(minor * (1 + AMOUNT_TOLERANCE)))
+        text = text[:match.start()] + " " + text[match.end():]
+
+    time_range = None
+    if (match := _ISO_DATE.search(text)):
+        time_range = _day_range(*(int(part) for part in match.groups()))
+        text = text[:match.start()] + " " + text[match.end():]
+    elif (match := _month_match(text)):
+        month = MONTHS[match.group(1)]
+        if match.group(3):
+            year = int(match.group(3))
+        else:
+            year = ref.year if month <= ref.month else ref.year - 1
+        if match.group(2):
+            time_range = _day_range(year, month, int(match.group(2)))
+        else:
+            start = calendar.timegm((year, month, 1, 0, 0, 0))
+            time_range = (start, start + calendar.monthrange(year, month)[1] * 86400)
+        text = text[:match.start()] + " " + text[match.end():]
+    elif (match := _ORDINAL_DAY.search(text)):
+        day = int(match.group(1) or match.group(2))
+        year, month = ref.year, ref.month
+        if day > ref.day:
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        if day <= calendar.monthrange(year, month)[1]:
+            time_range = _day_range(year, month, day)
+    elif "yesterday" in text:
+        day = ref - timedelta(days=1)
+        time_range = _day_range(day.year, day.month, day.day)
+    elif "today" in text:
+        time_range = _day_range(ref.year, ref.month, ref.day)
+    elif "last week" in text:
+        end = _day_range(ref.year, ref.month, ref.day)[1]
+        time_range = (end - 7 * 86400, end)
+    elif "last month" in text:
+        year, month = (ref.year, ref.month - 1) if ref.month > 1 else (ref.year - 1, 12)
+        start = calendar.timegm((year, month, 1, 0, 0, 0))
+        time_range = (start, start + calendar.monthrange(year, month)[1] * 86400)
+    elif "this month" in text:
+        start = calendar.timegm((ref.year, ref.month, 1, 0, 0, 0))
+        time_range = (start, _day_range(ref.year, ref.month, ref.day)[1])
+
+    # Leftover numbers and ordinals ("3rd") are not searchable text
+    terms = [token for token in tokenize(text) if token not in STOP_WORDS and not token[0].isdigit()]
+    return ParsedQuery(terms, amount_range, time_range)
+
+
+class SortedColumnIndex:
+    """Row numbers sorted by an int64 key, for range filters via binary search.
+
+    New rows are buffered and merged on the next query, so appends stay O(1)
+    and a burst of inserts costs one merge.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.rows = np.empty(0, dtype=np.int64)
+        self._pending_keys = array('q')
+        self._pending_rows = array('q')
+
+    def add(self, key, row):
+        self._pending_keys.append(key)
+        self._pending_rows.append(row)
+
+    def add_many(self, keys, rows):
+        self._pending_keys.frombytes(np.asarray(keys, dtype=np.int64).tobytes())
+        self._pending_rows.frombytes(np.asarray(rows, dtype=np.int64).tobytes())
+
+    def _merge(self):
+        if not self._pending_keys:
+            return
+        keys = np.array(self._pending_keys, dtype=np.int64)
+        rows = np.array(self._pending_rows, dtype=np.int64)
+        self._pending_keys = array('q')
+        self._pending_rows = array('q')
+        order = np.argsort(keys, kind="stable")
+        keys, rows = keys[order], rows[order]
+        if len(self.keys) and keys[0] >= self.keys[-1]:
+            # Transactions mostly arrive in time order: a plain append
+            self.keys = np.concatenate([self.keys, keys])
+            self.rows = np.concatenate([self.rows, rows])
+        else:
+            positions = np.searchsorted(self.keys, keys, side="right")
+            self.keys = np.insert(self.keys, positions, keys)
+            self.rows = np.insert(self.rows, positions, rows)
+
+    def between(self, low=None, high=None, inclusive_high=True):
+        """Rows whose key lies in [low, high] (or [low, high) when not inclusive_high)"""
+        self._merge()
+        start = 0 if low is None else np.searchsorted(self.keys, low, side="left")
+        end = len(self.keys) if high is None else np.searchsorted(
+            self.keys, high, side="right" if inclusive_high else "left")
+        return self.rows[start:end]
+
+
+class UserSearchIndex:
+    """Incrementally maintained lexical index over one user's transaction store.
+
+    BM25 postings cover merchant, description and category tokens (tokenized
+    once per distinct string, since the store dictionary-encodes them), and
+    sorted amount/timestamp indexes serve range filters. Rows appended to the
+    store are indexed on the next search.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.indexed_rows = 0
+        self.max_epoch = None
+        self._term_ids = {}
+        self._terms = []
+        self._postings = []
+        self._frequencies = []
+        # Tokens per indexed row, grown by doubling
+        self._doc_lengths = np.zeros(1024, dtype=np.uint16)
+        self._total_length = 0
+        self._skeletons = {}
+        self._sorted_terms = None
+        self._field_terms = ({}, {}, {})
+        self.amounts = SortedColumnIndex()
+        self.timestamps = SortedColumnIndex()
+
+    def _reserve_lengths(self, rows):
+        if rows > len(self._doc_lengths):
+            grown = np.zeros(max(rows, 2 * len(self._doc_lengths)), dtype=np.uint16)
+            grown[:self.indexed_rows] = self._doc_lengths[:self.indexed_rows]
+            self._doc_lengths = grown
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self._terms)
+            self._terms.append(term)
+            self._postings.append(array('i'))
+            self._frequencies.append(array('B'))
+            if len(term) >= 4 and term.isalpha():
+                self._skeletons.setdefault(skeleton(term), []).append(term_id)
+            self._sorted_terms = None
+        return term_id
+
+    def _codes_to_terms(self, field, pool, code):
+        cache = self._field_terms[field]
+        term_ids = cache.get(code)
+        if term_ids is None:
+            term_ids = cache[code] = tuple(self._term_id(token) for token in tokenize(pool.decode(code)))
+        return term_ids
+
+    def sync(self):
+        """Index rows appended to the store since the last call"""
+        store = self.store
+        total = len(store)
+        if self.indexed_rows >= total:
+            return 0
+        if total - self.indexed_rows >= BULK_SYNC_ROWS:
+            self._reserve_lengths(total)
+            with timer("search_index.bulk_sync"):
+                self._sync_bulk(self.indexed_rows, total)
+            added = total - self.indexed_rows
+            self.indexed_rows = total
+            return added
+        pools = store.pools
+        self._reserve_lengths(total)
+        with timer("search_index.sync"):
+            for row in range(self.indexed_rows, total):
+                counts = {}
+                for term_id in (self._codes_to_terms(0, pools.merchants, store.merchants[row])
+                                + self._codes_to_terms(1, store.description_pool, store.descriptions[row])
+                                + self._codes_to_terms(2, pools.categories, store.categories[row])):
+                    counts[term_id] = counts.get(term_id, 0) + 1
+                length = 0
+                for term_id, count in counts.items():
+                    self._postings[term_id].append(row)
+                    self._frequencies[term_id].append(min(count, 255))
+                    length += count
+                self._doc_lengths[row] = min(length, 65535)
+                self._total_length += length
+                epoch = store.timestamps[row]
+                self.amounts.add(store.amounts[row], row)
+                self.timestamps.add(epoch, row)
+                if self.max_epoch is None or epoch > self.max_epoch:
+                    self.max_epoch = epoch
+        added = total - self.indexed_rows
+        self.indexed_rows = total
+        return added
+
+    def _sync_bulk(self, start, end):
+        # Rows sharing a (merchant, description, category) triple share their
+        # terms, so tokens and counts are worked out once per triple and the
+        # triple's rows are appended to each posting list in one go
+        store = self.store
+        pools = store.pools
+        codes = np.stack([store.column("merchants", start, end), store.column("descriptions", start, end),
+                          store.column("categories", start, end)], axis=1)
+        triples, inverse = np.unique(codes, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(triples) + 1))
+        lengths = np.empty(len(triples), dtype=np.int64)
+        postings = {}
+        for index, (merchant, description, category) in enumerate(triples.tolist()):
+            counts = {}
+            for term_id in (self._codes_to_terms(0, pools.merchants, merchant)
+                            + self._codes_to_terms(1, store.description_pool, description)
+                            + self._codes_to_terms(2, pools.categories, category)):
+                counts[term_id] = counts.get(term_id, 0) + 1
+            rows = order[bounds[index]:bounds[index + 1]]
+            for term_id, count in counts.items():
+                postings.setdefault(term_id, []).append((rows, min(count, 255)))
+            lengths[index] = sum(counts.values())
+
+        for term_id, parts in postings.items():
+            rows = np.concatenate([part_rows for part_rows, _ in parts])
+            frequencies = np.concatenate([np.full(len(part_rows), count, dtype=np.uint8) for part_rows, count in parts])
+            by_row = np.argsort(rows, kind="stable")
+            self._postings[term_id].frombytes((rows[by_row] + start).astype(np.int32).tobytes())
+            self._frequencies[term_id].frombytes(frequencies[by_row].tobytes())
+        row_lengths = lengths[inverse]
+        self._doc_lengths[start:end] = np.minimum(row_lengths, 65535)
+        self._total_length += int(row_lengths.sum())
+
+        rows = np.arange(start, end, dtype=np.int64)
+        timestamps = store.column("timestamps", start, end)
+        self.amounts.add_many(store.column("amounts", start, end), rows)
+        self.timestamps.add_many(timestamps, rows)
+        latest = int(timestamps.max())
+        if self.max_epoch is None or latest > self.max_epoch:
+            self.max_epoch = latest
+
+    def resolve_terms(self, tokens):
+        """Map query tokens to term ids, expanding abbreviations and prefixes"""
+        term_ids = set()
+        for token in tokens:
+            term_id = self._term_ids.get(token)
+            if term_id is not None:
+                term_ids.add(term_id)
+                continue
+            expanded = self._skeletons.get(token, [])
+            if not expanded and len(token) >= 3:
+                if self._sorted_terms is None:
+                    self._sorted_terms = sorted(self._term_ids)
+                position = bisect_left(self._sorted_terms, token)
+                while position < len(self._sorted_terms) and self._sorted_terms[position].startswith(token):
+                    expanded.append(self._term_ids[self._sorted_terms[position]])
+                    position += 1
+            term_ids.update(expanded)
+        return term_ids
+
+    def candidate_rows(self, parsed):
+        """Sorted rows passing the query's amount/time filters, or None if unfiltered"""
+        if not parsed.has_filters:
+            return None
+        rows = None
+        if parsed.amount_range is not None:
+            rows = np.sort(self.amounts.between(*parsed.amount_range))
+        if parsed.time_range is not None:
+            in_time = np.sort(self.timestamps.between(*parsed.time_range, inclusive_high=False))
+            rows = in_time if rows is None else np.intersect1d(rows, in_time, assume_unique=True)
+        return rows
+
+    def bm25(self, term_ids, candidates=None):
+        """Return (rows, scores) of BM25-ranked matches among `candidates`, best first.
+
+        Only the matched terms' postings are scored, after the filter, so a
+        query costs the size of its postings rather than of the history.
+        """
+        count = self.indexed_rows
+        if not term_ids or not count or (candidates is not None and not len(candidates)):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        average_length = self._total_length / count
+        matched_rows = []
+        matched_scores = []
+        for term_id in term_ids:
+            rows = np.array(self._postings[term_id], dtype=np.int64)
+            if not len(rows):
+                continue
+            # Document frequency counts every row, filtered or not
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            tf = np.array(self._frequencies[term_id], dtype=np.float64)
+            if candidates is not None:
+                keep = np.isin(rows, candidates, assume_unique=True)
+                rows, tf = rows[keep], tf[keep]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[rows] / average_length)
+            matched_rows.append(rows)
+            matched_scores.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+        if not matched_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        matched, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(inverse.reshape(-1), weights=np.concatenate(matched_scores), minlength=len(matched))
+        # Equal scores (same merchant) rank the most recent first
+        order = np.lexsort((-self.store.take("timestamps", matched), -scores))
+        return matched[order], scores[order]
+
+    @timed("search_index.search")
+    def search(self, query, k=5, vector_index=None, query_vector=None):
+        """Hybrid search: metadata pre-filter, BM25, dense search, rank fusion.
+
+        Returns up to k (TransactionRecord, score) pairs. Dense search runs
+        only when both `vector_index` and `query_vector` are given, and only
+        over the rows left after the amount/time filters.
+        """
+        self.sync()
+        parsed = parse_query(query, self.max_epoch)
+        candidates = self.candidate_rows(parsed)
+        term_ids = self.resolve_terms(parsed.terms)
+
+        lexical_rows, _ = self.bm25(term_ids, candidates)
+        if not len(lexical_rows) and candidates is not None and not term_ids:
+            # Pure filter questions ("over $500 last month"): newest first
+            order = np.argsort(-self.store.take("timestamps", candidates), kind="stable")
+            lexical_rows = candidates[order]
+
+        fused = {}
+        for rank, row in enumerate(lexical_rows[:FUSION_DEPTH].tolist()):
+            fused[row] = LEXICAL_WEIGHT / (RRF_K + rank + 1)
+
+        if vector_index is not None and query_vector is not None:
+            for rank, row in enumerate(self._dense_rows(vector_index, query_vector, candidates)):
+                fused[row] = fused.get(row, 0.0) + DENSE_WEIGHT / (RRF_K + rank + 1)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.store[row], score) for row, score in ranked]
+
+    def _dense_rows(self, vector_index, query_vector, candidates):
+        candidate_ids = None
+        if candidates is not None:
+            candidate_ids = {self.store.transaction_ids[row] for row in candidates.tolist()}
+            if not candidate_ids:
+                return []
+        with timer("search_index.dense_search"):
+            try:
+                results = vector_index.search(query_vector, k=FUSION_DEPTH, candidate_ids=candidate_ids)
+            except TypeError:
+                # Indexes without pre-filter support: over-fetch, then filter
+                results = vector_index.search(query_vector, k=FUSION_DEPTH * 10)
+                if candidate_ids is not None:
+                    results = [result for result in results if result[0] in candidate_ids]
+        rows = []
+        for transaction_id, _ in results[:FUSION_DEPTH]:
+            record = self.store.get(transaction_id)
+            if record is not None:
+                rows.append(record.row)
+        return rows
+
+
+class SearchIndexStore:
+    """Per-user search indexes over a TransactionStore, created on first use"""
+
+    def __init__(self, transaction_store):
+        self.transaction_store = transaction_store
+        self._indexes = {}
+
+    def user(self, user_id):
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._indexes[user_id] = UserSearchIndex(self.transaction_store.user(user_id))
+        return index
+
+    def discard(self, user_id):
+        self._indexes.pop(user_id, None)
@@ -0,0 +1,541 @@
+"""User-sharded serving: a consistent-hash ring, user handoff and a local router.
+
+    python sharding.py --workers 4 --port 8000
+
+starts four shard workers (`uvicorn main:app` on --base-port, --base-port+1,
+...) and a router on --port that forwards each request to the worker
+owning its user. Each worker keeps only its users' stores and indexes.
+POST /shards with the X-Shard-Secret header starts one more worker and
+moves the users the new ring assigns to it.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import secrets
+import struct
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from auth import bearer_token, user_for_token
+from checkpoint import decode_enrichments, decode_user_snapshot, encode_user_snapshot, loads
+from http_cache import dumps
+from metrics import REGISTRY, increment
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Points per shard on the ring; more points even out each shard's share of
+# users (within about 10% of 1/N at 128)
+VIRTUAL_NODES = 128
+
+# Carries the shared secret on shard-internal endpoints and POST /shards
+SECRET_HEADER = "x-shard-secret"
+
+# Handoff bodies and user exports are sequences of length-prefixed frames
+FRAME_HEADER = struct.Struct("<I")
+
+# Per-connection headers that must not be forwarded as-is
+HOP_BY_HOP_HEADERS = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade"
+}
+
+# How long the launcher waits for a new worker to report ready
+SHARD_READY_TIMEOUT_SECONDS = 120
+
+
+class ShardingError(Exception):
+    pass
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping user ids to shard ids.
+
+    Each shard sits at VIRTUAL_NODES points and a user belongs to the first
+    point at or after its hash. Adding a shard only moves users onto the new
+    shard (about 1/N of them), never between the existing ones.
+    """
+
+    def __init__(self, shards, vnodes=VIRTUAL_NODES):
+        if not shards:
+            raise ShardingError("A hash ring needs at least one shard")
+        self.shards = sorted(shards)
+        self.vnodes = vnodes
+        points = sorted((_hash(f"{shard}#{i}"), shard) for shard in self.shards for i in range(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    def owner(self, user_id):
+        index = bisect.bisect_left(self._points, _hash(str(user_id)))
+        return self._owners[index % len(self._owners)]
+
+    def with_shard(self, shard):
+        if shard in self.shards:
+            raise ShardingError(f"Shard {shard} is already on the ring")
+        return HashRing(self.shards + [shard], self.vnodes)
+
+    def __contains__(self, shard):
+        return shard in self.shards
+
+
+class ShardMembership:
+    """A worker's view of the ring: which users its shard serves"""
+
+    def __init__(self, shard_id, shards):
+        self.shard_id = shard_id
+        self.ring = HashRing(shards)
+
+    def owns(self, user_id):
+        return self.ring.owner(user_id) == self.shard_id
+
+    def update(self, shards):
+        self.ring = HashRing(shards)
+
+
+def pack_frames(frames):
+    return b"".join(FRAME_HEADER.pack(len(frame)) + frame for frame in frames)
+
+
+def iter_frames(data):
+    offset = 0
+    while offset < len(data):
+        (length,) = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        yield data[offset:offset + length]
+        offset += length
+
+
+def export_user(user_id, transaction_store, rollups, trends):
+    """Serialize a user's store, rollups and trends for another process.
+
+    Store columns hold codes into this process's shared string pools, so the
+    strings they refer to travel with the snapshot; the user's own
+    descriptions and enrichments (keyed by merchant name) are in its metadata.
+    """
+    store = transaction_store.user(user_id)
+    strings = {}
+    for name in transaction_store.pools.NAMES:
+        pool = getattr(transaction_store.pools, name)
+        codes = np.unique(np.frombuffer(getattr(store, name), dtype=np.int32)) if len(store) else []
+        strings[name] = {int(code): pool.decode(code) for code in codes}
+    return pack_frames([
+        dumps({"strings": strings}),
+        encode_user_snapshot(store, rollups.user(user_id), trends.user(user_id))
+    ])
+
+
+def import_user(data, transaction_store, rollups, trends):
+    """Install a user exported by another process, re-encoding its string codes; returns the user id"""
+    header, snapshot = iter_frames(data)
+    strings = loads(header)["strings"]
+    metadata, transaction_ids, columns = decode_user_snapshot(snapshot)
+    user_id = metadata["user_id"]
+    if len(transaction_store.user(user_id)):
+        raise ShardingError(f"User {user_id} already has data on this shard")
+
+    for name in transaction_store.pools.NAMES:
+        codes = np.frombuffer(columns[name], dtype=np.int32)
+        if not len(codes):
+            continue
+        pool = getattr(transaction_store.pools, name)
+        mapping = np.zeros(int(codes.max()) + 1, dtype=np.int32)
+        for code, value in strings[name].items():
+            mapping[int(code)] = pool.encode(value)
+        columns[name] = mapping[codes].tobytes()
+
+    # Drop any empty placeholders created before the handoff
+    transaction_store.discard(user_id)
+    rollups.discard(user_id)
+    trends.discard(user_id)
+    transaction_store.user(user_id).restore(transaction_ids, columns, metadata["version"],
+                                            metadata["descriptions"], decode_enrichments(metadata))
+    rollups.user(user_id).restore_state(metadata["rollup"])
+    trends.user(user_id).restore_state(metadata["trends"])
+    return user_id
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status, content):
+    body = dumps(content)
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class ShardRouter:
+    """ASGI app forwarding each request to the shard that owns its user.
+
+    Requests are routed by the user their bearer token authenticates;
+    anything else (login, unauthenticated calls) goes to the first shard.
+    /ready aggregates every shard and GET /shards describes the ring.
+    Shard-internal endpoints are not reachable through the router.
+
+    While users are handed over to a new shard, only requests for the
+    users that move are held back; everyone else keeps being served.
+    """
+
+    def __init__(self, shard_urls, secret, spawn_shard=None, retire_shard=None, max_connections=64):
+        self.secret = secret
+        self.spawn_shard = spawn_shard
+        self.retire_shard = retire_shard
+        self.max_connections = max_connections
+        self.urls = dict(shard_urls)
+        self.ring = HashRing(list(self.urls))
+        self.clients = {shard: self._client(url) for shard, url in self.urls.items()}
+        self._moving = None
+        self._resume = None
+        self._inflight = {}
+        self._drained = None
+        self._rebalance_lock = None
+
+    def _client(self, url):
+        return httpx.AsyncClient(
+            base_url=url, timeout=60.0,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections)
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        if self._drained is None:
+            self._drained = asyncio.Condition()
+            self._rebalance_lock = asyncio.Lock()
+
+        path = scope["path"]
+        if path.startswith("/internal/"):
+            return await _send_json(send, 404, {"detail": "Not Found"})
+        if path == "/ready":
+            return await self._ready(send)
+        if path == "/shards":
+            return await self._shards(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        user_id = user_for_token(bearer_token(headers.get(b"authorization", b"").decode("latin-1")))
+        if user_id is None:
+            return await self._forward(self.ring.shards[0], scope, receive, send)
+
+        while self._moving is not None and self._moving.owner(user_id) != self.ring.owner(user_id):
+            increment("router.held_for_handoff")
+            await self._resume.wait()
+        shard = self.ring.owner(user_id)
+        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+        try:
+            await self._forward(shard, scope, receive, send)
+        finally:
+            remaining = self._inflight[user_id] - 1
+            if remaining:
+                self._inflight[user_id] = remaining
+            else:
+                del self._inflight[user_id]
+                if self._moving is not None:
+                    async with self._drained:
+                        self._drained.notify_all()
+
+    async def _forward(self, shard, scope, receive, send):
+        body = await _read_body(receive)
+        query = scope["query_string"].decode("latin-1")
+        url = scope["path"] + (f"?{query}" if query else "")
+        headers = [(key, value) for key, value in scope["headers"]
+                   if key not in HOP_BY_HOP_HEADERS and key not in (b"host", b"content-length")]
+        client = self.clients[shard]
+        started = time.perf_counter_ns()
+        try:
+            response = await client.send(
+                client.build_request(scope["method"], url, headers=headers, content=body), stream=True
+            )
+        except httpx.HTTPError as e:
+            increment("router.upstream_error")
+            logger.error("Forwarding %s to shard %s failed: %s", url, shard, e)
+            return await _send_json(send, 502, {"detail": f"Shard {shard} is unavailable"})
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(key, value) for key, value in response.headers.raw
+                            if key.lower() not in HOP_BY_HOP_HEADERS]
+            })
+            # Raw bytes keep the shard's Content-Encoding and Content-Length valid
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+            increment(f"router.forwarded.{shard}")
+            REGISTRY.observe("router.forward", time.perf_counter_ns() - started)
+
+    async def _ready(self, send):
+        results = await asyncio.gather(
+            *(self.clients[shard].get("/ready") for shard in self.ring.shards), return_exceptions=True
+        )
+        shards = {}
+        for shard, result in zip(self.ring.shards, results):
+            if isinstance(result, Exception):
+                shards[shard] = {"ready": False, "error": str(result)}
+            else:
+                shards[shard] = result.json()
+        ready = all(snapshot.get("ready") for snapshot in shards.values())
+        await _send_json(send, 200 if ready else 503, {"ready": ready, "shards": shards})
+
+    async def _shards(self, scope, receive, send):
+        if scope["method"] == "GET":
+            return await _send_json(send, 200, self.describe())
+        if scope["method"] != "POST":
+            return await _send_json(send, 405, {"detail": "Method Not Allowed"})
+        provided = dict(scope["headers"]).get(SECRET_HEADER.encode(), b"").decode("latin-1")
+        if not secrets.compare_digest(provided, self.secret):
+            return await _send_json(send, 403, {"detail": "Forbidden"})
+
+        body = await _read_body(receive)
+        request = loads(body) if body else {}
+        try:
+            if request.get("url"):
+                result = await self.add_shard(request["shard_id"], request["url"])
+            elif self.spawn_shard is not None:
+                shard, url = await self.spawn_shard()
+                try:
+                    result = await self.add_shard(shard, url)
+                except Exception:
+                    # The handoff was rolled back; stop the worker nobody routes to
+                    if self.retire_shard is not None:
+                        await asyncio.to_thread(self.retire_shard, shard)
+                    raise
+            else:
+                return await _send_json(send, 400, {"detail": "shard_id and url are required"})
+        except (ShardingError, httpx.HTTPError) as e:
+            logger.error("Adding a shard failed: %s", e)
+            return await _send_json(send, 500, {"detail": str(e)})
+        await _send_json(send, 200, result)
+
+    def describe(self):
+        return {"shards": self.urls, "virtual_nodes": self.ring.vnodes, "rebalancing": self._moving is not None}
+
+    async def _internal(self, shard, path, **kwargs):
+        response = await self.clients[shard].post(path, headers={SECRET_HEADER: self.secret}, **kwargs)
+        if response.status_code != 200:
+            raise ShardingError(f"{path} on shard {shard} failed with {response.status_code}: {response.text}")
+        return response
+
+    async def _drain(self, new_ring):
+        # Wait for in-flight requests of users that are about to move
+        async with self._drained:
+            await self._drained.wait_for(lambda: not any(
+                new_ring.owner(user_id) != self.ring.owner(user_id) for user_id in self._inflight
+            ))
+
+    async def add_shard(self, shard, url):
+        """Put a new shard on the ring and hand over the users it now owns"""
+        if self._rebalance_lock is None:
+            self._drained = asyncio.Condition()
+            self._rebalance_lock = asyncio.Lock()
+        async with self._rebalance_lock:
+            old_ring = self.ring
+            new_ring = old_ring.with_shard(shard)
+            self.urls[shard] = url
+            self.clients[shard] = self._client(url)
+            started = time.perf_counter()
+            self._resume = asyncio.Event()
+            self._moving = new_ring
+            moved = {}
+            try:
+                await self._drain(new_ring)
+                for donor in old_ring.shards:
+                    # The donor stops serving the moving users and exports them
+                    response = await self._internal(donor, "/internal/handoff", json={"shards": new_ring.shards})
+                    users = moved[donor] = []
+                    for export in iter_frames(response.content):
+                        adopted = await self._internal(shard, "/internal/adopt", content=export)
+                        users.append(adopted.json()["user_id"])
+                # Only now does the new shard own (and sync feeds for) the moved
+                # users; it checkpoints them before answering
+                await self._internal(shard, "/internal/ring", json={"shards": new_ring.shards})
+                self.ring = new_ring
+            except Exception:
+                await self._roll_back(shard, old_ring, moved)
+                raise
+            finally:
+                self._moving = None
+                self._resume.set()
+            # Every user is on the new shard, so donors may forget their copies.
+            # A failed release leaves a stale copy the donor no longer serves.
+            for donor, users in moved.items():
+                if users:
+                    try:
+                        await self._internal(donor, "/internal/release", json={"users": users})
+                    except (ShardingError, httpx.HTTPError) as e:
+                        increment("router.release_failed")
+                        logger.error("Shard %s could not release %d handed-off users: %s", donor, len(users), e)
+
+        pause_seconds = time.perf_counter() - started
+        increment("router.rebalance")
+        moved_users = sum(len(users) for users in moved.values())
+        logger.info("Added shard %s at %s: moved %d users in %.3fs", shard, url, moved_users, pause_seconds)
+        return {
+            "shard": shard,
+            "moved_users": moved_users,
+            "moved_from": {donor: len(users) for donor, users in moved.items()},
+            "handoff_seconds": round(pause_seconds, 4)
+        }
+
+    async def _roll_back(self, shard, old_ring, moved):
+        """Undo a failed handoff: donors serve their users again, the new shard drops what it adopted"""
+        for member in old_ring.shards + [shard]:
+            try:
+                await self._internal(member, "/internal/ring", json={"shards": old_ring.shards})
+            except (ShardingError, httpx.HTTPError) as e:
+                logger.error("Could not restore the ring on shard %s: %s", member, e)
+        adopted = [user_id for users in moved.values() for user_id in users]
+        if adopted:
+            # Off the old ring the new shard owns none of them, so release discards them all
+            try:
+                await self._internal(shard, "/internal/release", json={"users": adopted})
+            except (ShardingError, httpx.HTTPError) as e:
+                logger.error("Shard %s could not discard %d adopted users: %s", shard, len(adopted), e)
+        del self.urls[shard]
+        await self.clients.pop(shard).aclose()
+        increment("router.rebalance_rolled_back")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self.clients.values():
+                    await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+class ShardCluster:
+    """Starts and stops local shard worker processes for the launcher"""
+
+    def __init__(self, workers, base_port, secret, host="127.0.0.1"):
+        self.base_port = base_port
+        self.secret = secret
+        self.host = host
+        self.shards = [f"shard-{i}" for i in range(workers)]
+        self.ports = {shard: base_port + i for i, shard in enumerate(self.shards)}
+        self.processes = {}
+        self._spawned = workers
+
+    def url(self, shard):
+        return f"http://{self.host}:{self.ports[shard]}"
+
+    @property
+    def urls(self):
+        return {shard: self.url(shard) for shard in self.shards}
+
+    def _spawn(self, shard, ring_shards):
+        env = dict(os.environ, FINAI_SHARD_ID=shard, FINAI_SHARDS=",".join(ring_shards),
+                   FINAI_SHARD_SECRET=self.secret)
+        self.processes[shard] = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", self.host, "--port", str(self.ports[shard]),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env
+        )
+
+    async def _wait_ready(self, shard):
+        deadline = time.monotonic() + SHARD_READY_TIMEOUT_SECONDS
+        async with httpx.AsyncClient(base_url=self.url(shard), timeout=5.0) as client:
+            while time.monotonic() < deadline:
+                if self.processes[shard].poll() is not None:
+                    raise ShardingError(f"Shard {shard} exited with {self.processes[shard].returncode}")
+                try:
+                    if (await client.get("/ready")).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise ShardingError(f"Shard {shard} was not ready after {SHARD_READY_TIMEOUT_SECONDS}s")
+
+    async def start(self):
+        for shard in self.shards:
+            self._spawn(shard, self.shards)
+        await asyncio.gather(*(self._wait_ready(shard) for shard in self.shards))
+
+    async def spawn_next(self):
+        """Start one more worker; it learns the new ring from the router's handoff"""
+        shard = f"shard-{self._spawned}"
+        self.ports[shard] = self.base_port + self._spawned
+        self._spawned += 1
+        # It starts on the current ring, so it owns (and seeds) nobody yet
+        self._spawn(shard, self.shards)
+        try:
+            await self._wait_ready(shard)
+        except Exception:
+            await asyncio.to_thread(self.retire, shard)
+            raise
+        self.shards.append(shard)
+        return shard, self.url(shard)
+
+    def retire(self, shard):
+        """Stop a worker that never joined the ring (its port is not reused)"""
+        if shard in self.shards:
+            self.shards.remove(shard)
+        process = self.processes.pop(shard)
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0", help="router address")
+    parser.add_argument("--port", type=int, default=8000, help="router port")
+    parser.add_argument("--base-port", type=int, default=8100, help="port of the first shard worker")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    secret = os.environ.get("FINAI_SHARD_SECRET") or secrets.token_hex(16)
+    cluster = ShardCluster(args.workers, args.base_port, secret)
+    try:
+        asyncio.run(cluster.start())
+        logger.info("Started %d shard workers on ports %d-%d", args.workers, args.base_port,
+                    args.base_port + args.workers - 1)
+        router = ShardRouter(cluster.urls, secret, spawn_shard=cluster.spawn_next, retire_shard=cluster.retire)
+        uvicorn.run(router, host=args.host, port=args.port, log_level="warning")
+    finally:
+        cluster.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
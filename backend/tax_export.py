@@ -0,0 +1,174 @@
+import csv
+import io
+import logging
+from datetime import datetime, timedelta, timezone
+
+from transaction_processor import TAX_CATEGORIES
+from transaction_store import MINOR_UNITS
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "transaction_id", "timestamp", "merchant_name", "description", "category",
+    "tax_category", "transaction_type", "source_platform", "amount"
+]
+
+EXPORT_CHUNK_SIZE = 5000
+
+
+def parse_export_date(value, end_of_day=False):
+    """Parse a YYYY-MM-DD filter into epoch seconds (end dates are inclusive)"""
+    if not value:
+        return None
+    day = datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    if end_of_day:
+        day += timedelta(days=1)
+    return int(day.timestamp())
+
+
+class CategorySubtotals:
+    """Running per-category totals accumulated while rows stream past"""
+
+    def __init__(self):
+        self._totals = {}
+
+    def add(self, record):
+        if record.transaction_type != "debit":
+            return
+        entry = self._totals.setdefault(record.category, [0, 0])
+        entry[0] += record.amount_minor
+        entry[1] += 1
+
+    def rows(self):
+        """Yield (category, tax_category, total, count) sorted by category"""
+        for category in sorted(self._totals):
+            total_minor, count = self._totals[category]
+            yield category, TAX_CATEGORIES.get(category, ""), total_minor / MINOR_UNITS, count
+
+    def tax_deductible_total(self):
+        return sum(
+            total_minor for category, (total_minor, _) in self._totals.items()
+            if category in TAX_CATEGORIES
+        ) / MINOR_UNITS
+
+
+def _record_row(record):
+    return [
+        record.transaction_id, record.timestamp, record.merchant_name,
+        record.description, record.category, TAX_CATEGORIES.get(record.category, ""),
+        record.transaction_type, record.source_platform, f"{record.amount:.2f}"
+    ]
+
+
+def stream_csv(store, start=None, end=None, categories=None, include_subtotals=True,
+               chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream a user's transactions as CSV text, one store chunk at a time.
+
+    Memory use is bounded by `chunk_size` regardless of history length. When
+    `include_subtotals` is set, a per-category tax summary section follows the
+    transaction rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    subtotals = CategorySubtotals()
+
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in store.iter_chunks(chunk_size, start=start, end=end, categories=categories):
+        for record in chunk:
+            writer.writerow(_record_row(record))
+            subtotals.add(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if include_subtotals:
+        writer.writerow([])
+        writer.writerow(["category", "tax_category", "total_spent", "transaction_count"])
+        for category, tax_category, total, count in subtotals.rows():
+            writer.writerow([category, tax_category, f"{total:.2f}", count])
+        writer.writerow(["tax_deductible_total", "", f"{subtotals.tax_deductible_total():.2f}", ""])
+    yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(store, start=None, end=None, categories=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream a user's transactions as a Parquet file, one row group per store chunk.
+
+    Per-category tax subtotals come from a chunked vectorized pre-pass over the
+    store and are written to the schema's key/value metadata. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("transaction_id", pa.string()),
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("merchant_name", pa.string()),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("tax_category", pa.string()),
+        ("transaction_type", pa.string()),
+        ("source_platform", pa.string()),
+        ("amount", pa.float64()),
+    ])
+
+    totals = store.category_totals(start, end)
+    if categories:
+        totals = {category: total for category, total in totals.items() if category in categories}
+    tax_deductible_total = sum(
+        total for category, total in totals.items() if category in TAX_CATEGORIES
+    )
+    schema = schema.with_metadata({
+        "category_subtotals": ";".join(
+            f"{category}={totals[category]:.2f}" for category in sorted(totals)
+        ),
+        "tax_deductible_total": f"{tax_deductible_total:.2f}",
+    })
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    for chunk in store.iter_chunks(chunk_size, start=start, end=end, categories=categories):
+        columns = {name: [] for name in schema.names}
+        for record in chunk:
+            columns["transaction_id"].append(record.transaction_id)
+            columns["timestamp"].append(record.epoch)
+            columns["merchant_name"].append(record.merchant_name)
+            columns["description"].append(record.description)
+            columns["category"].append(record.category)
+            columns["tax_category"].append(TAX_CATEGORIES.get(record.category, ""))
+            columns["transaction_type"].append(record.transaction_type)
+            columns["source_platform"].append(record.source_platform)
+            columns["amount"].append(record.amount)
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_available():
+    """Check whether the optional pyarrow dependency is installed"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
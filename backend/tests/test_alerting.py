@@ -0,0 +1,83 @@
+import alerting
+from alerting import AlertPipeline
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def alert(i, merchant="Starbucks", user_id="u"):
+    return {"user_id": user_id, "rule_id": "anomaly", "merchant_name": merchant, "transaction_id": f"tx_{i}"}
+
+
+def test_exact_duplicates_are_dropped():
+    pipeline = AlertPipeline(clock=Clock())
+    assert len(pipeline.submit(alert(1))) == 1
+    assert pipeline.submit(alert(1)) == []
+    assert pipeline.stats["duplicates"] == 1
+
+
+def test_repeats_within_the_window_are_coalesced_into_one_digest():
+    clock = Clock()
+    pipeline = AlertPipeline(window_seconds=600, clock=clock)
+    assert [a["transaction_id"] for a in pipeline.submit(alert(1))] == ["tx_1"]
+    assert pipeline.submit(alert(2)) == []
+    assert pipeline.submit(alert(3)) == []
+    clock.now += 599
+    assert pipeline.flush() == []
+
+    clock.now += 1
+    [digest] = pipeline.flush()
+    assert digest["alert_type"] == "digest"
+    assert digest["transaction_ids"] == ["tx_2", "tx_3"] and digest["count"] == 2
+    assert pipeline.open_windows == 0
+    # Recomputing the same digest yields the same id
+    assert digest["alert_id"] == pipeline._digest("u", "anomaly", "Starbucks",
+                                                  alerting._Backlog(10, [alert(2), alert(3)]),
+                                                  clock.now)["alert_id"]
+
+
+def test_token_bucket_holds_back_a_burst_and_refills_over_time():
+    clock = Clock()
+    pipeline = AlertPipeline(rate_capacity=2, rate_per_hour=3600, clock=clock)
+    emitted = [a for i in range(5) for a in pipeline.submit(alert(i, merchant=f"m{i}"))]
+    assert [a["transaction_id"] for a in emitted] == ["tx_0", "tx_1"]
+    assert pipeline.held_back == 3 and pipeline.stats["rate_limited"] == 3
+    assert pipeline.flush() == []
+
+    # One token per second at 3600/hour
+    clock.now += 1
+    [digest] = pipeline.flush()
+    assert digest["rule_id"] == "rate_limited"
+    assert digest["transaction_ids"] == ["tx_2", "tx_3", "tx_4"]
+    assert pipeline.held_back == 0
+
+
+def test_backlogs_are_bounded_but_still_counted(monkeypatch):
+    monkeypatch.setattr(alerting, "MAX_SUPPRESSED_PER_WINDOW", 3)
+    monkeypatch.setattr(alerting, "MAX_HELD_BACK_PER_USER", 2)
+    clock = Clock()
+    pipeline = AlertPipeline(window_seconds=60, rate_capacity=1, rate_per_hour=1, clock=clock)
+    pipeline.submit(alert(0))
+    for i in range(1, 11):
+        pipeline.submit(alert(i))
+    assert len(pipeline._windows[("u", "anomaly", "Starbucks")].suppressed) == 3
+
+    # The bucket is empty, so the window's digest and later first alerts are held back
+    clock.now += 60
+    assert pipeline.flush() == []
+    pipeline.submit(alert(11, merchant="Blue Bottle"))
+    pipeline.submit(alert(12, merchant="Peet's"))
+    assert pipeline.held_back == 2
+
+    restored = AlertPipeline(window_seconds=60, rate_capacity=1, rate_per_hour=1, clock=clock)
+    restored.restore_state(pipeline.to_state())
+    clock.now += 3600
+    [digest] = restored.flush()
+    # The 10-alert window digest was dropped from the backlog but not from the count
+    assert digest["transaction_ids"] == ["tx_11", "tx_12"]
+    assert digest["count"] == 12
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+
+from api_integration import Account, CursorStore, SyncScheduler, build_connectors, normalize_timestamp
+
+ACCOUNT = Account("acc-1", "user-1", "open_banking")
+
+
+def feed(records):
+    """Open-banking stand-in paging `records` two at a time by index"""
+    def handler(request):
+        start = int(request.url.params.get("since", 0))
+        page = records[start:start + 2]
+        return httpx.Response(200, json={
+            "transactions": page,
+            "next_since": str(start + len(page)),
+            "has_more": start + len(page) < len(records)
+        })
+    return httpx.MockTransport(handler)
+
+
+def record(index, timestamp="2024-01-01 10:00:00"):
+    return {"id": str(index), "amount": -10.0 - index, "merchant": "Shop", "timestamp": timestamp}
+
+
+def run_round(records, sink, cursor_store):
+    connectors = build_connectors({"open_banking": {"base_url": "http://feed", "max_retries": 0}},
+                                  transport=feed(records))
+    scheduler = SyncScheduler(connectors, cursor_store, sink=sink)
+
+    async def round_trip():
+        try:
+            return await scheduler.sync_all([ACCOUNT])
+        finally:
+            await scheduler.aclose()
+    return asyncio.run(round_trip())
+
+
+def test_cursor_commits_only_after_the_sink_succeeds(tmp_path):
+    records = [record(i) for i in range(5)]
+    cursor_store = CursorStore(str(tmp_path / "cursors.json"))
+    ingested = []
+
+    def failing_sink(account, transactions):
+        raise ValueError("sink failed")
+
+    # A failing sink does not end the round, and the cursor stays put
+    results = run_round(records, failing_sink, cursor_store)
+    assert results[0].error == "sink failed"
+    assert cursor_store.get("open_banking", "acc-1") is None
+    assert CursorStore(cursor_store.path).get("open_banking", "acc-1") is None
+
+    # The next round fetches the same pages again and then commits
+    run_round(records, lambda account, transactions: ingested.extend(transactions), cursor_store)
+    assert [t["transaction_id"] for t in ingested] == [f"open_banking_{i}" for i in range(5)]
+    assert CursorStore(cursor_store.path).get("open_banking", "acc-1") == "5"
+
+    # Nothing new: nothing re-ingested
+    ingested.clear()
+    run_round(records, lambda account, transactions: ingested.extend(transactions), cursor_store)
+    assert ingested == []
+
+
+def test_timestamps_are_normalized_and_bad_records_skipped():
+    records = [record(0, "2024-01-01T10:00:00Z"), record(1, "not a date"), record(2, "2024-01-01T12:30:00+02:00")]
+    ingested = []
+    results = run_round(records, lambda account, transactions: ingested.extend(transactions), CursorStore())
+    assert results[0].error is None
+    assert [(t["transaction_id"], t["timestamp"]) for t in ingested] == [
+        ("open_banking_0", "2024-01-01 10:00:00"),
+        ("open_banking_2", "2024-01-01 10:30:00"),
+    ]
+    assert ingested[0]["transaction_type"] == "debit"
+
+
+def test_normalize_timestamp_formats():
+    assert normalize_timestamp("2024-01-01 10:00:00") == "2024-01-01 10:00:00"
+    assert normalize_timestamp("2024-01-01T10:00:00.250") == "2024-01-01 10:00:00"
+    assert normalize_timestamp(1704103200) == "2024-01-01 10:00:00"
@@ -0,0 +1,111 @@
+import csv
+import json
+
+import pytest
+
+from backfill import Backfill, BackfillError, DateParser
+from rollups import RollupStore
+from search_index import SearchIndexStore
+from transaction_processor import TransactionProcessor
+from transaction_store import TransactionStore
+from trends import TrendStore
+
+RECORDS = [
+    {"transaction_id": "tx_1", "amount": 25.99, "merchant_name": "Starbucks", "category": "food",
+     "timestamp": "2023-11-01 10:30:00", "source_platform": "bank", "description": "Coffee"},
+    {"transaction_id": "tx_2", "amount": 2000.0, "merchant_name": "Employer", "category": "income",
+     "timestamp": "2023-11-02 09:00:00", "source_platform": "bank", "description": "Payroll",
+     "transaction_type": "credit"},
+    {"transaction_id": "tx_3", "amount": 54.3, "merchant_name": "Shell", "category": "transport",
+     "timestamp": "2023-11-03 18:15:00", "source_platform": "bank", "description": "Fuel",
+     "transaction_type": "debit"},
+]
+
+
+class State:
+    def __init__(self):
+        self.transaction_store = TransactionStore()
+        self.rollups = RollupStore()
+        self.trends = TrendStore()
+        self.search_indexes = SearchIndexStore(self.transaction_store)
+
+    def append(self, transactions):
+        store = self.transaction_store.user("u")
+        for transaction in transactions:
+            record = store[store.append(transaction)]
+            self.rollups.user("u").apply(record)
+            self.trends.user("u").apply(record)
+
+    def backfill(self, path, format):
+        Backfill("u", str(path), self.transaction_store, self.rollups, self.trends, self.search_indexes,
+                 TransactionProcessor(), format=format).run()
+
+    def fingerprint(self):
+        return (
+            [record.to_dict() for record in self.transaction_store.user("u")],
+            self.rollups.user("u").to_state(),
+            self.trends.user("u").snapshot()
+        )
+
+
+def write_ndjson(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+
+def write_csv(path, records):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Transaction ID", "Date", "Payee", "Description", "Category", "Source", "Amount"])
+        for r in records:
+            amount = r["amount"] if r.get("transaction_type") == "credit" else -r["amount"]
+            writer.writerow([r["transaction_id"], r["timestamp"], r["merchant_name"], r["description"],
+                             r["category"], r["source_platform"], f"{amount:.2f}"])
+
+
+@pytest.mark.parametrize("format, write", [("ndjson", write_ndjson), ("csv", write_csv)])
+def test_backfill_matches_live_append(tmp_path, format, write):
+    live = State()
+    live.append(RECORDS)
+
+    path = tmp_path / f"statement.{format}"
+    write(path, RECORDS)
+    backfilled = State()
+    backfilled.backfill(path, format)
+
+    assert backfilled.fingerprint() == live.fingerprint()
+    assert backfilled.transaction_store.user("u").get("tx_1").transaction_type == "debit"
+
+
+def test_ndjson_keeps_amounts_as_live_append_does(tmp_path):
+    records = [dict(RECORDS[0], transaction_id="refund", amount=-5.0)]
+    live = State()
+    live.append(records)
+
+    path = tmp_path / "statement.ndjson"
+    write_ndjson(path, records)
+    backfilled = State()
+    backfilled.backfill(path, "ndjson")
+
+    assert backfilled.fingerprint() == live.fingerprint()
+
+
+def test_compact_dates_fall_back_to_the_statement_formats(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_text("Date,Payee,Amount\n20231101,Starbucks,-4.50\n20231102,Employer,2000.00\n")
+    state = State()
+    state.backfill(path, "csv")
+
+    records = [record.to_dict() for record in state.transaction_store.user("u")]
+    assert [record["timestamp"] for record in records] == ["2023-11-01 00:00:00", "2023-11-02 00:00:00"]
+    assert [record["transaction_type"] for record in records] == ["debit", "credit"]
+
+
+def test_compact_timestamps_parse_to_seconds():
+    assert DateParser().many(["20231101103000"]).tolist() == [1698834600]
+
+
+def test_csv_row_without_debit_or_credit_is_rejected(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_text("Date,Payee,Debit,Credit\n2023-11-01,Starbucks,4.50,\n2023-11-02,Nobody,,\n")
+    with pytest.raises(BackfillError, match="line 3"):
+        State().backfill(path, "csv")
@@ -0,0 +1,99 @@
+from alerting import AlertPipeline
+from checkpoint import CheckpointManager
+from rollups import RollupStore
+from transaction_store import TransactionStore
+from trends import TrendStore
+
+
+def transaction(i, merchant="Starbucks", amount=4.5):
+    return {"transaction_id": f"tx_{i}", "amount": amount, "merchant_name": merchant, "category": "food",
+            "timestamp": f"2023-11-{1 + i % 28:02d} 10:00:00", "source_platform": "bank",
+            "description": "Coffee", "transaction_type": "debit", "is_anomaly": False, "is_duplicate": False}
+
+
+class State:
+    def __init__(self, directory):
+        self.transaction_store = TransactionStore()
+        self.rollups = RollupStore()
+        self.trends = TrendStore()
+        self.alerts = AlertPipeline(clock=lambda: 1000.0)
+        self.checkpoints = CheckpointManager(str(directory), self.transaction_store, self.rollups, self.trends,
+                                             state={"alerts": self.alerts})
+        self.restore_stats = self.checkpoints.restore(self.apply)
+
+    def apply(self, user_id, transactions):
+        store = self.transaction_store.user(user_id)
+        for t in transactions:
+            size = len(store)
+            row = store.append(t)
+            if len(store) > size:
+                self.rollups.user(user_id).apply(store[row])
+                self.trends.user(user_id).apply(store[row])
+
+    def ingest(self, user_id, transactions):
+        self.checkpoints.log(user_id, transactions)
+        self.apply(user_id, transactions)
+
+    def fingerprint(self, user_id):
+        return ([record.to_dict() for record in self.transaction_store.user(user_id)],
+                self.rollups.user(user_id).to_state(), self.trends.user(user_id).to_state(),
+                self.alerts.to_state())
+
+
+def test_restore_matches_the_live_state(tmp_path):
+    live = State(tmp_path)
+    live.ingest("u", [transaction(i) for i in range(50)])
+    for i in range(3):
+        live.alerts.submit({"user_id": "u", "rule_id": "anomaly", "merchant_name": "Starbucks",
+                            "transaction_id": f"tx_{i}"})
+    live.checkpoints.checkpoint()
+    # The tail only reaches the WAL
+    live.ingest("u", [transaction(i, amount=7.0) for i in range(50, 60)])
+    live.checkpoints.close()
+
+    restored = State(tmp_path)
+    assert restored.restore_stats["wal_rows"] == 10
+    assert restored.fingerprint("u") == live.fingerprint("u")
+
+
+def test_alert_state_survives_a_restart(tmp_path):
+    live = State(tmp_path)
+    alert = {"user_id": "u", "rule_id": "anomaly", "merchant_name": "Starbucks", "transaction_id": "tx_1"}
+    assert len(live.alerts.submit(alert)) == 1
+    # Coalesced into the open window
+    assert live.alerts.submit(dict(alert, transaction_id="tx_2")) == []
+    live.checkpoints.checkpoint()
+    live.checkpoints.close()
+
+    restored = State(tmp_path)
+    assert restored.alerts.submit(alert) == []
+    assert restored.alerts.stats["duplicates"] == 1
+    assert restored.alerts.open_windows == 1
+    digests = restored.alerts.flush(now=1000.0 + 3600)
+    assert [d["transaction_ids"] for d in digests] == [["tx_2"]]
+
+
+def test_unchanged_alert_state_is_not_rewritten(tmp_path):
+    live = State(tmp_path)
+    live.alerts.submit({"user_id": "u", "rule_id": "anomaly", "transaction_id": "tx_1"})
+    first = live.checkpoints.capture()
+    live.checkpoints.commit(first)
+    second = live.checkpoints.capture()
+    assert first.state_data is not None
+    assert second.state_data is None and second.state_file == first.state_file
+
+
+def test_enrichments_survive_checkpoint_and_wal_replay(tmp_path):
+    from enrichment import MerchantEnrichment
+    record = MerchantEnrichment.from_dict("starbucks", {"reputation_score": 4.2, "industry": "Coffee"})
+    live = State(tmp_path)
+    live.ingest("u", [dict(transaction(0), enrichment=record)])
+    live.checkpoints.checkpoint()
+    live.ingest("u", [dict(transaction(1, merchant="Blue Bottle"), enrichment=None)])
+    live.checkpoints.close()
+
+    restored = State(tmp_path)
+    store = restored.transaction_store.user("u")
+    assert store[0].enrichment == record
+    assert store[1].enrichment is None
+    assert store.enrichments_by_name() == {"Starbucks": record, "Blue Bottle": None}
@@ -0,0 +1,24 @@
+from enrichment import MerchantEnricher, StaticEnrichmentProvider
+from transaction_store import UserTransactionStore
+
+
+def test_enrichment_is_kept_per_merchant_in_the_store():
+    enricher = MerchantEnricher(StaticEnrichmentProvider())
+    transactions = [
+        {"transaction_id": f"tx_{i}", "amount": 5.0, "merchant_name": name, "timestamp": "2024-01-01 10:00:00"}
+        for i, name in enumerate(["Starbucks #12", "STARBUCKS", "Corner Shop"])
+    ]
+    enricher.enrich(transactions)
+    store = UserTransactionStore("u")
+    store.extend(transactions)
+
+    first, second, third = store
+    assert first.enrichment is not None and first.enrichment is second.enrichment
+    assert third.enrichment.industry == "Retail"
+    assert "enrichment" not in first.to_dict()
+
+
+def test_rows_without_enrichment_have_none():
+    store = UserTransactionStore("u")
+    store.append({"transaction_id": "a", "amount": 1.0, "merchant_name": "X", "timestamp": "2024-01-01 10:00:00"})
+    assert store[0].enrichment is None
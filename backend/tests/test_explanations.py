@@ -0,0 +1,76 @@
+import metrics
+from explanations import ExplanationStore, render_explanation
+from transaction_store import TransactionStore
+
+
+def transaction(i, merchant="Starbucks", amount=4.5, anomaly=False, duplicate=False):
+    return {"transaction_id": f"tx_{i}", "amount": amount, "merchant_name": merchant, "category": "food",
+            "timestamp": f"2023-11-{1 + i:02d} 10:00:00", "source_platform": "bank",
+            "is_anomaly": anomaly, "is_duplicate": duplicate}
+
+
+def rendered():
+    return metrics.REGISTRY.counters().get("explanations.rendered", 0)
+
+
+def setup(rows):
+    registry = TransactionStore()
+    registry.user("u").extend(rows)
+    return registry, ExplanationStore(registry)
+
+
+def test_first_time_detection_spans_syncs():
+    registry, explanations = setup([transaction(0), transaction(1, merchant="Blue Bottle")])
+    texts = explanations.user("u").explain([0, 1])
+    assert all(text.endswith("First time transaction with this merchant") for text in texts)
+
+    registry.user("u").append(transaction(2))
+    assert "First time" not in explanations.user("u").explain([2])[0]
+    assert "First time" in explanations.user("u").explain([0])[0]
+
+
+def test_anomaly_quotes_the_merchant_average_and_refreshes_it():
+    registry, explanations = setup([transaction(0, amount=10.0), transaction(1, amount=50.0, anomaly=True)])
+    assert "(your average is $30.00)" in explanations.user("u").explain([1])[0]
+
+    registry.user("u").append(transaction(2, amount=30.0))
+    assert "(your average is $30.00)" in explanations.user("u").explain([1])[0]
+    registry.user("u").append(transaction(3, amount=110.0))
+    assert "(your average is $50.00)" in explanations.user("u").explain([1])[0]
+
+
+def test_memo_is_reused_until_the_text_can_change():
+    registry, explanations = setup([transaction(0), transaction(1, anomaly=True), transaction(2, duplicate=True)])
+    user = explanations.user("u")
+    first = user.explain([0, 1, 2])
+    before = rendered()
+    assert user.explain([0, 1, 2]) == first
+    assert rendered() == before
+
+    # A new row at the merchant only changes the anomaly's average
+    registry.user("u").append(transaction(3))
+    user.explain([0, 1, 2])
+    assert rendered() == before + 1
+    # Each locale is memoized separately
+    user.explain([0], "fr")
+    assert rendered() == before + 2
+
+
+def test_replaced_store_with_as_many_rows_is_not_served_stale_text():
+    registry, explanations = setup([transaction(0), transaction(1, anomaly=True)])
+    assert "Starbucks" in explanations.user("u").explain([0])[0]
+
+    registry.discard("u")
+    registry.user("u").extend([transaction(0, merchant="Blue Bottle"), transaction(1, merchant="Blue Bottle")])
+    texts = explanations.user("u").explain([0, 1])
+    assert all("Blue Bottle" in text for text in texts)
+    assert "First time" in texts[0] and "First time" not in texts[1]
+
+
+def test_decimal_separator_follows_the_locale():
+    registry, explanations = setup([transaction(0, amount=12.5), transaction(1, amount=7.25, anomaly=True)])
+    user = explanations.user("u")
+    assert user.explain([0], "es")[0].startswith("12,50 $ gastados en Starbucks")
+    assert "votre moyenne est de 9,88 $" in user.explain([1], "fr")[0]
+    assert user.explain([0], "en")[0].startswith("$12.50 spent at Starbucks")
+    assert render_explanation({"amount": 3.0, "merchant_name": "Café"}, "fr").startswith("3,00 $ dépensés chez Café")
@@ -0,0 +1,37 @@
+from http_cache import ResponseCache, _etag_matches
+
+
+def test_etag_matches_current_version_and_encodings():
+    etag = ResponseCache.make_etag("transactions", "u", 1)
+    base = etag[:-1]
+    assert _etag_matches(etag, etag)
+    assert _etag_matches(f'W/{base}-gzip"', etag)
+    assert _etag_matches(f'"other", {base}-br"', etag)
+    assert _etag_matches("*", etag)
+
+
+def test_etag_rejects_other_versions():
+    etag = ResponseCache.make_etag("transactions", "u", 1)
+    base = etag[:-1]
+    assert not _etag_matches(ResponseCache.make_etag("transactions", "u", 12), etag)
+    assert not _etag_matches(f'{base}2-gzip"', etag)
+    assert not _etag_matches(f'{base}-foo"', etag)
+    assert not _etag_matches(ResponseCache.make_etag("budget", "u", 1), etag)
+    assert not _etag_matches(None, etag)
+
+
+def test_cache_rebuilds_only_on_new_version():
+    cache = ResponseCache()
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"n": len(builds)}
+
+    assert cache.get("e", "u", 1, build).body == cache.get("e", "u", 1, build).body
+    assert len(builds) == 1
+    cache.get("e", "u", 2, build)
+    assert len(builds) == 2
+    cache.discard_user("u")
+    cache.get("e", "u", 2, build)
+    assert len(builds) == 3
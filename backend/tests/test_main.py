@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from api_integration import Account
+from auth import DEMO_USER
+
+HEADERS = {"Authorization": "Bearer test-token"}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_synced_transactions_expose_enrichment(client):
+    account = Account("acc-1", DEMO_USER, "open_banking")
+    asyncio.run(main.ingest_synced_transactions(account, [{
+        "transaction_id": "sync-enriched-1", "user_id": DEMO_USER, "amount": 4.5, "merchant_name": "Blue Bottle",
+        "description": "Coffee", "timestamp": "2024-01-02 08:00:00", "source_platform": "bank",
+        "transaction_type": "debit", "is_anomaly": False, "is_duplicate": False
+    }]))
+
+    body = client.get("/transactions", headers=HEADERS).json()
+    assert "sync-enriched-1" in [t["transaction_id"] for t in body["transactions"]]
+    assert body["merchants"]["Blue Bottle"]["merchant_info"]["industry"] == "Retail"
+
+    total = len(body["transactions"])
+    page = client.get("/transactions", params={"offset": total - 1, "limit": 1}, headers=HEADERS).json()
+    assert list(page["merchants"]) == ["Blue Bottle"]
+    assert page["transactions"][0]["explanation"].startswith("$4.50 spent at Blue Bottle")
+
+    answer = client.post("/chat", params={"message": "what was that blue bottle charge"}, headers=HEADERS).json()
+    assert "Retail merchant rated 4.7/5" in answer["response"]
+
+
+def test_synced_transactions_for_users_served_elsewhere_are_dropped(client, monkeypatch):
+    monkeypatch.setattr(main, "owns", lambda user_id: False)
+    account = Account("acc-1", DEMO_USER, "open_banking")
+    asyncio.run(main.ingest_synced_transactions(account, [{
+        "transaction_id": "sync-moved-1", "user_id": DEMO_USER, "amount": 9.0, "merchant_name": "Blue Bottle",
+        "description": "Coffee", "timestamp": "2024-01-03 08:00:00", "source_platform": "bank",
+        "transaction_type": "debit", "is_anomaly": False, "is_duplicate": False
+    }]))
+    assert main.transaction_store.user(DEMO_USER).get("sync-moved-1") is None
+
+
+def test_ready_does_not_wait_for_the_vector_index(client):
+    body = client.get("/ready").json()
+    assert body["ready"] is True
+    assert set(body["stages"]) == {"embeddings", "vector_index"}
+
+
+class CountingCheckpoints:
+    def __init__(self):
+        self.commits = 0
+
+    def capture(self):
+        return None
+
+    def commit(self, checkpoint):
+        self.commits += 1
+
+
+def test_adoption_checkpoints_once_per_handoff_and_resets_explanations(client, monkeypatch):
+    from sharding import ShardMembership, export_user
+    from transaction_store import TransactionStore
+    from rollups import RollupStore
+    from trends import TrendStore
+
+    donor = (TransactionStore(), RollupStore(), TrendStore())
+    users = ["moved-1", "moved-2"]
+    for user_id in users:
+        donor[0].user(user_id).append({"transaction_id": f"{user_id}-tx", "amount": 3.0, "merchant_name": "Cafe",
+                                       "category": "food", "timestamp": "2023-11-01 10:00:00"})
+    checkpoints = CountingCheckpoints()
+    monkeypatch.setattr(main, "membership", ShardMembership("shard-1", ["shard-0"]))
+    monkeypatch.setattr(main, "SHARD_ID", "shard-1")
+    monkeypatch.setattr(main, "SHARD_SECRET", "s")
+    monkeypatch.setattr(main, "checkpoints", checkpoints)
+    # An explanations entry made before the handoff, over an empty placeholder store
+    stale = main.explanations.user("moved-1")
+
+    secret = {"x-shard-secret": "s"}
+    for user_id in users:
+        response = client.post("/internal/adopt", content=export_user(user_id, *donor), headers=secret)
+        assert response.json() == {"user_id": user_id, "rows": 1}
+    assert checkpoints.commits == 0
+    client.post("/internal/ring", json={"shards": ["shard-0", "shard-1"]}, headers=secret)
+    assert checkpoints.commits == 1
+
+    explanations = main.explanations.user("moved-1")
+    assert explanations is not stale
+    assert explanations.store is main.transaction_store.user("moved-1")
+    for user_id in users:
+        main.discard_user(user_id)
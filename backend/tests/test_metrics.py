@@ -0,0 +1,98 @@
+import asyncio
+import re
+import threading
+
+import httpx
+from fastapi import FastAPI
+
+from metrics import SUB_BUCKET_COUNT, Histogram, MetricsRegistry, RequestMetricsMiddleware
+
+
+def test_small_values_get_exact_buckets_and_large_ones_stay_within_bounds():
+    # Below 2 * SUB_BUCKET_COUNT every integer has its own bucket
+    exact = 2 * SUB_BUCKET_COUNT
+    assert len({Histogram._bucket(value) for value in range(1, exact)}) == exact - 1
+    assert all(Histogram._bucket_midpoint(Histogram._bucket(value)) == value for value in range(1, exact))
+    # Above that a bucket spans at most 1/SUB_BUCKET_COUNT of its value
+    for value in (exact, 1000, 123_456, 10 ** 9, 2 ** 40 - 1):
+        midpoint = Histogram._bucket_midpoint(Histogram._bucket(value))
+        assert abs(midpoint - value) / value <= 1 / SUB_BUCKET_COUNT
+    # Bucket numbers are monotonic in the value
+    buckets = [Histogram._bucket(value) for value in range(1, 100_000, 7)]
+    assert buckets == sorted(buckets)
+
+
+def test_quantiles_follow_the_recorded_distribution():
+    histogram = Histogram()
+    assert histogram.quantiles() == {0.5: 0.0, 0.9: 0.0, 0.95: 0.0, 0.99: 0.0}
+    for value in range(1, 10_001):
+        histogram.record(value)
+    assert histogram.count == 10_000 and histogram.max == 10_000
+    assert histogram.total == sum(range(1, 10_001))
+    for quantile, value in histogram.quantiles().items():
+        assert abs(value - quantile * 10_000) / (quantile * 10_000) <= 1 / SUB_BUCKET_COUNT
+
+
+def test_concurrent_recording_loses_nothing():
+    histogram = Histogram()
+    registry = MetricsRegistry()
+
+    def work():
+        for value in range(1, 5001):
+            histogram.record(value)
+            registry.increment("events")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert histogram.count == 20_000
+    assert histogram.total == 4 * sum(range(1, 5001))
+    assert registry.counters() == {"events": 20_000}
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry(namespace="test")
+    registry.observe("ingest", 2_000_000)
+    registry.observe("ingest", 4_000_000)
+    registry.increment("cache_hit", 3)
+    registry.register_gauge("queue_depth", lambda: 7)
+    registry.register_gauge("broken", lambda: 1 / 0)
+    text = registry.render_prometheus()
+
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert "# TYPE test_stage_latency_seconds summary" in lines
+    assert 'test_stage_latency_seconds_count{stage="ingest"} 2' in lines
+    assert 'test_stage_latency_seconds_sum{stage="ingest"} 0.006000000' in lines
+    assert "# TYPE test_events_total counter" in lines
+    assert 'test_events_total{event="cache_hit"} 3' in lines
+    assert 'test_gauge{name="queue_depth"} 7.0' in lines
+    assert not any("broken" in line for line in lines)
+    sample = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?[0-9.e+-]+$')
+    assert all(line.startswith("# ") or sample.match(line) for line in lines)
+
+
+def test_middleware_times_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"item_id": item_id}
+
+    registry = MetricsRegistry()
+    app.add_middleware(RequestMetricsMiddleware, registry=registry, profiling=True)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            await client.get("/items/1")
+            profiled = await client.get("/items/2", headers={"X-Profile": "1"})
+            await client.get("/missing")
+            return profiled
+
+    profiled = asyncio.run(run())
+    assert registry.histogram("http.GET /items/{item_id}").count == 2
+    assert registry.histogram("http.GET unmatched").count == 1
+    assert "x-profile-samples" in profiled.headers
+    assert registry.recent_profiles[-1]["stage"] == "http.GET /items/{item_id}"
@@ -0,0 +1,98 @@
+import calendar
+import random
+
+from rollups import RETAINED_MONTHS, UserRollup
+from transaction_store import UserTransactionStore
+
+CATEGORIES = ("food", "grocery", "utilities", "healthcare", "transportation", "shopping")
+NOW = calendar.timegm((2024, 3, 15, 12, 0, 0))
+
+
+def transactions(count, seed=7, months=6):
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        year, month = divmod(2024 * 12 + 2 - rng.randrange(months), 12)
+        result.append({
+            "transaction_id": f"tx_{i}",
+            "amount": rng.randint(1, 50_000) / 100,
+            "category": rng.choice(CATEGORIES),
+            "timestamp": f"{year}-{month + 1:02d}-{rng.randint(1, 28):02d} 09:30:00",
+            "transaction_type": "credit" if rng.random() < 0.15 else "debit"
+        })
+    return result
+
+
+def recompute(rows):
+    store = UserTransactionStore("u")
+    store.extend(rows)
+    rollup = UserRollup("u", clock=lambda: NOW)
+    rollup.apply_rows(store, 0, len(store))
+    return rollup
+
+
+def state(rollup):
+    return {key: value for key, value in rollup.to_state().items() if key != "version"}
+
+
+def views(rollup):
+    return (rollup.budget_status(), rollup.month_to_date(), rollup.year_to_date(),
+            rollup.spending_summary(), rollup.balance)
+
+
+def test_incremental_apply_matches_a_full_recompute():
+    rows = transactions(500)
+    rollup = UserRollup("u", clock=lambda: NOW)
+    for transaction in rows:
+        rollup.apply(transaction)
+    assert state(rollup) == state(recompute(rows))
+    assert views(rollup) == views(recompute(rows))
+
+
+def test_retracting_transactions_matches_a_recompute_without_them():
+    rows = transactions(500)
+    rollup = UserRollup("u", clock=lambda: NOW)
+    for transaction in rows:
+        rollup.apply(transaction)
+    # Read first so the materialized snapshots have to be invalidated
+    views(rollup)
+
+    rng = random.Random(3)
+    retracted = set(rng.sample(range(len(rows)), 200))
+    for index in sorted(retracted):
+        rollup.retract(rows[index])
+    kept = [transaction for index, transaction in enumerate(rows) if index not in retracted]
+    assert state(rollup) == state(recompute(kept))
+    assert views(rollup) == views(recompute(kept))
+
+
+def test_retracting_everything_leaves_empty_rollups():
+    rows = transactions(50)
+    rollup = UserRollup("u", clock=lambda: NOW)
+    for transaction in rows:
+        rollup.apply(transaction)
+    for transaction in reversed(rows):
+        rollup.retract(transaction)
+    assert rollup.to_state()["months"] == {} and rollup.to_state()["years"] == {}
+    assert rollup.balance_minor == 0
+    assert rollup.budget_status()["spent"] == 0
+
+
+def test_month_rollover_and_retention():
+    now = [NOW]
+    rollup = UserRollup("u", clock=lambda: now[0])
+    rollup.apply({"amount": 120.0, "category": "food", "timestamp": "2024-03-10 08:00:00"})
+    assert rollup.budget_status()["categories"]["food"]["spent"] == 120.0
+
+    now[0] = calendar.timegm((2024, 4, 1, 0, 0, 0))
+    assert rollup.budget_status()["period"] == "2024-04"
+    assert rollup.budget_status()["categories"]["food"]["spent"] == 0
+    assert rollup.monthly_snapshot("2024-03")["total_spent"] == 120.0
+
+    # Months beyond the retention window keep only their yearly totals
+    rows = transactions(400, months=RETAINED_MONTHS + 6)
+    incremental = UserRollup("u", clock=lambda: NOW)
+    for transaction in rows:
+        incremental.apply(transaction)
+    assert len(incremental.to_state()["months"]) == RETAINED_MONTHS
+    assert state(incremental) == state(recompute(rows))
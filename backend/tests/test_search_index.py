@@ -0,0 +1,112 @@
+import numpy as np
+
+from search_index import RRF_K, UserSearchIndex, parse_query, skeleton, tokenize
+from transaction_store import TransactionStore, parse_timestamp
+
+REFERENCE = parse_timestamp("2023-11-30 12:00:00")
+
+
+def make_index(transactions):
+    store = TransactionStore().user("u")
+    store.extend(transactions)
+    return UserSearchIndex(store)
+
+
+def transaction(tid, merchant, amount, timestamp, description="", category="shopping"):
+    return {"transaction_id": tid, "merchant_name": merchant, "amount": amount, "timestamp": timestamp,
+            "description": description, "category": category, "source_platform": "bank"}
+
+
+TRANSACTIONS = [
+    transaction("t1", "Amazon", 45.0, "2023-11-03 10:00:00", "Books"),
+    transaction("t2", "Starbucks", 4.5, "2023-11-05 08:00:00", "Coffee", "food"),
+    transaction("t3", "Amazon Marketplace Seller", 120.0, "2023-10-20 10:00:00", "Electronics order"),
+    transaction("t4", "Starbucks", 5.25, "2023-11-20 08:00:00", "Coffee", "food"),
+    transaction("t5", "Shell", 60.0, "2023-05-03 18:00:00", "Fuel", "transport"),
+]
+
+
+def ids(hits):
+    return [record.transaction_id for record, _ in hits]
+
+
+def test_tokenize_and_skeleton():
+    assert tokenize("AMZN Mktp US*2K3 $45.00") == ["amzn", "mktp", "us", "2k3", "45", "00"]
+    assert skeleton("amazon") == "amzn"
+
+
+def test_parse_query_filters():
+    parsed = parse_query("starbucks over $5 on nov 20", REFERENCE)
+    assert parsed.terms == ["starbucks"]
+    assert parsed.amount_range == (500, None)
+    assert parsed.time_range == (parse_timestamp("2023-11-20 00:00:00"), parse_timestamp("2023-11-21 00:00:00"))
+    assert parse_query("$45", REFERENCE).amount_range == (4275, 4725)
+    assert parse_query("march 2022", REFERENCE).time_range[0] == parse_timestamp("2022-03-01 00:00:00")
+
+
+def test_ambiguous_month_words_need_a_day_or_year():
+    for question in ("what may I cut", "can I mar my budget", "jan spending tips"):
+        assert parse_query(question, REFERENCE).time_range is None
+    assert parse_query("may 3", REFERENCE).time_range[0] == parse_timestamp("2023-05-03 00:00:00")
+    assert parse_query("jan 2023", REFERENCE).time_range[0] == parse_timestamp("2023-01-01 00:00:00")
+
+
+def test_bm25_ranks_short_exact_matches_first_and_ties_by_recency():
+    index = make_index(TRANSACTIONS)
+    index.sync()
+    assert ids(index.search("amazon", k=5)) == ["t1", "t3"]
+    # Same merchant, same score: newest first
+    assert ids(index.search("starbucks", k=5)) == ["t4", "t2"]
+    # Abbreviations resolve through consonant skeletons
+    assert ids(index.search("amzn", k=1)) == ["t1"]
+
+
+def test_filters_apply_before_scoring():
+    index = make_index(TRANSACTIONS)
+    assert ids(index.search("amazon over $100", k=5)) == ["t3"]
+    assert ids(index.search("starbucks on nov 5", k=5)) == ["t2"]
+    assert index.search("amazon on nov 20", k=5) == []
+    # Pure filter questions list the matches newest first
+    assert ids(index.search("over $40", k=5)) == ["t1", "t3", "t5"]
+
+
+def test_incremental_sync_matches_bulk_sync():
+    many = [transaction(f"x{i}", f"Merchant {i % 7}", 10.0 + i, f"2023-11-{1 + i % 28:02d} 10:00:00")
+            for i in range(2500)]
+    bulk = make_index(many)
+    bulk.sync()
+    incremental = make_index(many[:10])
+    incremental.sync()
+    for item in many[10:]:
+        incremental.store.append(item)
+        incremental.sync()
+    assert np.array_equal(bulk._doc_lengths[:2500], incremental._doc_lengths[:2500])
+    assert ids(bulk.search("merchant 3", k=10)) == ids(incremental.search("merchant 3", k=10))
+
+
+class FakeVectorIndex:
+    def __init__(self, ranked_ids):
+        self.ranked_ids = ranked_ids
+        self.candidate_ids = None
+
+    def search(self, query_vector, k=10, candidate_ids=None):
+        self.candidate_ids = candidate_ids
+        return [(tid, 1.0) for tid in self.ranked_ids if candidate_ids is None or tid in candidate_ids][:k]
+
+
+def test_rank_fusion_adds_dense_only_hits_below_lexical_ones():
+    index = make_index(TRANSACTIONS)
+    dense = FakeVectorIndex(["t5", "t1"])
+    hits = index.search("amazon", k=5, vector_index=dense, query_vector=[0.0])
+    assert ids(hits) == ["t1", "t3", "t5"]
+    scores = dict((record.transaction_id, score) for record, score in hits)
+    assert scores["t1"] == 1.0 / (RRF_K + 1) + 0.5 / (RRF_K + 2)
+    assert scores["t5"] == 0.5 / (RRF_K + 1)
+
+
+def test_dense_search_is_restricted_to_filtered_rows():
+    index = make_index(TRANSACTIONS)
+    dense = FakeVectorIndex(["t5", "t2"])
+    hits = index.search("coffee on nov 5", k=5, vector_index=dense, query_vector=[0.0])
+    assert dense.candidate_ids == {"t2"}
+    assert ids(hits) == ["t2"]
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from sharding import HashRing, ShardingError, ShardRouter, pack_frames
+
+SECRET = "secret"
+USERS = [f"user-{i}" for i in range(200)]
+
+
+class FakeShard:
+    """The shard-internal endpoints of main.py over an in-memory set of users"""
+
+    def __init__(self, shard_id, shards, users=(), fail_adopt=None):
+        self.shard_id = shard_id
+        self.ring = HashRing(shards)
+        self.users = set(users)
+        self.fail_adopt = fail_adopt
+        self.released = []
+
+    def owns(self, user_id):
+        return self.ring.owner(user_id) == self.shard_id
+
+    def handle(self, request):
+        assert request.headers["x-shard-secret"] == SECRET
+        path = request.url.path
+        if path == "/internal/ring":
+            self.ring = HashRing(json.loads(request.content)["shards"])
+            return httpx.Response(200, json={})
+        if path == "/internal/handoff":
+            self.ring = HashRing(json.loads(request.content)["shards"])
+            moving = sorted(user_id for user_id in self.users if not self.owns(user_id))
+            return httpx.Response(200, content=pack_frames([user_id.encode() for user_id in moving]))
+        if path == "/internal/adopt":
+            user_id = request.content.decode()
+            if user_id == self.fail_adopt:
+                return httpx.Response(500, json={"detail": "adopt failed"})
+            self.users.add(user_id)
+            return httpx.Response(200, json={"user_id": user_id})
+        if path == "/internal/release":
+            users = json.loads(request.content)["users"]
+            self.released.extend(users)
+            self.users -= {user_id for user_id in users if not self.owns(user_id)}
+            return httpx.Response(200, json={})
+        return httpx.Response(404)
+
+
+def cluster(fail_adopt=None):
+    old_ring = HashRing(["shard-0", "shard-1"])
+    shards = {
+        shard: FakeShard(shard, old_ring.shards, [u for u in USERS if old_ring.owner(u) == shard])
+        for shard in old_ring.shards
+    }
+    shards["shard-2"] = FakeShard("shard-2", old_ring.shards, fail_adopt=fail_adopt)
+    router = ShardRouter({shard: f"http://{shard}" for shard in old_ring.shards}, SECRET)
+    router._client = lambda url: httpx.AsyncClient(
+        base_url=url, transport=httpx.MockTransport(lambda request: shards[request.url.host].handle(request))
+    )
+    router.clients = {shard: router._client(url) for shard, url in router.urls.items()}
+    return router, shards
+
+
+def moving_from(donor):
+    new_ring = HashRing(["shard-0", "shard-1", "shard-2"])
+    old_ring = HashRing(["shard-0", "shard-1"])
+    return sorted(u for u in USERS if old_ring.owner(u) == donor and new_ring.owner(u) == "shard-2")
+
+
+def test_add_shard_moves_users_and_releases_them():
+    router, shards = cluster()
+    result = asyncio.run(router.add_shard("shard-2", "http://shard-2"))
+
+    assert result["moved_from"] == {"shard-0": len(moving_from("shard-0")), "shard-1": len(moving_from("shard-1"))}
+    assert shards["shard-2"].users == set(moving_from("shard-0") + moving_from("shard-1"))
+    assert sorted(shards["shard-0"].released) == moving_from("shard-0")
+    assert not shards["shard-0"].users & shards["shard-2"].users
+    assert "shard-2" in router.ring and shards["shard-2"].owns(moving_from("shard-1")[0])
+
+
+def test_failed_handoff_releases_nothing_and_rolls_back():
+    # Adoption fails for the second donor's users, after the first donor's moved
+    router, shards = cluster(fail_adopt=moving_from("shard-1")[0])
+    before = {shard: set(shards[shard].users) for shard in ("shard-0", "shard-1")}
+
+    with pytest.raises(ShardingError):
+        asyncio.run(router.add_shard("shard-2", "http://shard-2"))
+
+    for shard in ("shard-0", "shard-1"):
+        assert shards[shard].released == []
+        assert shards[shard].users == before[shard]
+        assert shards[shard].ring.shards == ["shard-0", "shard-1"]
+    # The new shard discarded everything it had adopted
+    assert shards["shard-2"].users == set()
+    assert sorted(shards["shard-2"].released) == moving_from("shard-0")
+    assert "shard-2" not in router.ring and "shard-2" not in router.urls
+
+
+def test_spawned_shard_is_retired_when_the_handoff_fails():
+    router, shards = cluster(fail_adopt=moving_from("shard-0")[0])
+    retired = []
+
+    async def spawn_shard():
+        return "shard-2", "http://shard-2"
+
+    router.spawn_shard = spawn_shard
+    router.retire_shard = retired.append
+
+    async def post():
+        transport = httpx.ASGITransport(app=router)
+        async with httpx.AsyncClient(transport=transport, base_url="http://router") as client:
+            return await client.post("/shards", headers={"x-shard-secret": SECRET})
+
+    response = asyncio.run(post())
+    assert response.status_code == 500
+    assert retired == ["shard-2"]
+
+
+def test_export_import_carries_enrichments():
+    from enrichment import MerchantEnrichment
+    from rollups import RollupStore
+    from sharding import export_user, import_user
+    from transaction_store import TransactionStore
+    from trends import TrendStore
+
+    record = MerchantEnrichment.from_dict("starbucks", {"is_verified": True, "industry": "Coffee"})
+    source = TransactionStore()
+    source.user("u").append({"transaction_id": "tx_1", "amount": 4.5, "merchant_name": "Starbucks",
+                             "category": "food", "timestamp": "2023-11-01 10:00:00", "enrichment": record})
+    data = export_user("u", source, RollupStore(), TrendStore())
+
+    target = TransactionStore()
+    assert import_user(data, target, RollupStore(), TrendStore()) == "u"
+    assert target.user("u")[0].enrichment == record
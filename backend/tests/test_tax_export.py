@@ -0,0 +1,65 @@
+import csv
+import io
+
+import numpy as np
+
+import transaction_store
+from tax_export import stream_csv
+from transaction_store import UserTransactionStore
+
+
+def make_store(rows=20):
+    store = UserTransactionStore("u")
+    store.extend({
+        "transaction_id": f"tx_{i}", "amount": 10.0 + i, "merchant_name": "Shop", "category": "shopping",
+        "timestamp": f"2023-11-{1 + i % 28:02d} 10:00:00", "source_platform": "bank", "description": ""
+    } for i in range(rows))
+    return store
+
+
+def test_stream_csv_rows_and_subtotals():
+    store = make_store()
+    text = "".join(stream_csv(store, chunk_size=7))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0][0] == "transaction_id"
+    assert [row[0] for row in rows[1:21]] == [f"tx_{i}" for i in range(20)]
+    assert ["shopping", "", f"{sum(10.0 + i for i in range(20)):.2f}", "20"] in rows
+
+
+def test_export_scans_do_not_block_appends(monkeypatch):
+    # Exports run in a worker thread while the event loop appends; an
+    # append in the middle of a scan must not hit an exported column buffer
+    store = make_store()
+    isin = np.isin
+    bincount = np.bincount
+    appended = []
+
+    def append_during(original):
+        def call(*args, **kwargs):
+            if len(appended) < 3:
+                appended.append(store.append({"transaction_id": f"late_{len(appended)}", "amount": 1.0,
+                                              "category": "shopping", "timestamp": "2023-11-01 00:00:00"}))
+            return original(*args, **kwargs)
+        return call
+
+    monkeypatch.setattr(transaction_store.np, "isin", append_during(isin))
+    monkeypatch.setattr(transaction_store.np, "bincount", append_during(bincount))
+    chunks = list(store.iter_chunks(5, categories=["shopping"]))
+    assert sum(len(chunk) for chunk in chunks) == len(store)
+    assert store.category_totals()["shopping"] > 0
+
+
+def test_category_totals_scan_bounded_chunks(monkeypatch):
+    store = make_store(50)
+    expected = store.category_totals()
+    spans = []
+    column = store.column
+
+    def recording(name, start=0, end=None):
+        spans.append((end if end is not None else len(store)) - start)
+        return column(name, start, end)
+
+    monkeypatch.setattr(store, "column", recording)
+    totals = store.category_totals(start=0, chunk_size=8)
+    assert totals == expected
+    assert max(spans) <= 8
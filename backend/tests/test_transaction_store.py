@@ -0,0 +1,97 @@
+import numpy as np
+
+from transaction_store import (FLAG_ANOMALY, FLAG_CREDIT, FLAG_DUPLICATE, TransactionStore,
+                               UserTransactionStore, to_minor_units)
+
+TRANSACTIONS = [
+    {"transaction_id": "tx_1", "amount": 25.99, "merchant_name": "Starbucks", "category": "food",
+     "timestamp": "2023-11-01 10:30:00", "source_platform": "credit_card", "description": "Coffee",
+     "transaction_type": "debit", "is_anomaly": False, "is_duplicate": False},
+    {"transaction_id": "tx_2", "amount": 2000.0, "merchant_name": "Employer", "category": "income",
+     "timestamp": "2023-11-02 09:00:00", "source_platform": "bank", "description": "Payroll",
+     "transaction_type": "credit", "is_anomaly": False, "is_duplicate": False},
+    {"transaction_id": "tx_3", "amount": 0.07, "merchant_name": "Starbucks", "category": "food",
+     "timestamp": "2023-11-03 23:59:59", "source_platform": "upi", "description": "",
+     "transaction_type": "debit", "is_anomaly": True, "is_duplicate": True},
+]
+
+
+def test_append_round_trips_every_field():
+    store = UserTransactionStore("u")
+    store.extend(TRANSACTIONS)
+    assert [record.to_dict() for record in store] == TRANSACTIONS
+    assert store.get("tx_2").to_dict() == TRANSACTIONS[1]
+    assert store.get("missing") is None
+
+
+def test_append_skips_known_ids():
+    store = UserTransactionStore("u")
+    store.extend(TRANSACTIONS)
+    version = store.version
+    assert store.append(dict(TRANSACTIONS[0], amount=1.0)) == 0
+    assert len(store) == 3
+    assert store[0].amount == 25.99
+    assert store.version == version
+
+
+def test_missing_type_is_a_debit():
+    store = UserTransactionStore("u")
+    store.append({"transaction_id": "a", "amount": 5.0, "timestamp": "2023-11-01 00:00:00"})
+    assert store[0].transaction_type == "debit"
+
+
+def test_append_columns_matches_append():
+    expected = TransactionStore().user("u")
+    expected.extend(TRANSACTIONS)
+
+    batched = TransactionStore().user("u")
+    flags = [(FLAG_CREDIT if t["transaction_type"] == "credit" else 0)
+             | (FLAG_ANOMALY if t["is_anomaly"] else 0) | (FLAG_DUPLICATE if t["is_duplicate"] else 0)
+             for t in TRANSACTIONS]
+    ids = [t["transaction_id"] for t in TRANSACTIONS] + ["tx_1"]
+    start, end = batched.append_columns(
+        ids,
+        np.array([expected[i].epoch for i in range(3)] + [0]),
+        np.array([to_minor_units(t["amount"]) for t in TRANSACTIONS] + [0]),
+        [t["merchant_name"] for t in TRANSACTIONS] + ["x"],
+        [t["category"] for t in TRANSACTIONS] + ["x"],
+        [t["source_platform"] for t in TRANSACTIONS] + ["x"],
+        [t["description"] for t in TRANSACTIONS] + ["x"],
+        np.array(flags + [0], dtype=np.uint8),
+    )
+    assert (start, end) == (0, 3)
+    assert [r.to_dict() for r in batched] == [r.to_dict() for r in expected]
+    assert batched.version == expected.version
+    assert batched.has_merchant("Employer") and not batched.has_merchant("x")
+
+
+def test_restore_from_column_bytes():
+    registry = TransactionStore()
+    source = registry.user("a")
+    source.extend(TRANSACTIONS)
+    columns = {name: getattr(source, name).tobytes() for name in UserTransactionStore.COLUMNS}
+
+    restored = registry.user("b")
+    restored.restore(list(source.transaction_ids), columns, source.version, source.description_pool.values())
+    assert [r.to_dict() for r in restored] == TRANSACTIONS
+    assert restored.get("tx_3").row == 2
+    assert restored.has_merchant("Starbucks")
+    assert restored.version == source.version
+
+
+def test_descriptions_are_pooled_per_user():
+    registry = TransactionStore()
+    registry.user("a").extend(TRANSACTIONS)
+    registry.user("b").append(dict(TRANSACTIONS[0], description="Rent for November"))
+    assert registry.user("b")[0].description == "Rent for November"
+    assert "Rent for November" not in registry.user("a").description_pool.values()
+    shared = registry.pools.nbytes()
+    assert shared > 0
+    assert registry.nbytes() == shared + registry.user("a").nbytes() + registry.user("b").nbytes()
+
+
+def test_nbytes_counts_the_id_index():
+    store = UserTransactionStore("u")
+    store.extend(TRANSACTIONS)
+    columns = sum(len(getattr(store, name)) * getattr(store, name).itemsize for name in store.COLUMNS)
+    assert store.nbytes() > columns + sum(len(t["transaction_id"]) for t in TRANSACTIONS)
@@ -0,0 +1,27 @@
+from trends import UserTrends
+
+
+def debit(day, category, amount):
+    return {"transaction_id": f"{category}-{day}-{amount}", "amount": amount, "category": category,
+            "timestamp": f"2023-11-{day:02d} 12:00:00", "transaction_type": "debit"}
+
+
+def test_reads_do_not_close_days_for_late_transactions():
+    stream = [debit(1, "food", 10.0), debit(4, "travel", 50.0)]
+    late = [debit(2, "food", 30.0), debit(12, "food", 5.0)]
+
+    read = UserTrends("u")
+    for transaction in stream:
+        read.apply(transaction)
+    read.insights()
+    before = read.snapshot()
+    for transaction in late:
+        read.apply(transaction)
+
+    unread = UserTrends("u")
+    for transaction in stream + late:
+        unread.apply(transaction)
+
+    assert before["food"]["last_7_days"] == 10.0
+    assert read.snapshot() == unread.snapshot()
+    assert read.snapshot()["food"]["daily_ewma"] != 0
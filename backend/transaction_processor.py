@@ -1,11 +1,19 @@
-import pathway as pw
+from lazy_imports import lazy_import
 import re
 import json
 from datetime import datetime, timedelta
 import logging
+import numpy as np
+from transaction_store import FLAG_CREDIT, MINOR_UNITS, UserTransactionStore, format_timestamp
+from metrics import timed
+from enrichment import MerchantEnricher
+from explanations import DEFAULT_LOCALE, render_explanation
 
 logger = logging.getLogger(__name__)
 
+# Pathway is only needed once a pipeline is built, so defer the heavy import
+pw = lazy_import("pathway")
+
 # Transaction categorization logic
 CATEGORY_PATTERNS = {
     "shopping": [
@@ -56,62 +64,96 @@ CATEGORY_PATTERNS = {
     ]
 }
 
+# One alternation per category: a category matches when any of its patterns
+# does, and categories are still tried in CATEGORY_PATTERNS order
+CATEGORY_REGEXES = [
+    (category, re.compile("|".join(f"(?:{pattern})" for pattern in patterns)))
+    for category, patterns in CATEGORY_PATTERNS.items()
+]
+
+# Recurring payments: at least this many charges of a near-constant amount
+# (std below this fraction of the mean) at a regular cadence
+RECURRING_MIN_CHARGES = 3
+RECURRING_AMOUNT_TOLERANCE = 0.1
+RECURRING_CADENCES = (
+    ("weekly", 6, 8),
+    ("monthly", 26, 35),
+    ("quarterly", 85, 97),
+    ("yearly", 355, 375),
+)
+
+# Tax reporting buckets for spending categories; unlisted categories are not tax relevant
+TAX_CATEGORIES = {
+    "healthcare": "medical_expenses",
+    "education": "education_expenses",
+    "housing": "home_expenses",
+    "finance": "taxes_and_fees",
+    "utilities": "home_office",
+    "transportation": "travel",
+}
+
+def _categorize(merchant_name, description):
+    text = (merchant_name + " " + description).lower()
+    
+    # Check for exact matches first
+    for category, regex in CATEGORY_REGEXES:
+        if regex.search(text):
+            return category
+    
+    # Default category
+    return "uncategorized"
+
 class TransactionProcessor:
     """Handles advanced transaction processing logic"""
     
-    def __init__(self):
-        # Initialize any necessary models or services
-        pass
+    def __init__(self, enricher=None):
+        # Merchant enrichment is cached per canonical merchant across batches
+        self.enricher = enricher or MerchantEnricher()
     
+    @timed("processor.categorize_transaction")
     def categorize_transaction(self, merchant_name, description):
         """Automatically categorize a transaction based on merchant name and description"""
-        text = (merchant_name + " " + description).lower()
-        
-        # Check for exact matches first
-        for category, patterns in CATEGORY_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, text):
-                    return category
-        
-        # Default category
-        return "uncategorized"
+        return _categorize(merchant_name, description)
+
+    @timed("processor.categorize_many")
+    def categorize_many(self, merchant_names, descriptions):
+        """Categorize a batch, running the patterns once per distinct (merchant, description)"""
+        categories = {}
+        result = []
+        for key in zip(merchant_names, descriptions):
+            category = categories.get(key)
+            if category is None:
+                category = categories[key] = _categorize(*key)
+            result.append(category)
+        return result
     
-    def explain_transaction(self, transaction):
+    @timed("processor.explain_transaction")
+    def explain_transaction(self, transaction, locale=DEFAULT_LOCALE):
         """Generate a human-readable explanation for a transaction"""
-        merchant_name = transaction.get("merchant_name", "Unknown Merchant")
-        amount = transaction.get("amount", 0)
-        category = transaction.get("category", "uncategorized")
-        source_platform = transaction.get("source_platform", "Unknown Platform")
-        
-        explanation = f"${amount:.2f} spent at {merchant_name} ({category}) via {source_platform}"
-        
-        # Add additional context based on transaction details
-        if transaction.get("is_first_time_vendor", False):
-            explanation += " - First time transaction with this merchant"
-        
-        if transaction.get("is_anomaly", False):
-            avg_amount = transaction.get("avg_merchant_amount", 0)
-            explanation += f" - Unusual amount (your average is ${avg_amount:.2f})"
-        
-        if transaction.get("is_duplicate", False):
-            explanation += " - Potential duplicate transaction"
-        
-        return explanation
+        # Stored transactions are explained lazily via explanations.UserExplanations
+        return render_explanation(transaction, locale)
     
+    @timed("processor.detect_pattern_changes")
     def detect_pattern_changes(self, current_transaction, historical_data):
         """Detect changes in spending patterns compared to historical data"""
         merchant_name = current_transaction.get("merchant_name", "")
         current_amount = current_transaction.get("amount", 0)
         
-        # Filter historical data for the same merchant
-        merchant_history = [t for t in historical_data if t.get("merchant_name") == merchant_name]
-        
-        if not merchant_history:
-            return None, False
-        
-        # Calculate average and maximum historical amounts
-        avg_amount = sum(t.get("amount", 0) for t in merchant_history) / len(merchant_history)
-        max_amount = max(t.get("amount", 0) for t in merchant_history)
+        if isinstance(historical_data, UserTransactionStore):
+            # Vectorized scan over the columnar store
+            merchant_amounts = historical_data.merchant_amounts(merchant_name)
+            if not len(merchant_amounts):
+                return None, False
+            avg_amount = float(merchant_amounts.mean())
+        else:
+            # Filter historical data for the same merchant
+            merchant_history = [t for t in historical_data if t.get("merchant_name") == merchant_name]
+            
+            if not merchant_history:
+                return None, False
+            
+            # Calculate average historical amount
+            avg_amount = sum(t.get("amount", 0) for t in merchant_history) / len(merchant_history)
         
         # Check for significant deviations
         deviation_threshold = 2.0  # 2x the average
@@ -123,35 +165,21 @@ class TransactionProcessor:
         
         return None, False
     
-    def enrich_with_external_data(self, transaction):
-        """Enrich transaction with external data like merchant reputation, news, etc."""
-        # In production, this would integrate with external APIs
-        # For now, we'll add mock data
-        enriched_transaction = transaction.copy()
-        
-        # Add mock merchant information
-        enriched_transaction["merchant_info"] = {
-            "reputation_score": 4.7,  # Mock score out of 5
-            "is_verified": True,
-            "industry": "Retail",
-            "has_fraud_reports": False
-        }
-        
-        # Add mock social sentiment
-        enriched_transaction["sentiment"] = {
-            "score": 0.8,  # Mock positive score
-            "label": "positive"
-        }
-        
-        # Add mock news context
-        enriched_transaction["news_context"] = None
-        
-        return enriched_transaction
+    @timed("processor.enrich_transactions")
+    def enrich_transactions(self, transactions):
+        """Attach merchant reputation, sentiment and news data to a micro-batch of transactions"""
+        # One lookup per distinct merchant in the batch; transactions share the
+        # immutable record rather than each carrying a copy
+        return self.enricher.enrich(transactions)
     
+    @timed("processor.flag_first_time_vendors")
     def flag_first_time_vendors(self, transaction, user_transaction_history):
         """Identify if this is the first time the user is transacting with this merchant"""
         merchant_name = transaction.get("merchant_name", "")
         
+        if isinstance(user_transaction_history, UserTransactionStore):
+            return not user_transaction_history.has_merchant(merchant_name)
+        
         # Check if merchant exists in user's transaction history
         for hist_transaction in user_transaction_history:
             if hist_transaction.get("merchant_name") == merchant_name:
@@ -173,27 +201,13 @@ def process_transactions(transactions):
         )
     )
     
-    # Add human-readable explanation
-    explained = categorized.select(
-        **categorized,
-        human_explanation=pw.apply(
-            categorized,
-            lambda t: processor.explain_transaction({
-                "merchant_name": t.merchant_name,
-                "amount": t.amount,
-                "category": t.category,
-                "source_platform": t.source_platform,
-                "is_anomaly": t.is_anomaly,
-                "avg_merchant_amount": getattr(t, "avg_merchant_amount", 0),
-                "is_duplicate": t.is_duplicate
-            })
-        )
-    )
+    # Explanations are rendered on demand (explanations.UserExplanations)
+    # for the rows a page or chat answer shows, not computed per row here
     
     # In production, we would implement more complex operations here
     # such as joining with historical data, etc.
     
-    return explained
+    return categorized
 
 # More advanced Pathway processing functions
 def aggregate_spending_by_category(transactions):
@@ -237,6 +251,55 @@ def identify_recurring_subscriptions(transactions):
     
     return subscriptions
 
+def find_recurring_payments(store):
+    """Detect subscriptions and other recurring debits in a UserTransactionStore.
+
+    Debits are grouped per merchant with NumPy; a merchant counts as
+    recurring when it has RECURRING_MIN_CHARGES or more near-constant
+    charges whose median gap matches one of RECURRING_CADENCES.
+    """
+    if not len(store):
+        return []
+    debits = np.flatnonzero((store.column("flags") & FLAG_CREDIT) == 0)
+    merchants = store.column("merchants")[debits]
+    timestamps = store.column("timestamps")[debits]
+    amounts = store.column("amounts")[debits] / MINOR_UNITS
+
+    counts = np.bincount(merchants)
+    sums = np.bincount(merchants, weights=amounts)
+    squares = np.bincount(merchants, weights=amounts * amounts)
+    candidates = np.flatnonzero(counts >= RECURRING_MIN_CHARGES)
+    means = sums[candidates] / counts[candidates]
+    stds = np.sqrt(np.maximum(squares[candidates] / counts[candidates] - means * means, 0.0))
+    candidates = candidates[stds < RECURRING_AMOUNT_TOLERANCE * means]
+    if not len(candidates):
+        return []
+
+    # Charge times per candidate merchant, in time order
+    selected = np.isin(merchants, candidates)
+    order = np.lexsort((timestamps[selected], merchants[selected]))
+    charge_merchants = merchants[selected][order]
+    charge_times = timestamps[selected][order]
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(charge_merchants)) + 1])
+
+    recurring = []
+    for code, times in zip(charge_merchants[starts].tolist(), np.split(charge_times, starts[1:])):
+        gap_days = float(np.median(np.diff(times))) / 86400
+        cadence = next((name for name, low, high in RECURRING_CADENCES if low <= gap_days <= high), None)
+        if cadence is None:
+            continue
+        recurring.append({
+            "merchant_name": store.pools.merchants.decode(code),
+            "avg_amount": round(float(sums[code] / counts[code]), 2),
+            "transaction_count": len(times),
+            "cadence": cadence,
+            "last_charged": format_timestamp(times[-1]),
+            "next_expected": format_timestamp(times[-1] + int(gap_days * 86400)),
+            "is_likely_subscription": True
+        })
+    recurring.sort(key=lambda payment: payment["avg_amount"], reverse=True)
+    return recurring
+
 def detect_high_value_transactions(transactions, threshold=1000):
     """Detect high-value transactions based on a threshold"""
     return transactions.filter(
@@ -0,0 +1,527 @@
+import numpy as np
+import calendar
+import logging
+import sys
+from array import array
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Bit flags packed into a single byte per transaction
+FLAG_ANOMALY = 1
+FLAG_DUPLICATE = 2
+FLAG_CREDIT = 4
+
+# Amounts are stored as integer minor units (cents)
+MINOR_UNITS = 100
+
+# Rows per column copy when category_totals scans the history
+TOTALS_CHUNK_ROWS = 65_536
+
+
+def parse_timestamp(timestamp):
+    """Convert a '%Y-%m-%d %H:%M:%S' string (treated as UTC) to epoch seconds"""
+    if isinstance(timestamp, (int, np.integer)):
+        return int(timestamp)
+    return calendar.timegm(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timetuple())
+
+
+def format_timestamp(epoch):
+    """Convert epoch seconds back to the '%Y-%m-%d %H:%M:%S' string format"""
+    return datetime.fromtimestamp(int(epoch), timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def to_minor_units(amount):
+    """Convert a float amount to integer minor units"""
+    return int(round(float(amount) * MINOR_UNITS))
+
+
+class StringPool:
+    """Dictionary-encodes repeated strings (merchant, category, platform) as integer codes"""
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+
+    def encode(self, value):
+        """Return the code for a value, adding it to the pool if needed"""
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self._values)
+            value = sys.intern(value)
+            self._codes[value] = code
+            self._values.append(value)
+        return code
+
+    def lookup(self, value):
+        """Return the code for a value, or None if it has never been seen"""
+        return self._codes.get(value)
+
+    def decode(self, code):
+        return self._values[code]
+
+    def values(self, start=0):
+        """Pooled strings in code order, from code `start` onwards"""
+        return self._values[start:]
+
+    def extend(self, values):
+        """Re-add checkpointed strings so they get back their original codes"""
+        for value in values:
+            self.encode(value)
+
+    def nbytes(self):
+        """Approximate memory footprint: the code lookup, the value list and the strings"""
+        return (sys.getsizeof(self._codes) + sys.getsizeof(self._values)
+                + sum(sys.getsizeof(value) for value in self._values))
+
+    def __len__(self):
+        return len(self._values)
+
+
+class StringPools:
+    """The set of string pools shared by all per-user stores.
+
+    Only low-cardinality columns are pooled process-wide; free-text
+    descriptions live in each user's own pool so they go with the user.
+    """
+
+    NAMES = ("merchants", "categories", "platforms")
+
+    def __init__(self):
+        self.merchants = StringPool()
+        self.categories = StringPool()
+        self.platforms = StringPool()
+
+    def sizes(self):
+        return {name: len(getattr(self, name)) for name in self.NAMES}
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes() for name in self.NAMES)
+
+
+class TransactionRecord:
+    """Lightweight row view over a UserTransactionStore.
+
+    Behaves like the read-only transaction dicts used elsewhere (supports
+    `record["amount"]` and `record.get("amount")`) without materializing one.
+    """
+
+    __slots__ = ("_store", "_row")
+
+    FIELDS = (
+        "transaction_id", "amount", "merchant_name", "category", "timestamp",
+        "source_platform", "description", "transaction_type", "is_anomaly",
+        "is_duplicate"
+    )
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    @property
+    def row(self):
+        return self._row
+
+    @property
+    def transaction_id(self):
+        return self._store.transaction_ids[self._row]
+
+    @property
+    def amount(self):
+        return self._store.amounts[self._row] / MINOR_UNITS
+
+    @property
+    def amount_minor(self):
+        return self._store.amounts[self._row]
+
+    @property
+    def merchant_name(self):
+        return self._store.pools.merchants.decode(self._store.merchants[self._row])
+
+    @property
+    def category(self):
+        return self._store.pools.categories.decode(self._store.categories[self._row])
+
+    @property
+    def source_platform(self):
+        return self._store.pools.platforms.decode(self._store.platforms[self._row])
+
+    @property
+    def description(self):
+        return self._store.description_pool.decode(self._store.descriptions[self._row])
+
+    @property
+    def epoch(self):
+        return self._store.timestamps[self._row]
+
+    @property
+    def timestamp(self):
+        return format_timestamp(self._store.timestamps[self._row])
+
+    @property
+    def transaction_type(self):
+        return "credit" if self._store.flags[self._row] & FLAG_CREDIT else "debit"
+
+    @property
+    def is_anomaly(self):
+        return bool(self._store.flags[self._row] & FLAG_ANOMALY)
+
+    @property
+    def is_duplicate(self):
+        return bool(self._store.flags[self._row] & FLAG_DUPLICATE)
+
+    @property
+    def enrichment(self):
+        """The merchant's enrichment record, if one arrived with its transactions"""
+        return self._store.enrichments.get(self._store.merchants[self._row])
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def to_dict(self):
+        """Materialize the row as a plain transaction dict"""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"TransactionRecord({self.transaction_id!r}, {self.merchant_name!r}, {self.amount:.2f})"
+
+
+class UserTransactionStore:
+    """Columnar, append-only store of one user's transactions.
+
+    Each field is held in a compact `array` buffer: int64 epoch timestamps,
+    int64 minor-unit amounts, int32 dictionary codes for merchant, category,
+    platform and description, and one byte of packed flags per row.
+    Description codes index the store's own `description_pool`; the other
+    codes index the shared `pools`.
+    """
+
+    COLUMNS = ("timestamps", "amounts", "merchants", "categories", "platforms", "descriptions", "flags")
+
+    def __init__(self, user_id, pools=None):
+        self.user_id = user_id
+        self.pools = pools or StringPools()
+        self.transaction_ids = []
+        self.timestamps = array('q')
+        self.amounts = array('q')
+        self.merchants = array('i')
+        self.categories = array('i')
+        self.platforms = array('i')
+        self.descriptions = array('i')
+        self.flags = array('B')
+        self.description_pool = StringPool()
+        self._rows_by_id = {}
+        self._merchant_codes = set()
+        # Merchant code -> latest shared enrichment record (or None); snapshots
+        # carry it keyed by merchant name
+        self.enrichments = {}
+        # Bumped on every mutation so caches can key on (user_id, version)
+        self.version = 0
+
+    def __len__(self):
+        return len(self.transaction_ids)
+
+    def __iter__(self):
+        for row in range(len(self.transaction_ids)):
+            yield TransactionRecord(self, row)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return TransactionRecord(self, row)
+
+    def append(self, transaction):
+        """Append a transaction dict and return its row number"""
+        transaction_id = transaction["transaction_id"]
+        if transaction_id in self._rows_by_id:
+            return self._rows_by_id[transaction_id]
+
+        merchant_code = self.pools.merchants.encode(transaction.get("merchant_name", ""))
+        flags = 0
+        if transaction.get("is_anomaly", False):
+            flags |= FLAG_ANOMALY
+        if transaction.get("is_duplicate", False):
+            flags |= FLAG_DUPLICATE
+        if transaction.get("transaction_type", "debit") == "credit":
+            flags |= FLAG_CREDIT
+
+        row = len(self.transaction_ids)
+        self.transaction_ids.append(transaction_id)
+        self.timestamps.append(parse_timestamp(transaction["timestamp"]))
+        self.amounts.append(to_minor_units(transaction.get("amount", 0)))
+        self.merchants.append(merchant_code)
+        self.categories.append(self.pools.categories.encode(transaction.get("category", "uncategorized")))
+        self.platforms.append(self.pools.platforms.encode(transaction.get("source_platform", "")))
+        self.descriptions.append(self.description_pool.encode(transaction.get("description", "")))
+        self.flags.append(flags)
+
+        self._rows_by_id[transaction_id] = row
+        self._merchant_codes.add(merchant_code)
+        if "enrichment" in transaction:
+            self.enrichments[merchant_code] = transaction["enrichment"]
+        self.version += 1
+        return row
+
+    def extend(self, transactions):
+        """Append many transactions"""
+        for transaction in transactions:
+            self.append(transaction)
+
+    def append_columns(self, transaction_ids, timestamps, amounts, merchants, categories, platforms,
+                       descriptions, flags):
+        """Append a batch given as columns and return the new rows' (start, end).
+
+        `timestamps`, `amounts` (minor units) and `flags` are NumPy arrays;
+        the string columns are sequences of str. Ids already stored or
+        repeated within the batch are skipped. Each column grows with one
+        `frombytes` instead of a per-row append.
+        """
+        keep = np.ones(len(transaction_ids), dtype=bool)
+        seen = set()
+        for index, transaction_id in enumerate(transaction_ids):
+            if transaction_id in self._rows_by_id or transaction_id in seen:
+                keep[index] = False
+            seen.add(transaction_id)
+        rows = np.flatnonzero(keep).tolist()
+        start = len(self.transaction_ids)
+        if not rows:
+            return start, start
+
+        pools = self.pools
+        merchant_codes = array('i', [pools.merchants.encode(merchants[i]) for i in rows])
+        self.transaction_ids.extend(transaction_ids[i] for i in rows)
+        self.timestamps.frombytes(np.asarray(timestamps, dtype=np.int64)[keep].tobytes())
+        self.amounts.frombytes(np.asarray(amounts, dtype=np.int64)[keep].tobytes())
+        self.merchants.extend(merchant_codes)
+        self.categories.extend(array('i', [pools.categories.encode(categories[i]) for i in rows]))
+        self.platforms.extend(array('i', [pools.platforms.encode(platforms[i]) for i in rows]))
+        self.descriptions.extend(array('i', [self.description_pool.encode(descriptions[i]) for i in rows]))
+        self.flags.frombytes(np.asarray(flags, dtype=np.uint8)[keep].tobytes())
+
+        end = len(self.transaction_ids)
+        self._rows_by_id.update(zip(self.transaction_ids[start:], range(start, end)))
+        self._merchant_codes.update(merchant_codes)
+        self.version += end - start
+        return start, end
+
+    def restore(self, transaction_ids, columns, version, descriptions=(), enrichments=None):
+        """Load checkpointed ids (a list the store takes over) and column bytes into this empty store.
+
+        Rows are not replayed: each column is filled with a single
+        `frombytes`, and only the id lookup and merchant set are rebuilt.
+        `descriptions` are the description pool's strings in code order and
+        `enrichments` maps merchant names to enrichment records.
+        """
+        if len(self):
+            raise ValueError(f"Cannot restore into non-empty store for {self.user_id}")
+        self.transaction_ids = transaction_ids
+        for name in self.COLUMNS:
+            getattr(self, name).frombytes(columns[name])
+        self.description_pool.extend(descriptions)
+        self._rows_by_id = dict(zip(self.transaction_ids, range(len(self.transaction_ids))))
+        self._merchant_codes = set(np.unique(self._view("merchants")).tolist())
+        self.enrichments = {self.pools.merchants.encode(name): record
+                            for name, record in (enrichments or {}).items()}
+        self.version = version
+
+    def enrichments_by_name(self):
+        """Enrichment records keyed by merchant name, for snapshots that outlive pool codes"""
+        return {self.pools.merchants.decode(code): record for code, record in self.enrichments.items()}
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self._rows_by_id
+
+    def get(self, transaction_id):
+        """Return the record for a transaction id, or None"""
+        row = self._rows_by_id.get(transaction_id)
+        return TransactionRecord(self, row) if row is not None else None
+
+    def has_merchant(self, merchant_name):
+        """O(1) check whether the user has ever transacted with a merchant"""
+        code = self.pools.merchants.lookup(merchant_name)
+        return code is not None and code in self._merchant_codes
+
+    def column(self, name, start=0, end=None):
+        """Return a NumPy copy of one of the numeric columns, optionally of rows [start, end).
+
+        The `array` slice is copied before NumPy wraps it, so no buffer of the
+        live column is exported: safe from worker threads (e.g. streaming
+        exports) while the event loop appends.
+        """
+        return np.frombuffer(getattr(self, name)[start:end], dtype=self._dtype(name))
+
+    def take(self, name, rows):
+        """NumPy copy of a numeric column at the given row numbers (event loop only)"""
+        return self._view(name)[rows]
+
+    def _view(self, name):
+        # Zero-copy view for scans on the event loop only; must not outlive
+        # the call, since an exported buffer prevents the array from growing
+        return np.frombuffer(getattr(self, name), dtype=self._dtype(name))
+
+    @staticmethod
+    def _dtype(name):
+        if name in ("timestamps", "amounts"):
+            return np.int64
+        if name == "flags":
+            return np.uint8
+        return np.int32
+
+    def merchant_amounts(self, merchant_name):
+        """Return all amounts (in major units) spent at a merchant"""
+        code = self.pools.merchants.lookup(merchant_name)
+        if code is None or not len(self):
+            return np.empty(0, dtype=np.float64)
+        mask = self._view("merchants") == code
+        return self._view("amounts")[mask] / MINOR_UNITS
+
+    def merchant_stats(self):
+        """Vectorized per-merchant avg/std/count over the whole history"""
+        if not len(self):
+            return {}
+        codes = self._view("merchants")
+        amounts = self._view("amounts") / MINOR_UNITS
+        counts = np.bincount(codes)
+        sums = np.bincount(codes, weights=amounts)
+        squares = np.bincount(codes, weights=amounts * amounts)
+
+        stats = {}
+        for code in np.nonzero(counts)[0]:
+            count = int(counts[code])
+            avg = sums[code] / count
+            variance = max(squares[code] / count - avg * avg, 0.0)
+            stats[self.pools.merchants.decode(code)] = {
+                "avg_amount": float(avg),
+                "std_amount": float(np.sqrt(variance)),
+                "count": count
+            }
+        return stats
+
+    def iter_chunks(self, chunk_size=5000, start=None, end=None, categories=None):
+        """Yield lists of matching records, scanning the columns one chunk at a time.
+
+        `start`/`end` bound the epoch timestamp as [start, end) and
+        `categories` restricts to a set of category names. Rows appended
+        while iterating are included if they fall in a later chunk.
+        """
+        category_codes = None
+        if categories:
+            category_codes = [
+                code for code in (self.pools.categories.lookup(c) for c in categories)
+                if code is not None
+            ]
+            if not category_codes:
+                return
+
+        offset = 0
+        while offset < len(self):
+            upper = min(offset + chunk_size, len(self))
+            rows = self._matching_rows(offset, upper, start, end, category_codes)
+            offset = upper
+            if rows:
+                yield [TransactionRecord(self, row) for row in rows]
+
+    def _matching_rows(self, lower, upper, start, end, category_codes):
+        # Exports iterate in a worker thread, so scan copied slices rather
+        # than views of the columns the event loop appends to
+        mask = np.ones(upper - lower, dtype=bool)
+        if start is not None or end is not None:
+            timestamps = self.column("timestamps", lower, upper)
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps < end
+        if category_codes is not None:
+            mask &= np.isin(self.column("categories", lower, upper), category_codes)
+        return (np.flatnonzero(mask) + lower).tolist()
+
+    def category_totals(self, start=None, end=None, debits_only=True, chunk_size=TOTALS_CHUNK_ROWS):
+        """Vectorized spend per category, optionally within [start, end) epoch seconds.
+
+        Scans column copies one chunk at a time, so the Parquet export can call
+        it from a worker thread without copying the whole history.
+        """
+        size = len(self)
+        totals = np.zeros(0)
+        for lower in range(0, size, chunk_size):
+            upper = min(lower + chunk_size, size)
+            mask = np.ones(upper - lower, dtype=bool)
+            if start is not None or end is not None:
+                timestamps = self.column("timestamps", lower, upper)
+                if start is not None:
+                    mask &= timestamps >= start
+                if end is not None:
+                    mask &= timestamps < end
+            if debits_only:
+                mask &= (self.column("flags", lower, upper) & FLAG_CREDIT) == 0
+            codes = self.column("categories", lower, upper)[mask]
+            if not len(codes):
+                continue
+            chunk = np.bincount(codes, weights=self.column("amounts", lower, upper)[mask])
+            if len(chunk) > len(totals):
+                totals = np.concatenate([totals, np.zeros(len(chunk) - len(totals))])
+            totals[:len(chunk)] += chunk
+        return {
+            self.pools.categories.decode(code): totals[code] / MINOR_UNITS
+            for code in np.nonzero(totals)[0]
+        }
+
+    def nbytes(self):
+        """Approximate memory footprint: columns, transaction ids, the id -> row index and descriptions.
+
+        Strings in the shared `pools` are not included; see `TransactionStore.nbytes`.
+        """
+        total = sum(
+            column.buffer_info()[1] * column.itemsize
+            for column in (self.timestamps, self.amounts, self.merchants, self.categories,
+                           self.platforms, self.descriptions, self.flags)
+        )
+        total += sys.getsizeof(self.transaction_ids) + sum(sys.getsizeof(tid) for tid in self.transaction_ids)
+        # The index dominates per-row memory: hash table plus one int per row
+        total += sys.getsizeof(self._rows_by_id) + sum(sys.getsizeof(row) for row in self._rows_by_id.values())
+        total += sys.getsizeof(self._merchant_codes) + sys.getsizeof(self.enrichments)
+        return total + self.description_pool.nbytes()
+
+
+class TransactionStore:
+    """Registry of per-user columnar stores sharing one set of string pools"""
+
+    def __init__(self):
+        self.pools = StringPools()
+        self._users = {}
+
+    def user(self, user_id):
+        """Return the store for a user, creating it on first access"""
+        store = self._users.get(user_id)
+        if store is None:
+            store = UserTransactionStore(user_id, self.pools)
+            self._users[user_id] = store
+        return store
+
+    def users(self):
+        return list(self._users)
+
+    def discard(self, user_id):
+        """Forget a user's store and its descriptions; shared pooled strings stay"""
+        self._users.pop(user_id, None)
+
+    def nbytes(self):
+        """Approximate memory footprint of every user's store plus the shared string pools"""
+        return self.pools.nbytes() + sum(store.nbytes() for store in self._users.values())
+
+    def __contains__(self, user_id):
+        return user_id in self._users
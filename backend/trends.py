@@ -0,0 +1,343 @@
+import logging
+import math
+from array import array
+from collections import deque
+
+import numpy as np
+
+from metrics import increment
+from transaction_store import FLAG_CREDIT, MINOR_UNITS, format_timestamp, parse_timestamp, to_minor_units
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# Daily buckets kept per (user, category); must cover the 30-day window and
+# the 30 days before it
+RING_DAYS = 64
+
+# EWMA of daily spend with a ~7-day span, reported as the current daily level
+EWMA_ALPHA = 2 / (7 + 1)
+
+# Change points are detected on weekly totals, which are far less spiky than
+# daily ones: a tabular CUSUM on the standardized log weekly spend against an
+# EWMA/EW-variance baseline (~half-year span, so a shift is not absorbed into
+# the baseline before the CUSUM can accumulate it). Standardized values are
+# clipped so a single outlier week cannot raise an alarm on its own.
+WEEK_ALPHA = 2 / (26 + 1)
+CUSUM_K = 0.5
+CUSUM_H = 6.0
+CUSUM_CLIP = 3.0
+CUSUM_WARMUP_WEEKS = 6
+
+# Floor for the standard deviation of log weekly spend, so a very regular
+# category does not turn small wobbles into change points
+MIN_LOG_SIGMA = 0.25
+
+# Insights only compare categories with at least this much prior spend
+MIN_BASELINE_MINOR = 20 * MINOR_UNITS
+MIN_CHANGE_RATIO = 0.10
+
+MAX_CHANGE_POINTS = 10
+
+
+class CategoryTrend:
+    """Streaming daily spend statistics for one (user, category).
+
+    Daily totals live in a ring buffer of RING_DAYS buckets. The rolling
+    7-day, 30-day and previous-30-day sums are adjusted as days enter and
+    leave the windows, each closed day updates an EWMA of the daily
+    level, and each closed week updates an EWMA/EW-variance baseline and a
+    two-sided CUSUM. Every update is O(1); a gap of many days
+    costs at most RING_DAYS steps. Transactions for days that are already
+    closed update the buckets and sums but not the EWMA/CUSUM.
+    """
+
+    __slots__ = ("buckets", "day", "sum7", "sum30", "sum_prev30", "ewma", "days_seen",
+                 "week_mean", "week_var", "weeks_seen", "cusum_up", "cusum_down", "change_points")
+
+    def __init__(self, day):
+        self.buckets = array('q', bytes(8 * RING_DAYS))
+        self.day = day
+        self.sum7 = 0
+        self.sum30 = 0
+        self.sum_prev30 = 0
+        self.ewma = 0.0
+        self.days_seen = 0
+        self.week_mean = 0.0
+        self.week_var = 0.0
+        self.weeks_seen = 0
+        self.cusum_up = 0.0
+        self.cusum_down = 0.0
+        self.change_points = deque(maxlen=MAX_CHANGE_POINTS)
+
+    def add(self, day, amount_minor):
+        if day > self.day:
+            self.advance(day)
+        age = self.day - day
+        if age >= 60:
+            return
+        self.buckets[day % RING_DAYS] += amount_minor
+        if age < 7:
+            self.sum7 += amount_minor
+        if age < 30:
+            self.sum30 += amount_minor
+        else:
+            self.sum_prev30 += amount_minor
+
+    def advance(self, day):
+        """Close every day before `day` and slide the windows forward"""
+        steps = min(day - self.day, RING_DAYS)
+        buckets = self.buckets
+        for _ in range(steps):
+            self._close_day(self.day, buckets[self.day % RING_DAYS])
+            self.sum7 -= buckets[(self.day - 6) % RING_DAYS]
+            leaving30 = buckets[(self.day - 29) % RING_DAYS]
+            self.sum30 -= leaving30
+            self.sum_prev30 += leaving30 - buckets[(self.day - 59) % RING_DAYS]
+            self.day += 1
+            buckets[self.day % RING_DAYS] = 0
+        if self.day < day:
+            # Longer gaps: every window is already empty; decay the baseline
+            # for the remaining zero days in closed form
+            skipped = day - self.day
+            self.ewma *= (1 - EWMA_ALPHA) ** skipped
+            self.cusum_up = self.cusum_down = 0.0
+            self.day = day
+
+    def _close_day(self, day, value):
+        self.days_seen += 1
+        self.ewma = float(value) if self.days_seen == 1 else self.ewma + EWMA_ALPHA * (value - self.ewma)
+        if day % 7 == 6:
+            # sum7 still covers the week ending on `day`
+            self._close_week(day, self.sum7)
+
+    def _close_week(self, day, total):
+        # Weekly spend is modelled on a log scale, where an increase and a
+        # decrease by the same factor are equally detectable
+        x = math.log1p(total / MINOR_UNITS)
+        self.weeks_seen += 1
+        if self.weeks_seen == 1:
+            self.week_mean = x
+            return
+        if self.weeks_seen > CUSUM_WARMUP_WEEKS:
+            sigma = max(math.sqrt(self.week_var), MIN_LOG_SIGMA)
+            z = max(-CUSUM_CLIP, min(CUSUM_CLIP, (x - self.week_mean) / sigma))
+            self.cusum_up = max(0.0, self.cusum_up + z - CUSUM_K)
+            self.cusum_down = max(0.0, self.cusum_down - z - CUSUM_K)
+            if self.cusum_up > CUSUM_H or self.cusum_down > CUSUM_H:
+                direction = "up" if self.cusum_up > CUSUM_H else "down"
+                baseline = math.expm1(self.week_mean) * MINOR_UNITS / 7
+                self.change_points.append((day, direction, baseline, self.sum7 / 7))
+                self.cusum_up = self.cusum_down = 0.0
+                # Re-anchor the baseline on the new level and let it settle
+                # through another warm-up before testing again
+                self.week_mean = x
+                self.weeks_seen = 1
+                increment("trends.change_point")
+                return
+        diff = x - self.week_mean
+        # Outlier weeks are clipped here too so they do not inflate the variance
+        if self.weeks_seen > 2:
+            bound = CUSUM_CLIP * max(math.sqrt(self.week_var), MIN_LOG_SIGMA)
+            diff = max(-bound, min(bound, diff))
+        step = WEEK_ALPHA * diff
+        self.week_mean += step
+        self.week_var = (1 - WEEK_ALPHA) * (self.week_var + diff * step)
+
+    def to_state(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["buckets"] = self.buckets.tolist()
+        state["change_points"] = list(self.change_points)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        trend = cls(state["day"])
+        for name in cls.__slots__:
+            if name not in ("buckets", "change_points"):
+                setattr(trend, name, state[name])
+        trend.buckets = array('q', state["buckets"])
+        trend.change_points.extend(tuple(point) for point in state["change_points"])
+        return trend
+
+    def copy(self):
+        trend = CategoryTrend.__new__(CategoryTrend)
+        for name in self.__slots__:
+            setattr(trend, name, getattr(self, name))
+        trend.buckets = array('q', self.buckets)
+        trend.change_points = deque(self.change_points, maxlen=MAX_CHANGE_POINTS)
+        return trend
+
+    def change_ratio(self):
+        """Last 30 days vs the 30 days before, or None without a baseline"""
+        if self.sum_prev30 < MIN_BASELINE_MINOR:
+            return None
+        return self.sum30 / self.sum_prev30 - 1
+
+    def as_dict(self):
+        ratio = self.change_ratio()
+        return {
+            "last_7_days": self.sum7 / MINOR_UNITS,
+            "last_30_days": self.sum30 / MINOR_UNITS,
+            "previous_30_days": self.sum_prev30 / MINOR_UNITS,
+            "change_pct": round(ratio * 100, 1) if ratio is not None else None,
+            "daily_ewma": round(self.ewma / MINOR_UNITS, 2),
+            "change_points": [
+                {
+                    "date": format_timestamp(day * SECONDS_PER_DAY)[:10],
+                    "direction": direction,
+                    "baseline_daily": round(baseline / MINOR_UNITS, 2),
+                    "recent_daily": round(recent / MINOR_UNITS, 2)
+                }
+                for day, direction, baseline, recent in self.change_points
+            ]
+        }
+
+
+class UserTrends:
+    """Per-category spending trends for one user, advanced by the latest transaction day.
+
+    Windows are relative to the newest day seen in the stream (the
+    watermark) rather than the wall clock, so replayed history yields the
+    same trends as live data.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.categories = {}
+        self.day = None
+        self.version = 0
+
+    def apply(self, transaction):
+        """Fold one debit (dict or TransactionRecord) into its category trend"""
+        if transaction.get("transaction_type", "debit") == "credit":
+            return
+        if hasattr(transaction, "epoch"):
+            epoch = transaction.epoch
+        else:
+            epoch = parse_timestamp(transaction.get("timestamp"))
+        day = epoch // SECONDS_PER_DAY
+        category = transaction.get("category", "uncategorized")
+
+        if self.day is None or day > self.day:
+            self.day = day
+        trend = self.categories.get(category)
+        if trend is None:
+            trend = self.categories[category] = CategoryTrend(day)
+        trend.add(day, to_minor_units(transaction.get("amount", 0)))
+        self.version += 1
+
+    def rebuild(self, store):
+        """Recompute every category trend from a UserTransactionStore in time order.
+
+        Debits are summed per (category, day) with NumPy and each daily total
+        is folded once, so bulk-loaded history (even a newest-first
+        statement) gives the same trends as a chronological stream.
+        """
+        self.categories = {}
+        self.day = None
+        debits = (store.column("flags") & FLAG_CREDIT) == 0
+        days = store.column("timestamps")[debits] // SECONDS_PER_DAY
+        if not len(days):
+            return
+        first_day = int(days.min())
+        span = int(days.max()) - first_day + 1
+        keys = store.column("categories")[debits].astype(np.int64) * span + (days - first_day)
+        groups, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse.reshape(-1), weights=store.column("amounts")[debits])
+
+        decode = store.pools.categories.decode
+        for group, total in zip(groups.tolist(), totals.tolist()):
+            code, offset = divmod(group, span)
+            day = first_day + offset
+            category = decode(code)
+            trend = self.categories.get(category)
+            if trend is None:
+                trend = self.categories[category] = CategoryTrend(day)
+            trend.add(day, int(total))
+        self.day = first_day + span - 1
+        self.version += len(days)
+
+    def to_state(self):
+        """Plain-data snapshot of every category trend for checkpointing"""
+        return {
+            "day": self.day,
+            "version": self.version,
+            "categories": {category: trend.to_state() for category, trend in self.categories.items()}
+        }
+
+    def restore_state(self, state):
+        self.day = state["day"]
+        self.version = state["version"]
+        self.categories = {
+            category: CategoryTrend.from_state(data) for category, data in state["categories"].items()
+        }
+
+    def _advanced(self):
+        # Quiet categories are brought up to the watermark on copies, so windows
+        # line up without closing days a late transaction may still land in
+        advanced = {}
+        for category, trend in self.categories.items():
+            if trend.day < self.day:
+                trend = trend.copy()
+                trend.advance(self.day)
+            advanced[category] = trend
+        return advanced
+
+    def snapshot(self):
+        if self.day is None:
+            return {}
+        return {category: trend.as_dict() for category, trend in sorted(self._advanced().items())}
+
+    def insights(self, limit=5):
+        """Human-readable trend insights backed by the rolling windows"""
+        if self.day is None:
+            return ["Not enough history yet to spot spending trends"]
+        categories = self._advanced()
+        insights = []
+
+        # Detected shifts first: they are sustained, unlike a noisy 30-day ratio
+        recent = []
+        for category, trend in categories.items():
+            for day, direction, baseline, level in trend.change_points:
+                if self.day - day < 30:
+                    recent.append((day, category, direction, baseline, level))
+        for day, category, direction, baseline, level in sorted(recent, reverse=True):
+            insights.append(
+                f"Your {category} spending shifted {direction} around "
+                f"{format_timestamp(day * SECONDS_PER_DAY)[:10]}: about ${level / MINOR_UNITS:.2f}/day "
+                f"vs ${baseline / MINOR_UNITS:.2f}/day before"
+            )
+
+        changes = [
+            (ratio, category, trend) for category, trend in categories.items()
+            if (ratio := trend.change_ratio()) is not None and abs(ratio) >= MIN_CHANGE_RATIO
+        ]
+        changes.sort(key=lambda item: abs(item[0]), reverse=True)
+        for ratio, category, trend in changes:
+            insights.append(
+                f"Your {category} spending is {'up' if ratio > 0 else 'down'} {abs(ratio) * 100:.0f}% "
+                f"over the last 30 days (${trend.sum30 / MINOR_UNITS:.2f} vs ${trend.sum_prev30 / MINOR_UNITS:.2f})"
+            )
+
+        insights = insights[:limit - 1]
+        total30 = sum(trend.sum30 for trend in categories.values())
+        insights.append(f"Your average daily spending over the last 30 days is ${total30 / 30 / MINOR_UNITS:.2f}")
+        return insights
+
+
+class TrendStore:
+    """Registry of per-user trend engines"""
+
+    def __init__(self):
+        self._users = {}
+
+    def user(self, user_id):
+        trends = self._users.get(user_id)
+        if trends is None:
+            trends = self._users[user_id] = UserTrends(user_id)
+        return trends
+
+    def discard(self, user_id):
+        self._users.pop(user_id, None)
@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupTracker:
+    """Tracks progress of background warm-up stages for the readiness endpoint.
+
+    Only the `required` stages (all of them by default) hold back readiness;
+    the others are reported while they run.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, stages, required=None):
+        self._lock = threading.Lock()
+        self._stages = {
+            name: {"status": self.PENDING, "done": 0, "total": None, "error": None}
+            for name in stages
+        }
+        self.required = list(stages if required is None else required)
+        self.created_at = time.monotonic()
+        self.ready_at = None if self.required else self.created_at
+
+    def begin(self, stage, total=None):
+        with self._lock:
+            self._stages[stage].update(status=self.RUNNING, done=0, total=total)
+
+    def advance(self, stage, count=1):
+        with self._lock:
+            self._stages[stage]["done"] += count
+
+    def finish(self, stage):
+        with self._lock:
+            entry = self._stages[stage]
+            entry["status"] = self.DONE
+            if entry["total"] is not None:
+                entry["done"] = entry["total"]
+            if self.ready_at is None and all(self._stages[name]["status"] == self.DONE for name in self.required):
+                self.ready_at = time.monotonic()
+            if all(s["status"] == self.DONE for s in self._stages.values()):
+                logger.info("Warm-up finished in %.2fs", time.monotonic() - self.created_at)
+
+    def fail(self, stage, error):
+        with self._lock:
+            self._stages[stage].update(status=self.FAILED, error=str(error))
+        logger.error("Warm-up stage %s failed: %s", stage, error)
+
+    @property
+    def ready(self):
+        return self.ready_at is not None
+
+    def progress(self):
+        """Overall completion in [0, 1], weighting each stage equally"""
+        with self._lock:
+            fractions = []
+            for entry in self._stages.values():
+                if entry["status"] == self.DONE:
+                    fractions.append(1.0)
+                elif entry["total"]:
+                    fractions.append(min(entry["done"] / entry["total"], 1.0))
+                else:
+                    fractions.append(0.0)
+        return sum(fractions) / len(fractions) if fractions else 1.0
+
+    def snapshot(self):
+        progress = self.progress()
+        with self._lock:
+            stages = {name: dict(entry) for name, entry in self._stages.items()}
+        elapsed = (self.ready_at or time.monotonic()) - self.created_at
+        return {
+            "ready": self.ready,
+            "progress": round(progress, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "stages": stages
+        }